@@ -34,12 +34,14 @@ from .predict import defrate_per_cat
 
 # Project
 from .project import deforest_diffusion, deforest_diffusion_t_nofor
-from .project import deforest, emissions
-from .project import allocate_deforestation
+from .project import deforest, deforest_timeseries, emissions
+from .project import emissions_zonal, emissions_mc
+from .project import allocate_deforestation, allocate_deforestation_batch
 
 # Validate
 from .validate import computeAUC, accuracy_indices, cross_validation
-from .validate import map_validation
+from .validate import map_auc
+from .validate import map_validation, crosstab
 from .validate import map_confmat, map_accuracy
 from .validate import r_diffproj, mat_diffproj
 from .validate import resample_sum
@@ -51,6 +53,7 @@ from .plot import plot
 
 # Misc
 from .misc import countpix, invlogit, make_dir
+from .misc import reclassify
 
 # GDAL exceptions
 gdal.UseExceptions()
@@ -7,5 +7,6 @@ from .get_vector_extent import get_vector_extent, extent_shp
 from .create_symbolic_links import create_symbolic_links
 from .check_fcc import check_fcc
 from .check_aoi import check_aoi
+from .pipeline import run_tasks
 
 # EOF
@@ -4,9 +4,52 @@ import numpy as np
 from osgeo import gdal, osr
 
 from ..misc import makeblock, progress_bar
+from ..misc import map_blocks, BlockReader
 
 
-def check_fcc(fcc_file, proj, nbands_min=3, blk_rows=0, verbose=True):
+def block_values(data):
+    """Distinct values in a block of data.
+
+    :param data: Numpy array.
+
+    :return: Sorted array of distinct values.
+    """
+
+    if data.dtype == np.uint8:
+        counts = np.bincount(data.ravel(), minlength=256)
+        return np.nonzero(counts)[0]
+    return np.unique(data)
+
+
+def stats_values(band):
+    """Range of values of a band from cached statistics.
+
+    Statistics saved with the raster (``STATISTICS_MINIMUM`` and
+    ``STATISTICS_MAXIMUM`` metadata) are used if they are exact and
+    if the band has integer values and no nodata value (statistics
+    do not take into account nodata pixels).
+
+    :param band: GDAL raster band.
+
+    :return: A tuple (min, max) or ``None`` if statistics can't be
+        used.
+    """
+
+    if band.GetNoDataValue() is not None:
+        return None
+    dtype = gdal.GetDataTypeName(band.DataType)
+    if not dtype.startswith(("Byte", "Int", "UInt")):
+        return None
+    vmin = band.GetMetadataItem("STATISTICS_MINIMUM")
+    vmax = band.GetMetadataItem("STATISTICS_MAXIMUM")
+    approx = band.GetMetadataItem("STATISTICS_APPROXIMATE")
+    if vmin is None or vmax is None or approx == "YES":
+        return None
+    return (float(vmin), float(vmax))
+
+
+def check_fcc(fcc_file, proj, nbands_min=3, blk_rows=0, verbose=True,
+              n_jobs=1):
     """Check forest cover change file.
 
     The forest cover change file should have the following
@@ -26,6 +69,11 @@ def check_fcc(fcc_file, proj, nbands_min=3, blk_rows=0, verbose=True):
     We check here conditions 1, 3, and 4. Other conditions must be
     checked by the user.
 
+    Raster values are checked from cached statistics when they are
+    available for all bands. Otherwise, distinct values are computed
+    for each block of data (in parallel threads) and the check stops
+    at the first block with invalid values.
+
     :param fcc_file: Forest cover change file.
 
     :param proj: Project's projection.
@@ -36,6 +84,8 @@ def check_fcc(fcc_file, proj, nbands_min=3, blk_rows=0, verbose=True):
 
     :param verbose: Toogle progress bar.
 
+    :param n_jobs: Number of blocks read in parallel threads.
+
     """
 
     # ===========================
@@ -69,6 +119,21 @@ def check_fcc(fcc_file, proj, nbands_min=3, blk_rows=0, verbose=True):
 
     # ===========================
     # Check that raster values are in {0, 1}
+    err_msg = ("Forest cover change raster must "
+               "have only two values: 1 for forest "
+               "pixels and 0 for non-forest pixels.")
+
+    # Cached statistics
+    stats = [stats_values(fcc.GetRasterBand(i + 1)) for i in range(nbands)]
+    if all(st is not None for st in stats):
+        vmin = min(st[0] for st in stats)
+        vmax = max(st[1] for st in stats)
+        if vmin < 0 or vmax > 1:
+            raise ValueError(err_msg + " Invalid values found "
+                             f"(min={vmin:g}, max={vmax:g}).")
+        fcc = None
+        return
+
     # Make blocks
     blockinfo = makeblock(fcc_file, blk_rows=blk_rows)
     nblock = blockinfo[0]
@@ -81,34 +146,34 @@ def check_fcc(fcc_file, proj, nbands_min=3, blk_rows=0, verbose=True):
         text = "Divide region in {} blocks"
         print(text.format(nblock))
 
-    # min and max values
-    min_blocks = np.zeros(nblock)
-    max_blocks = np.zeros(nblock)
+    # Readers
+    readers = [BlockReader(fcc_file, band=i + 1) for i in range(nbands)]
 
-    # Loop on blocks of data
-    for b in range(nblock):
+    def invalid_values(b):
+        """Invalid values for one block."""
+        px = b % nblock_x
+        py = b // nblock_x
+        values = np.unique(np.concatenate([
+            block_values(r.read(x[px], y[py], nx[px], ny[py]))
+            for r in readers]))
+        return values[(values != 0) & (values != 1)]
+
+    # Loop on blocks of data, stop at the first invalid block
+    invalid = None
+    results = map_blocks(invalid_values, nblock, n_jobs)
+    for (b, values) in enumerate(results):
         # Progress bar
         if verbose:
             progress_bar(nblock, b + 1)
-        # Position in 1D-arrays
-        px = b % nblock_x
-        py = b // nblock_x
-        # Read the data
-        forest = fcc.ReadAsArray(x[px], y[py], nx[px], ny[py])
-        # Min/max block values
-        min_blocks[b] = np.min(forest)
-        max_blocks[b] = np.max(forest)
-
-    # Min/max raster values
-    min_fcc = np.min(min_blocks)
-    max_fcc = np.max(max_blocks)
+        if values.size > 0:
+            invalid = values
+            break
+    results.close()
 
     # Evaluation
-    if (min_fcc not in [0, 1] or max_fcc not in [0, 1]):
-        err_msg = ("Forest cover change raster must "
-                   "have only two values: 1 for forest "
-                   "pixels and 0 for non-forest pixels.")
-        raise ValueError(err_msg)
+    if invalid is not None:
+        raise ValueError(err_msg + " Invalid values found: "
+                         + ", ".join(f"{v:g}" for v in invalid) + ".")
 
     # Close
     fcc = None
@@ -2,7 +2,7 @@
 
 from .compute_biomass_avitabile import compute_biomass_avitabile
 from .compute_biomass_whrc import compute_biomass_whrc
-from .compute_distance import compute_distance
+from .compute_distance import compute_distance, compute_distances
 from .compute_gadm import compute_gadm
 from .compute_osm import compute_osm
 from .compute_srtm import compute_srtm
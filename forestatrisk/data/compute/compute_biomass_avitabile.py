@@ -10,10 +10,12 @@
 # license         :GPLv3
 # =====================================================================
 
+import os
+
 from osgeo import gdal
 
 
-def compute_biomass_avitabile(proj, extent, verbose=False):
+def compute_biomass_avitabile(proj, extent, verbose=False, work_dir="."):
     """Compute aboveground biomass.
 
     Using Avitabile et al. 2016 data.
@@ -26,6 +28,9 @@ def compute_biomass_avitabile(proj, extent, verbose=False):
     :param verbose: Logical. Whether to print messages or not. Default
         to ``False``.
 
+    :param work_dir: Working directory with input files where output
+        files are written. Default to the current directory.
+
     """
 
     # Callback
@@ -53,7 +58,7 @@ def compute_biomass_avitabile(proj, extent, verbose=False):
         creationOptions=copts,
         callback=cback,
     )
-    gdal.Warp("AGB.tif", ifile, options=param)
+    gdal.Warp(os.path.join(work_dir, "AGB.tif"), ifile, options=param)
     # Reset GDAL configuration option
     gdal.SetConfigOption("GDAL_HTTP_UNSAFESSL", "NO")
 
@@ -1,11 +1,413 @@
 """Compute distance to pixel."""
 
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
 from osgeo import gdal
 
+from ...misc import progress_bar
+
+
+def parse_values(values):
+    """Parse target values given as a number, a list, or a string.
+
+    :param values: Target values. Either a number, a list of numbers,
+        or a string with values separated with a comma (eg. '0,1').
+
+    :return: List of float values.
+    """
+
+    if isinstance(values, str):
+        return [float(v) for v in values.split(",")]
+    if np.ndim(values) == 0:
+        return [float(values)]
+    return [float(v) for v in values]
+
+
+def column_bounds(target, y0):
+    """First and last target rows of each column of a tile.
+
+    :param target: Logical array of target pixels for the tile.
+
+    :param y0: Row offset of the tile in the raster.
+
+    :return: A tuple (first, last) of arrays with the first and last
+        rows (in the raster) of target pixels for each column of the
+        tile (``inf`` and ``-inf`` if no target).
+    """
+
+    ny = target.shape[0]
+    has_target = target.any(axis=0)
+    first = np.where(has_target, y0 + np.argmax(target, axis=0), np.inf)
+    last = np.where(has_target,
+                    y0 + ny - 1 - np.argmax(target[::-1], axis=0),
+                    -np.inf)
+    return (first, last)
+
+
+def vertical_distance(target, y0, above, below):
+    """Distance (in rows) to the nearest target in the same column.
+
+    :param target: Logical array of target pixels for the tile.
+
+    :param y0: Row offset of the tile in the raster.
+
+    :param above: Last target row above the tile for each column
+        (``-inf`` if no target).
+
+    :param below: First target row below the tile for each column
+        (``inf`` if no target).
+
+    :return: Array of distances in number of rows (``inf`` if no
+        target in the column).
+    """
+
+    ny = target.shape[0]
+    rows = (y0 + np.arange(ny, dtype=np.float64))[:, None]
+    last = np.where(target, rows, -np.inf)
+    last = np.maximum.accumulate(np.vstack((above[None, :], last)),
+                                 axis=0)[1:]
+    nxt = np.where(target, rows, np.inf)
+    nxt = np.minimum.accumulate(np.vstack((nxt, below[None, :]))[::-1],
+                                axis=0)[::-1][:-1]
+    return np.minimum(rows - last, nxt - rows)
+
+
+def envelope_distance(f, xres):
+    """Squared distance along rows from squared column distances.
+
+    For each row, computes ``min_j ((i - j) * xres)**2 + f[j]`` for
+    all columns ``i``, ie. the lower envelope of parabolas rooted at
+    each column. The leftmost minimizing column is non-decreasing in
+    ``i``, so that the minimum is found by divide and conquer with
+    ``log2(ncol)`` vectorized steps for all the rows at once.
+
+    :param f: Array of shape (nrow, ncol) with squared distances to
+        the nearest target in each column (``inf`` if no target).
+
+    :param xres: Pixel size along rows.
+
+    :return: Array of squared distances (``inf`` if no target in the
+        row).
+    """
+
+    nrow, ncol = f.shape
+    d2 = np.full(f.shape, np.inf)
+    f = f.ravel()
+    # Segments (row, xlo, xhi, olo, ohi): columns [xlo, xhi] of a row
+    # have their minimizing column in [olo, ohi]
+    r = np.nonzero(np.isfinite(f.reshape(nrow, ncol)).any(axis=1))[0]
+    xlo = np.zeros(r.size, dtype=np.int64)
+    xhi = np.full(r.size, ncol - 1, dtype=np.int64)
+    olo = xlo.copy()
+    ohi = xhi.copy()
+    while r.size:
+        mid = (xlo + xhi) // 2
+        length = ohi - olo + 1
+        start = np.cumsum(length) - length
+        seg = np.repeat(np.arange(r.size), length)
+        cand = olo[seg] + np.arange(length.sum()) - start[seg]
+        cost = ((mid[seg] - cand) * xres) ** 2 + f[r[seg] * ncol + cand]
+        cmin = np.minimum.reduceat(cost, start)
+        opt = np.minimum.reduceat(
+            np.where(cost == cmin[seg], cand, ncol), start)
+        d2[r, mid] = cmin
+        # Left and right halves
+        left = xlo < mid
+        right = mid < xhi
+        r = np.concatenate((r[left], r[right]))
+        xlo, xhi, olo, ohi = (
+            np.concatenate((xlo[left], mid[right] + 1)),
+            np.concatenate((mid[left] - 1, xhi[right])),
+            np.concatenate((olo[left], opt[right])),
+            np.concatenate((opt[left], ohi[right])))
+    return d2
+
+
+def exchange_bounds(wins, bounds, nrow):
+    """Exchange target rows between tiles of the same column of tiles.
+
+    :param wins: List of tile windows (x, y, nx, ny) ordered by row
+        within columns of tiles.
+
+    :param bounds: List of tuples (first, last) for each tile (see
+        ``column_bounds()``).
+
+    :param nrow: Number of rows of the raster.
+
+    :return: A tuple (above, below) of lists with the last target row
+        above each tile and the first target row below each tile, for
+        each column of the tile.
+    """
+
+    ntile = len(wins)
+    above = [None] * ntile
+    below = [None] * ntile
+    for i in range(ntile):
+        (_, y, nx, _) = wins[i]
+        above[i] = (np.full(nx, -np.inf) if y == 0
+                    else np.maximum(above[i - 1], bounds[i - 1][1]))
+    for i in reversed(range(ntile)):
+        (_, y, nx, ny) = wins[i]
+        below[i] = (np.full(nx, np.inf) if y + ny == nrow
+                    else np.minimum(below[i + 1], bounds[i + 1][0]))
+    return (above, below)
+
+
+def edt_bounds(input_file, values, win):
+    """First and last target rows of each column of a tile.
+
+    :param input_file: Input raster file.
+
+    :param values: List of target values.
+
+    :param win: Tile window (x, y, nx, ny) in pixels.
+
+    :return: A tuple (first, last) (see ``column_bounds()``).
+    """
+
+    with gdal.Open(input_file) as ds:
+        data = ds.GetRasterBand(1).ReadAsArray(*win)
+    return column_bounds(np.isin(data, values), win[1])
+
+
+def edt_vertical(input_file, values, win, above, below):
+    """Vertical distance to the nearest target for a tile.
+
+    :param input_file: Input raster file.
+
+    :param values: List of target values.
+
+    :param win: Tile window (x, y, nx, ny) in pixels.
+
+    :param above: Last target row above the tile for each column.
+
+    :param below: First target row below the tile for each column.
+
+    :return: Array of distances in number of rows (``float32``).
+    """
+
+    with gdal.Open(input_file) as ds:
+        data = ds.GetRasterBand(1).ReadAsArray(*win)
+    target = np.isin(data, values)
+    return vertical_distance(target, win[1], above,
+                             below).astype(np.float32)
+
+
+def edt_horizontal(vdist_file, y, ny, xres, yres):
+    """Euclidean distance for a full-width strip of rows.
+
+    :param vdist_file: Raster of vertical distances (in rows).
+
+    :param y: First row of the strip.
+
+    :param ny: Number of rows of the strip.
+
+    :param xres: Pixel size along rows.
+
+    :param yres: Pixel size along columns.
+
+    :return: Array of distances in georeferenced units (``inf`` if
+        no target in the raster).
+    """
+
+    with gdal.Open(vdist_file) as ds:
+        g = ds.GetRasterBand(1).ReadAsArray(0, y, ds.RasterXSize, ny)
+    f = (g.astype(np.float64) * yres) ** 2
+    return np.sqrt(envelope_distance(f, xres))
+
+
+def map_process(pool, fun, args_list, n_jobs=1):
+    """Apply a function to a list of arguments in parallel processes.
+
+    Results are yielded in order. At most ``2 * n_jobs`` calls are
+    submitted ahead of the result being yielded, which bounds memory
+    use.
+
+    :param pool: Process pool, or ``None`` to call the function in
+        the current process.
+
+    :param fun: Function to call.
+
+    :param args_list: List of tuples of arguments.
+
+    :param n_jobs: Number of processes of the pool.
+
+    :return: Generator of results.
+    """
+
+    if pool is None:
+        for args in args_list:
+            yield fun(*args)
+        return
+    futures = deque()
+    for args in args_list:
+        futures.append(pool.submit(fun, *args))
+        if len(futures) >= 2 * n_jobs:
+            yield futures.popleft().result()
+    while futures:
+        yield futures.popleft().result()
+
+
+def edt_distance(tasks, tile_size=1024, n_jobs=1, verbose=True):
+    """Compute distance rasters with a tiled Euclidean distance
+    transform.
+
+    The exact Euclidean distance transform is computed with two
+    separable passes (Meijster et al. 2000), with a memory use
+    bounded by the tile size whatever the distance to targets:
+
+    - The distance (in rows) to the nearest target in the same
+      column is computed on square tiles of ``tile_size`` pixels. The
+      first and last target rows of each column are computed for
+      each tile, and exchanged between tiles of the same column of
+      tiles (``column_bounds()`` and ``vertical_distance()``).
+      Vertical distances are written to a temporary raster.
+    - The Euclidean distance is computed on full-width strips of
+      about ``tile_size * tile_size`` pixels from the lower envelope
+      of parabolas along rows (``envelope_distance()``).
+
+    Tiles and strips of all rasters are computed in ``n_jobs``
+    parallel processes and written in the calling process. Pixels
+    without any target in the raster are set to nodata.
+
+    :param tasks: List of dictionaries with keys ``input_file``,
+        ``dist_file``, ``values``, ``nodata``, and ``input_nodata``
+        (see ``compute_distance()``).
+
+    :param tile_size: Tile size in pixels.
+
+    :param n_jobs: Number of processes.
+
+    :param verbose: Logical. Whether to print messages or not. Default
+        to ``True``.
+    """
+
+    # Create output and temporary rasters, list tiles and strips
+    drv = gdal.GetDriverByName("GTiff")
+    copts = ["COMPRESS=DEFLATE", "PREDICTOR=2", "BIGTIFF=YES"]
+    dst = []
+    tiles = []
+    strips = []
+    for (t, task) in enumerate(tasks):
+        src_ds = gdal.Open(task["input_file"])
+        ncol = src_ds.RasterXSize
+        nrow = src_ds.RasterYSize
+        gt = src_ds.GetGeoTransform()
+        dst_ds = drv.Create(task["dist_file"], ncol, nrow, 1,
+                            gdal.GDT_UInt32, copts)
+        dst_ds.SetGeoTransform(gt)
+        dst_ds.SetProjection(src_ds.GetProjectionRef())
+        dstband = dst_ds.GetRasterBand(1)
+        dstband.SetNoDataValue(task["nodata"])
+        src_nodata = src_ds.GetRasterBand(1).GetNoDataValue()
+        if not task["input_nodata"]:
+            src_nodata = None
+        vdist_file = task["dist_file"] + ".vdist.tif"
+        # Blocks of 16 rows to read strips without overlap
+        vdist_ds = drv.Create(vdist_file, ncol, nrow, 1, gdal.GDT_Float32,
+                              ["COMPRESS=DEFLATE", "TILED=YES",
+                               "BLOCKXSIZE=256", "BLOCKYSIZE=16",
+                               "BIGTIFF=YES"])
+        dst.append({"dst_ds": dst_ds, "dstband": dstband,
+                    "src_ds": src_ds, "src_nodata": src_nodata,
+                    "vdist_file": vdist_file, "vdist_ds": vdist_ds,
+                    "values": parse_values(task["values"]),
+                    "res": (abs(gt[1]), abs(gt[5]))})
+        for x in range(0, ncol, tile_size):
+            for y in range(0, nrow, tile_size):
+                tiles.append((t, (x, y, min(tile_size, ncol - x),
+                                  min(tile_size, nrow - y))))
+        strip_rows = max(16, (tile_size * tile_size) // ncol // 16 * 16)
+        for y in range(0, nrow, strip_rows):
+            strips.append((t, y, min(strip_rows, nrow - y)))
+
+    # Progress
+    nstep = 2 * len(tiles) + len(strips)
+    step = 0
+
+    n_jobs = 1 if n_jobs is None else max(1, n_jobs)
+    pool = ProcessPoolExecutor(max_workers=n_jobs) if n_jobs > 1 else None
+    try:
+        # First and last target rows in each column of each tile
+        args = [(tasks[t]["input_file"], dst[t]["values"], win)
+                for (t, win) in tiles]
+        bounds = []
+        for res in map_process(pool, edt_bounds, args, n_jobs):
+            bounds.append(res)
+            step += 1
+            if verbose:
+                progress_bar(nstep, step)
+
+        # Last target row above and first target row below each tile
+        above = []
+        below = []
+        for t in range(len(tasks)):
+            idx = [i for (i, tile) in enumerate(tiles) if tile[0] == t]
+            (a, b) = exchange_bounds([tiles[i][1] for i in idx],
+                                     [bounds[i] for i in idx],
+                                     dst[t]["dst_ds"].RasterYSize)
+            above.extend(a)
+            below.extend(b)
+        del bounds
+
+        # Vertical distances
+        args = [(tasks[t]["input_file"], dst[t]["values"], win,
+                 above[i], below[i])
+                for (i, (t, win)) in enumerate(tiles)]
+        for ((t, win), g) in zip(tiles,
+                                 map_process(pool, edt_vertical, args,
+                                             n_jobs)):
+            dst[t]["vdist_ds"].GetRasterBand(1).WriteArray(g, win[0],
+                                                           win[1])
+            step += 1
+            if verbose:
+                progress_bar(nstep, step)
+        del above, below
+        for d in dst:
+            d["vdist_ds"].FlushCache()
+            d["vdist_ds"] = None
+
+        # Euclidean distances by strips
+        args = [(dst[t]["vdist_file"], y, ny) + dst[t]["res"]
+                for (t, y, ny) in strips]
+        for ((t, y, ny), dist) in zip(strips,
+                                      map_process(pool, edt_horizontal,
+                                                  args, n_jobs)):
+            nodata = tasks[t]["nodata"]
+            out = np.full(dist.shape, nodata, dtype=np.uint32)
+            finite = np.isfinite(dist)
+            # Rounded half up as gdal.ComputeProximity()
+            out[finite] = np.floor(dist[finite] + 0.5)
+            src_nodata = dst[t]["src_nodata"]
+            if src_nodata is not None:
+                src_ds = dst[t]["src_ds"]
+                data = src_ds.GetRasterBand(1).ReadAsArray(
+                    0, y, src_ds.RasterXSize, ny)
+                out[data == src_nodata] = nodata
+            dst[t]["dstband"].WriteArray(out, 0, y)
+            step += 1
+            if verbose:
+                progress_bar(nstep, step)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    # Delete objects and temporary rasters
+    for d in dst:
+        d["dstband"].FlushCache()
+        d["dstband"] = None
+        d["dst_ds"] = None
+        d["vdist_ds"] = None
+        drv.Delete(d["vdist_file"])
+    dst = None
+
 
 def compute_distance(input_file, dist_file, values=0,
                      nodata=4294967295, input_nodata=False,
-                     verbose=True):
+                     verbose=True, engine="gdal", tile_size=1024,
+                     n_jobs=1):
     """Computing the shortest distance to pixels with given values in
     a raster file.
 
@@ -31,12 +433,36 @@ def compute_distance(input_file, dist_file, values=0,
     :param verbose: Logical. Whether to print messages or not. Default
         to ``True``.
 
+    :param engine: Either ``"gdal"`` to use
+        ``gdal.ComputeProximity()`` (one thread), or ``"edt"`` to
+        use an exact Euclidean distance transform computed on tiles
+        and strips in parallel processes (see ``edt_distance()``).
+        Distances are rounded to the nearest integer.
+
+    :param tile_size: Tile size in pixels for the ``"edt"`` engine.
+
+    :param n_jobs: Number of processes for the ``"edt"`` engine.
+
     :return: None. A distance raster file is created (see
         ``dist_file``). Raster data type is UInt32 ([0,
         4294967295]).
 
     """
 
+    # Check engine
+    if engine not in ("gdal", "edt"):
+        msg = "engine must be 'gdal' or 'edt'."
+        raise ValueError(msg)
+
+    # Tiled Euclidean distance transform
+    if engine == "edt":
+        task = {"input_file": input_file, "dist_file": dist_file,
+                "values": values, "nodata": nodata,
+                "input_nodata": input_nodata}
+        edt_distance([task], tile_size=tile_size, n_jobs=n_jobs,
+                     verbose=verbose)
+        return
+
     # Read input file
     src_ds = gdal.Open(input_file)
     srcband = src_ds.GetRasterBand(1)
@@ -65,7 +491,7 @@ def compute_distance(input_file, dist_file, values=0,
     gdal.ComputeProximity(
         srcband,
         dstband,
-        [val, use_input_nodata, "DISTUNITS=GEO"],
+        [val, use_input_nodata, "DISTUNITS=GEO", f"NODATA={nodata}"],
         callback=cb
     )
 
@@ -78,6 +504,58 @@ def compute_distance(input_file, dist_file, values=0,
     del src_ds, dst_ds
 
 
+def compute_distances(tasks, engine="gdal", tile_size=1024, n_jobs=1,
+                      verbose=True):
+    """Compute several distance rasters concurrently.
+
+    With the ``"edt"`` engine, tiles of all the rasters are computed
+    in a single pool of ``n_jobs`` processes. With the ``"gdal"``
+    engine, rasters are computed with ``gdal.ComputeProximity()`` in
+    ``n_jobs`` parallel threads.
+
+    :param tasks: List of dictionaries with arguments of
+        ``compute_distance()`` (``input_file``, ``dist_file``, and
+        optionally ``values``, ``nodata``, and ``input_nodata``).
+
+    :param engine: Either ``"gdal"`` or ``"edt"`` (see
+        ``compute_distance()``).
+
+    :param tile_size: Tile size in pixels for the ``"edt"`` engine.
+
+    :param n_jobs: Number of processes (``"edt"``) or threads
+        (``"gdal"``).
+
+    :param verbose: Logical. Whether to print messages or not. Default
+        to ``True``.
+
+    :return: None. Distance raster files are created.
+    """
+
+    # Default arguments
+    defaults = {"values": 0, "nodata": 4294967295, "input_nodata": False}
+    tasks = [{**defaults, **task} for task in tasks]
+
+    # Check engine
+    if engine not in ("gdal", "edt"):
+        msg = "engine must be 'gdal' or 'edt'."
+        raise ValueError(msg)
+
+    # Tiled Euclidean distance transform
+    if engine == "edt":
+        edt_distance(tasks, tile_size=tile_size, n_jobs=n_jobs,
+                     verbose=verbose)
+        return
+
+    # gdal.ComputeProximity() in parallel threads
+    n_jobs = 1 if n_jobs is None else max(1, n_jobs)
+    verbose = verbose and n_jobs == 1
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        futures = [pool.submit(compute_distance, verbose=verbose, **task)
+                   for task in tasks]
+        for fut in futures:
+            fut.result()
+
+
 # # Test
 # import os
 # os.chdir("/home/ghislain/deforisk/MTQ_2000_2010_2020_jrc_7221/data_raw/")
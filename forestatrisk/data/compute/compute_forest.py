@@ -1,17 +1,189 @@
 """Processing forest data."""
 
 import os
-import subprocess
 from glob import glob
 
+import numpy as np
 from osgeo import gdal
 
-from .compute_distance import compute_distance
+from ...misc import makeblock, progress_bar
+from ...misc import map_blocks, BlockReader
+from .compute_distance import compute_distances
 
 
-def compute_forest(proj, extent, verbose=False):
+def fcc_calc(A, B):
+    """Forest cover change between two forest rasters.
+
+    :param A: Forest at the first date (1: forest).
+
+    :param B: Forest at the second date (1: forest, 0: non-forest).
+
+    :return: 1 for forest at both dates, 0 for deforestation, 255
+        otherwise (nodata).
+    """
+
+    out = np.full(A.shape, 255, dtype=np.uint8)
+    out[(A == 1) & (B == 1)] = 1
+    out[(A == 1) & (B == 0)] = 0
+    return out
+
+
+def compute_forest_rasters(nbands, k, blk_rows=128, n_jobs=1,
+                           verbose=False, work_dir="."):
+    """Compute forest and forest cover change rasters in one pass.
+
+    This function reads ``forest_src.tif`` and ``aoi_proj.tif`` once
+    per block and writes all the derived rasters: ``forest_t*_src.tif``
+    (one band of the source raster), ``fcc*_src.tif`` (forest cover
+    change between consecutive dates), ``forest_t*.tif`` and
+    ``fcc*.tif`` (masked with the area of interest), ``fcc13.tif``
+    and ``fcc123.tif``. Blocks are computed in ``n_jobs`` parallel
+    threads. Pixels equal to the nodata value of a source band are set
+    to nodata in derived rasters. ``forest_t*_src.tif`` rasters keep
+    the data type and nodata value of the source bands. Other rasters
+    are of type Byte.
+
+    :param nbands: Number of bands (dates) of ``forest_src.tif``.
+
+    :param k: Index of the first date (1 if 3 bands, 0 if 4 bands).
+
+    :param blk_rows: If > 0, number of rows for block (else 256x256).
+
+    :param n_jobs: Number of threads.
+
+    :param verbose: Logical. Whether to print messages or not. Default
+        to ``False``.
+
+    :param work_dir: Working directory with input files where output
+        files are written. Default to the current directory.
+    """
+
+    # Source dataset
+    forest_src = os.path.join(work_dir, "forest_src.tif")
+    with gdal.Open(forest_src) as ds:
+        gt = ds.GetGeoTransform()
+        proj = ds.GetProjection()
+        ncol = ds.RasterXSize
+        nrow = ds.RasterYSize
+        src_nodata = [ds.GetRasterBand(i + 1).GetNoDataValue()
+                      for i in range(nbands)]
+        src_type = [ds.GetRasterBand(i + 1).DataType
+                    for i in range(nbands)]
+
+    # Output rasters with nodata values and data types
+    dates = [i + k for i in range(nbands)]
+    outputs = {}
+    for (i, t) in enumerate(dates):
+        outputs[f"forest_t{t}_src.tif"] = (src_nodata[i], src_type[i])
+    for t in dates[:-1]:
+        outputs[f"fcc{t}{t + 1}_src.tif"] = (255, gdal.GDT_Byte)
+    for t in dates:
+        outputs[f"forest_t{t}.tif"] = (255, gdal.GDT_Byte)
+    for t in dates[:-1]:
+        outputs[f"fcc{t}{t + 1}.tif"] = (255, gdal.GDT_Byte)
+    outputs["fcc13.tif"] = (255, gdal.GDT_Byte)
+    outputs["fcc123.tif"] = (0, gdal.GDT_Byte)
+
+    # Create output rasters
+    driver = gdal.GetDriverByName("GTiff")
+    copts = ["COMPRESS=DEFLATE", "PREDICTOR=2", "BIGTIFF=YES"]
+    ds_out = {}
+    band_out = {}
+    for (ofile, (nodata, dtype)) in outputs.items():
+        ofile_path = os.path.join(work_dir, ofile)
+        if os.path.isfile(ofile_path):
+            os.remove(ofile_path)
+        ds = driver.Create(ofile_path, ncol, nrow, 1, dtype, copts)
+        ds.SetGeoTransform(gt)
+        ds.SetProjection(proj)
+        band = ds.GetRasterBand(1)
+        if nodata is not None:
+            band.SetNoDataValue(nodata)
+        ds_out[ofile] = ds
+        band_out[ofile] = band
+
+    # Make blocks
+    blockinfo = makeblock(forest_src, blk_rows=blk_rows)
+    nblock = blockinfo[0]
+    nblock_x = blockinfo[1]
+    x = blockinfo[3]
+    y = blockinfo[4]
+    nx = blockinfo[5]
+    ny = blockinfo[6]
+
+    # Readers
+    readers = [BlockReader(forest_src, band=i + 1)
+               for i in range(nbands)]
+    reader_aoi = BlockReader(os.path.join(work_dir, "aoi_proj.tif"))
+
+    def compute_block(b):
+        """Compute all output rasters for one block."""
+        px = b % nblock_x
+        py = b // nblock_x
+        win = (x[px], y[py], nx[px], ny[py])
+        aoi = reader_aoi.read(*win)
+        data = {}
+        # Source forest and validity of source pixels
+        src = []
+        valid = []
+        for (i, t) in enumerate(dates):
+            A = readers[i].read(*win)
+            v = (np.ones(A.shape, dtype=bool) if src_nodata[i] is None
+                 else A != src_nodata[i])
+            data[f"forest_t{t}_src.tif"] = A
+            src.append(A)
+            valid.append(v)
+        # Forest cover change (nodata propagated)
+        for i in range(nbands - 1):
+            fcc = fcc_calc(src[i], src[i + 1])
+            fcc[~(valid[i] & valid[i + 1])] = 255
+            data[f"fcc{dates[i]}{dates[i] + 1}_src.tif"] = fcc
+            # Masked with aoi
+            fcc_m = np.full(fcc.shape, 255, dtype=np.uint8)
+            fcc_m[(fcc == 1) & (aoi == 1)] = 1
+            fcc_m[(fcc == 0) & (aoi == 1)] = 0
+            data[f"fcc{dates[i]}{dates[i] + 1}.tif"] = fcc_m
+        # Forest masked with aoi (nodata propagated)
+        forest = {}
+        for (i, t) in enumerate(dates):
+            F = (src[i] * aoi).astype(np.uint8)
+            F[~valid[i]] = 255
+            data[f"forest_t{t}.tif"] = F
+            forest[t] = F
+        # fcc13 and fcc123 from masked forest
+        data["fcc13.tif"] = fcc_calc(forest[1], forest[3])
+        fcc123 = (forest[1].astype(np.int32) + forest[2] + forest[3])
+        invalid = (forest[1] == 255) | (forest[2] == 255) | (forest[3] == 255)
+        fcc123[invalid] = 0
+        data["fcc123.tif"] = fcc123.astype(np.uint8)
+        return data
+
+    # Loop on blocks of data
+    for (b, data) in enumerate(map_blocks(compute_block, nblock, n_jobs)):
+        # Progress bar
+        if verbose:
+            progress_bar(nblock, b + 1)
+        px = b % nblock_x
+        py = b // nblock_x
+        for (ofile, arr) in data.items():
+            band_out[ofile].WriteArray(arr, x[px], y[py])
+
+    # Dereference drivers
+    for ofile in outputs:
+        band_out[ofile].FlushCache()
+    band_out = None
+    ds_out = None
+
+
+def compute_forest(proj, extent, verbose=False, blk_rows=128, n_jobs=1,
+                   dist_engine="gdal", tile_size=1024, work_dir="."):
     """Processing forest data.
 
+    Forest tiles in ``work_dir/forest_tiles`` are reprojected to
+    ``forest_src.tif`` at each call. If there are no tiles, an
+    existing ``forest_src.tif`` file (eg. user's forest cover change
+    data) is used.
+
     :param iso: Country iso code.
 
     :param proj: Projection definition (EPSG, PROJ.4, WKT) as in
@@ -21,6 +193,21 @@ def compute_forest(proj, extent, verbose=False):
 
     :param verbose: Logical. Whether to print messages or not. Default
         to ``False``.
+
+    :param blk_rows: If > 0, number of rows for block (else 256x256)
+        when computing forest cover change rasters.
+
+    :param n_jobs: Number of threads used to compute forest cover
+        change rasters, and number of distance rasters (``"gdal"``
+        engine) or tiles (``"edt"`` engine) computed in parallel.
+
+    :param dist_engine: Engine used to compute distances, either
+        ``"gdal"`` or ``"edt"`` (see ``compute_distance()``).
+
+    :param tile_size: Tile size in pixels for the ``"edt"`` engine.
+
+    :param work_dir: Working directory with input files where output
+        files are written. Default to the current directory.
     """
 
     # Callback
@@ -29,13 +216,25 @@ def compute_forest(proj, extent, verbose=False):
     # Creation options
     copts = ["COMPRESS=DEFLATE", "PREDICTOR=2", "BIGTIFF=YES"]
 
-    # Only execute the following if forest_src.tif is absent
-    # Useful to use user's fcc data
-    if not os.path.isfile("forest_src.tif"):
+    # Reproject forest tiles to forest_src.tif each time the function
+    # is called (so that the output is up to date with the tiles,
+    # projection, and extent). Without tiles, forest_src.tif must be
+    # provided by the user (eg. user's fcc data).
+    forest_src = os.path.join(work_dir, "forest_src.tif")
+    tif_forest_files = glob(os.path.join(work_dir, "forest_tiles",
+                                         "forest_*.tif"))
+    if not tif_forest_files and not os.path.isfile(forest_src):
+        msg = ("No forest tiles in forest_tiles/ and no "
+               f"forest_src.tif file in {work_dir}.")
+        raise ValueError(msg)
+    if tif_forest_files:
+        # Warp writes into an existing destination file
+        if os.path.isfile(forest_src):
+            os.remove(forest_src)
         # Make vrt
-        tif_forest_files = glob("forest_tiles/forest_*.tif")
+        vrt_file = os.path.join(work_dir, "forest.vrt")
         forest_vrt = gdal.BuildVRT(
-            "forest.vrt",
+            vrt_file,
             tif_forest_files,
             callback=cback)
         # Flush cache
@@ -55,10 +254,10 @@ def compute_forest(proj, extent, verbose=False):
             creationOptions=copts,
             callback=cback,
         )
-        gdal.Warp("forest_src.tif", "forest.vrt", options=param)
+        gdal.Warp(forest_src, vrt_file, options=param)
 
     # Number of bands (or years)
-    with gdal.Open("forest_src.tif") as ds:
+    with gdal.Open(forest_src) as ds:
         nbands = ds.RasterCount
         xmin, xres, _, ymax, _, yres = ds.GetGeoTransform()
         xmax = xmin + xres * ds.RasterXSize
@@ -67,16 +266,10 @@ def compute_forest(proj, extent, verbose=False):
     # Index offset if band == 3
     k = 1 if nbands == 3 else 0
 
-    # Separate bands
-    for i in range(nbands):
-        gdal.Translate(f"forest_t{i + k}_src.tif", "forest_src.tif",
-                       maskBand=None,
-                       bandList=[i + 1], creationOptions=copts,
-                       callback=cback)
-
     # Rasterize country border
     # (by default: zero outside, without nodata value)
-    gdal.Rasterize("aoi_proj.tif", "aoi_proj.gpkg",
+    gdal.Rasterize(os.path.join(work_dir, "aoi_proj.tif"),
+                   os.path.join(work_dir, "aoi_proj.gpkg"),
                    layers="aoi",
                    outputBounds=[xmin, ymin, xmax, ymax],
                    xRes=xres, yRes=-yres,
@@ -84,104 +277,35 @@ def compute_forest(proj, extent, verbose=False):
                    burnValues=[1], outputType=gdal.GDT_Byte,
                    creationOptions=copts, callback=cback)
 
-    # Compute distance to forest edge at t1, t2, and t3
+    # Separate bands, compute fcc, and mask with country border
+    # (forest_t*_src, fcc*_src, forest_t*, fcc*, fcc13, and fcc123)
+    compute_forest_rasters(nbands, k, blk_rows=blk_rows, n_jobs=n_jobs,
+                           verbose=verbose, work_dir=work_dir)
+
+    # Distance to forest edge at t1, t2, and t3
     # for modelling, validating, and forecasting, respectively
+    tasks = []
     for i in range(3):
-        compute_distance(f"forest_t{i + 1}_src.tif",
-                         f"dist_edge_t{i + 1}.tif",
-                         values=0, nodata=0,
-                         input_nodata=True,
-                         verbose=verbose)
-
-    # Compute fcc
-    # Command to compute fcc
-    cmd_str = (
-        'gdal_calc --overwrite '
-        '-A {0} -B {1} '
-        '--outfile={2} --type=Byte '
-        '--calc="255-254*(A==1)*(B==1)-255*(A==1)*(B==0)" '
-        '--co "COMPRESS=DEFLATE" --co "PREDICTOR=2" --co "BIGTIFF=YES" '
-        '--NoDataValue=255 --quiet')
-    # Loop on bands
-    for i in range(nbands - 1):
-        # Compute fcc{i}{i + 1}_src.tif
-        rast_a = f"forest_t{i + k}_src.tif"
-        rast_b = f"forest_t{i + 1 + k}_src.tif"
-        fcc_out = f"fcc{i + k}{i + 1 + k}_src.tif"
-        cmd = cmd_str.format(rast_a, rast_b, fcc_out)
-        subprocess.run(cmd, shell=True, check=True,
-                       capture_output=False)
-
-    # Compute distance to past deforestation only if 4 bands
+        tasks.append({"input_file": os.path.join(
+                          work_dir, f"forest_t{i + 1}_src.tif"),
+                      "dist_file": os.path.join(
+                          work_dir, f"dist_edge_t{i + 1}.tif"),
+                      "values": 0, "nodata": 0,
+                      "input_nodata": True})
+
+    # Distance to past deforestation only if 4 bands
     if nbands == 4:
         for i in range(nbands - 1):
-            # Compute distance to past deforestation at t1, t2, and t3
-            fcc_in = f"fcc{i + k}{i + 1 + k}_src.tif"
-            dist_out = f"dist_defor_t{i + 1}.tif"
-            compute_distance(fcc_in, dist_out,
-                             values=0, nodata=0,
-                             input_nodata=True,
-                             verbose=verbose)
-
-    # Mask forest rasters with country border
-    rast_in = [f"forest_t{i + k}_src.tif" for i in range(nbands)]
-    rast_out = [f"forest_t{i + k}.tif" for i in range(nbands)]
-    cmd_str = (
-        'gdal_calc --overwrite '
-        '-A {0} -B aoi_proj.tif '
-        '--outfile={1} --type=Byte '
-        '--calc="A*B" '
-        '--co "COMPRESS=DEFLATE" --co "PREDICTOR=2" --co "BIGTIFF=YES" '
-        '--quiet'
-    )
-    for (i, j) in zip(rast_in, rast_out):
-        cmd = cmd_str.format(i, j)
-        subprocess.run(cmd, shell=True, check=True,
-                       capture_output=False)
-
-    # Mask fcc with country border
-    rast_in = [f"fcc{i + k}{i + k + 1}_src.tif" for i in range(nbands - 1)]
-    rast_out = [f"fcc{i + k}{i + k + 1}.tif" for i in range(nbands - 1)]
-    cmd_str = (
-        'gdal_calc --overwrite '
-        '-A {0} -B aoi_proj.tif '
-        '--outfile={1} --type=Byte '
-        '--calc={2} '
-        '--co "COMPRESS=DEFLATE" --co "PREDICTOR=2" --co "BIGTIFF=YES" '
-        '--NoDataValue=255 --quiet'
-    )
-    calc_expr = '"255-254*(A==1)*(B==1)-255*(A==0)*(B==1)"'
-    for (i, j) in zip(rast_in, rast_out):
-        cmd = cmd_str.format(i, j, calc_expr)
-        subprocess.run(cmd, shell=True, check=True,
-                       capture_output=False)
-
-    # Compute raster fcc13.tif for forecast (no need to crop with borders)
-    cmd_str = (
-        'gdal_calc --overwrite '
-        '-A {0} -B {1} '
-        '--outfile={2} --type=Byte '
-        '--calc="255-254*(A==1)*(B==1)-255*(A==1)*(B==0)" '
-        '--co "COMPRESS=DEFLATE" --co "PREDICTOR=2" --co "BIGTIFF=YES" '
-        '--NoDataValue=255 --quiet')
-    rast_a = "forest_t1.tif"
-    rast_b = "forest_t3.tif"
-    fcc_out = "fcc13.tif"
-    cmd = cmd_str.format(rast_a, rast_b, fcc_out)
-    subprocess.run(cmd, shell=True, check=True,
-                   capture_output=False)
-
-    # Compute raster fcc123.tif
-    # (0: nodata, 1: t1, 2: t2, 3: t3)
-    cmd = (
-        'gdal_calc --overwrite '
-        '-A forest_t1.tif -B forest_t2.tif -C forest_t3.tif '
-        '--outfile=fcc123.tif --type=Byte '
-        '--calc="A+B+C" '
-        '--co "COMPRESS=DEFLATE" --co "PREDICTOR=2" --co "BIGTIFF=YES" '
-        '--NoDataValue=0 --quiet'
-    )
-    subprocess.run(cmd, shell=True, check=True,
-                   capture_output=False)
+            # Distance to past deforestation at t1, t2, and t3
+            tasks.append({"input_file": os.path.join(
+                              work_dir, f"fcc{i + k}{i + 1 + k}_src.tif"),
+                          "dist_file": os.path.join(
+                              work_dir, f"dist_defor_t{i + 1}.tif"),
+                          "values": 0, "nodata": 0,
+                          "input_nodata": True})
+
+    # Compute distances concurrently
+    compute_distances(tasks, engine=dist_engine, tile_size=tile_size,
+                      n_jobs=n_jobs, verbose=verbose)
 
 # End
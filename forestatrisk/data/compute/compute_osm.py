@@ -1,15 +1,120 @@
 """Processing OpenStreetMap data"""
 
-import subprocess
+import os
+import uuid
 
-from osgeo import gdal
+from osgeo import gdal, ogr, osr
 
-from .compute_distance import compute_distance
+from .compute_distance import compute_distances
 
+# OSM categories: (OSM layer, key, filter on values)
+OSM_CATEGORIES = {
+    "roads": ("lines", "highway",
+              lambda v: v in ("motorway", "trunk") or v.endswith("ary")),
+    "towns": ("points", "place",
+              lambda v: v in ("city", "town", "village")),
+    "rivers": ("lines", "waterway",
+               lambda v: v in ("river", "canal")),
+}
 
-def compute_osm(proj, extent, verbose=False):
+
+def extract_osm(input_file, output_file, proj, verbose=False):
+    """Extract roads, towns, and rivers from an OSM file.
+
+    Features are read in a single pass over the OSM file (``.osm`` or
+    ``.osm.pbf``) with the GDAL OSM driver, filtered on their tags,
+    reprojected, and written to one layer per category ("roads",
+    "towns", and "rivers") in a GeoPackage file.
+
+    :param input_file: Input OSM file.
+
+    :param output_file: Output GeoPackage file (can be in
+        ``/vsimem``).
+
+    :param proj: Projection definition (EPSG, PROJ.4, WKT) as in
+        GDAL/OGR. Used for reprojecting data.
+
+    :param verbose: Logical. Whether to print messages or not. Default
+        to ``False``.
+    """
+
+    # Coordinate transformation
+    src_srs = osr.SpatialReference()
+    src_srs.ImportFromEPSG(4326)
+    src_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    dst_srs = osr.SpatialReference()
+    dst_srs.SetFromUserInput(proj)
+    dst_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    ct = osr.CoordinateTransformation(src_srs, dst_srs)
+
+    # Output layers
+    drv = ogr.GetDriverByName("GPKG")
+    out_ds = drv.CreateDataSource(output_file)
+    out_lyr = {}
+    for (cat, (layer, key, _)) in OSM_CATEGORIES.items():
+        gtype = ogr.wkbPoint if layer == "points" else ogr.wkbLineString
+        lyr = out_ds.CreateLayer(cat, dst_srs, gtype)
+        for field in ("osm_id", "name", key):
+            lyr.CreateField(ogr.FieldDefn(field, ogr.OFTString))
+        lyr.StartTransaction()
+        out_lyr[cat] = lyr
+
+    # Categories by OSM layer
+    cat_by_layer = {}
+    for (cat, (layer, key, keep)) in OSM_CATEGORIES.items():
+        cat_by_layer.setdefault(layer, []).append((cat, key, keep))
+
+    # Single pass over features of all layers (interleaved reading)
+    in_ds = gdal.OpenEx(input_file, gdal.OF_VECTOR,
+                        open_options=["INTERLEAVED_READING=YES"])
+    cback = gdal.TermProgress_nocb if verbose else None
+    nfeat = 0
+    while True:
+        feat, lyr, pct = in_ds.GetNextFeature(include_layer=True,
+                                              include_pct=True)
+        if feat is None:
+            break
+        nfeat += 1
+        if cback is not None and nfeat % 100000 == 0:
+            cback(pct)
+        cats = cat_by_layer.get(lyr.GetName())
+        if cats is None:
+            continue
+        for (cat, key, keep) in cats:
+            value = feat.GetField(key)
+            if value is None or not keep(value):
+                continue
+            geom = feat.GetGeometryRef()
+            if geom is None:
+                continue
+            geom = geom.Clone()
+            geom.Transform(ct)
+            out_feat = ogr.Feature(out_lyr[cat].GetLayerDefn())
+            out_feat.SetField("osm_id", feat.GetField("osm_id"))
+            out_feat.SetField("name", feat.GetField("name"))
+            out_feat.SetField(key, value)
+            out_feat.SetGeometry(geom)
+            out_lyr[cat].CreateFeature(out_feat)
+    if cback is not None:
+        cback(1.0)
+
+    # Commit and close
+    for lyr in out_lyr.values():
+        lyr.CommitTransaction()
+    out_lyr = None
+    out_ds = None
+    in_ds = None
+
+
+def compute_osm(proj, extent, verbose=False, dist_engine="gdal",
+                tile_size=1024, n_jobs=1, work_dir="."):
     """Compute distance to road, town, and river.
 
+    Roads, towns, and rivers are extracted from the OSM file in a
+    single pass (see ``extract_osm()``) and saved as projected
+    shapefiles (``roads_proj.shp``, ``towns_proj.shp``, and
+    ``rivers_proj.shp``) before being rasterized.
+
     :param proj: Projection definition (EPSG, PROJ.4, WKT) as in
         GDAL/OGR. Used for reprojecting data.
 
@@ -18,51 +123,18 @@ def compute_osm(proj, extent, verbose=False):
     :param verbose: Logical. Whether to print messages or not. Default
         to ``False``.
 
-    """
+    :param dist_engine: Engine used to compute distances, either
+        ``"gdal"`` or ``"edt"`` (see ``compute_distance()``).
 
-    # Convert osm.pbf to o5m
-    cmd = "osmconvert country.osm.pbf -o=country.o5m"
-    rtn = subprocess.run(cmd, shell=True,
-                         check=True,
-                         capture_output=True,
-                         text=True)
-    if verbose:
-        print(rtn.stdout)
-
-    # Filter data
-    # Roads
-    cmd = ('osmfilter country.o5m '
-           '--keep="highway=motorway '
-           'or highway=trunk or highway=*ary" '
-           '-o=roads.osm')
-    rtn = subprocess.run(cmd, shell=True,
-                         check=True,
-                         capture_output=True,
-                         text=True)
-    if verbose:
-        print(rtn.stdout)
-    # Towns
-    cmd = ('osmfilter country.o5m '
-           '--keep="place=city or '
-           'place=town or place=village" '
-           '-o=towns.osm')
-    rtn = subprocess.run(cmd, shell=True,
-                         check=True,
-                         capture_output=True,
-                         text=True)
-    if verbose:
-        print(rtn.stdout)
-    # Rivers
-    cmd = ('osmfilter country.o5m '
-           '--keep="waterway=river or '
-           'waterway=canal" '
-           '-o=rivers.osm')
-    rtn = subprocess.run(cmd, shell=True,
-                         check=True,
-                         capture_output=True,
-                         text=True)
-    if verbose:
-        print(rtn.stdout)
+    :param tile_size: Tile size in pixels for the ``"edt"`` engine.
+
+    :param n_jobs: Number of distance rasters (``"gdal"`` engine) or
+        tiles (``"edt"`` engine) computed in parallel.
+
+    :param work_dir: Working directory with input files where output
+        files are written. Default to the current directory.
+
+    """
 
     # Callback
     cback = gdal.TermProgress_nocb if verbose else 0
@@ -70,39 +142,24 @@ def compute_osm(proj, extent, verbose=False):
     # Creation options
     copts = ["COMPRESS=DEFLATE", "PREDICTOR=2", "BIGTIFF=YES"]
 
-    # Useful lists
-    line_cat = ["roads", "towns", "rivers"]
-    sql_statement = [
-        ("SELECT osm_id, name, highway FROM lines "
-         "WHERE highway IS NOT NULL"),
-        ("SELECT osm_id, name, place FROM points "
-         "WHERE place IS NOT NULL"),
-        ("SELECT osm_id, name, waterway FROM lines "
-         "WHERE waterway IS NOT NULL"),
-    ]
-
-    # Loop on line categories
-    for (i, cat) in enumerate(line_cat):
-        # Convert to shapefile
-        param = gdal.VectorTranslateOptions(
-            accessMode="overwrite",
-            skipFailures=True,
-            format="ESRI Shapefile",
-            layerCreationOptions=["ENCODING=UTF-8"],
-            SQLStatement=sql_statement[i],
-            callback=cback,
-        )
-        gdal.VectorTranslate(cat + ".shp", cat + ".osm", options=param)
-        # Reproject
+    # Extract roads, towns, and rivers in memory
+    osm_file = os.path.join(work_dir, "country.osm.pbf")
+    gpkg_file = f"/vsimem/osm_{uuid.uuid4().hex}.gpkg"
+    extract_osm(osm_file, gpkg_file, proj, verbose=verbose)
+
+    # Rasterize categories
+    line_cat = list(OSM_CATEGORIES)
+    for cat in line_cat:
+        # Projected vector layer (eg. roads_proj.shp)
         param = gdal.VectorTranslateOptions(
             accessMode="overwrite",
             format="ESRI Shapefile",
             layerCreationOptions=["ENCODING=UTF-8"],
-            srcSRS="EPSG:4326",
-            dstSRS=proj,
-            callback=cback,
+            layers=[cat],
+            layerName=cat + "_proj",
         )
-        gdal.VectorTranslate(cat + "_proj.shp", cat + ".shp", options=param)
+        gdal.VectorTranslate(os.path.join(work_dir, cat + "_proj.shp"),
+                             gpkg_file, options=param)
         # Rasterize
         param = gdal.RasterizeOptions(
             outputBounds=extent,
@@ -112,19 +169,21 @@ def compute_osm(proj, extent, verbose=False):
             noData=255,
             xRes=150,
             yRes=150,
-            layers=[cat + "_proj"],
+            layers=[cat],
             outputType=gdal.GDT_Byte,
             creationOptions=copts,
             callback=cback,
         )
-        gdal.Rasterize(cat + ".tif", cat + "_proj.shp", options=param)
-        # Compute distances
-        compute_distance(
-            input_file=cat + ".tif",
-            dist_file="dist_" + cat[:-1] + ".tif",
-            values=1,
-            verbose=verbose,
-        )
+        cat_tif = os.path.join(work_dir, cat + ".tif")
+        gdal.Rasterize(cat_tif, gpkg_file, options=param)
+    gdal.Unlink(gpkg_file)
+
+    # Compute distances concurrently
+    tasks = [{"input_file": os.path.join(work_dir, cat + ".tif"),
+              "dist_file": os.path.join(work_dir, "dist_" + cat[:-1] + ".tif"),
+              "values": 1} for cat in line_cat]
+    compute_distances(tasks, engine=dist_engine, tile_size=tile_size,
+                      n_jobs=n_jobs, verbose=verbose)
 
 
 # End
@@ -1,15 +1,65 @@
 """Computations on SRTM data"""
 
 import os
+import math
+import uuid
 from glob import glob
 from zipfile import ZipFile
 
-from osgeo import gdal
+import numpy as np
+from osgeo import gdal, osr
 
+from ...misc import progress_bar, map_blocks
 
-def compute_srtm(proj, extent, verbose=False):
+
+def horn_slope(z, xres, yres, nodata=-32768):
+    """Compute slope in degrees with Horn's method.
+
+    Slope is computed for the interior pixels of an array of
+    elevation with a one-pixel halo. Nodata neighbours are replaced
+    with the value of the central pixel (as with the
+    ``computeEdges`` option of ``gdal.DEMProcessing()``).
+
+    :param z: Array of elevation with a one-pixel halo.
+
+    :param xres: Pixel size on x axis.
+
+    :param yres: Pixel size on y axis.
+
+    :param nodata: Nodata value for elevation.
+
+    :return: A tuple (slope, valid) with the array of slope in degrees
+        (without halo) and a logical array of valid pixels.
+    """
+
+    z = z.astype(np.float64)
+    center = z[1:-1, 1:-1]
+    valid = center != nodata
+
+    def win(i, j):
+        """Neighbour with nodata replaced by the central value."""
+        n = z[i:i + center.shape[0], j:j + center.shape[1]]
+        return np.where(n == nodata, center, n)
+
+    a, b, c = win(0, 0), win(0, 1), win(0, 2)
+    d, f = win(1, 0), win(1, 2)
+    g, h, i = win(2, 0), win(2, 1), win(2, 2)
+    dzdx = ((c + 2 * f + i) - (a + 2 * d + g)) / (8 * xres)
+    dzdy = ((g + 2 * h + i) - (a + 2 * b + c)) / (8 * yres)
+    slope = np.degrees(np.arctan(np.sqrt(dzdx ** 2 + dzdy ** 2)))
+    return (slope, valid)
+
+
+def compute_srtm(proj, extent, verbose=False, work_dir=".",
+                 blk_rows=128, n_jobs=1):
     """Compute elevation and slope.
 
+    SRTM tiles are read directly from the zip files (``/vsizip/``)
+    without extraction. Elevation is reprojected by strips of rows
+    with a one-pixel halo in memory, and slope is computed from the
+    elevation of each strip with Horn's method. Elevation and slope
+    are written as Int16 rasters in one pass.
+
     :param proj: Projection definition (EPSG, PROJ.4, WKT) as in
         GDAL/OGR. Used for reprojecting data.
 
@@ -18,54 +68,97 @@ def compute_srtm(proj, extent, verbose=False):
     :param verbose: Logical. Whether to print messages or not. Default
         to ``False``.
 
-    """
+    :param work_dir: Working directory with input files where output
+        files are written. Default to the current directory.
+
+    :param blk_rows: Number of rows for each strip.
 
-    # Callback
-    cback = gdal.TermProgress_nocb if verbose else 0
+    :param n_jobs: Number of strips computed in parallel threads.
+
+    """
 
     # Creation options
     copts = ["COMPRESS=DEFLATE", "PREDICTOR=2", "BIGTIFF=YES"]
 
-    # Unzip files
-    zipfiles = glob("SRTM_*.zip")
-    for zipfile in zipfiles:
-        outdir = os.path.splitext(zipfile)[0]
+    # Build vrt file over zip files
+    tif_srtm_files = []
+    for zipfile in sorted(glob(os.path.join(work_dir, "SRTM_*.zip"))):
+        zip_path = os.path.abspath(zipfile)
         with ZipFile(zipfile) as file:
-            file.extractall(outdir)
-
-    # Build vrt file
-    tif_srtm_files = glob("SRTM_*/srtm_*.tif")
-    gdal.BuildVRT("srtm.vrt", tif_srtm_files, callback=cback)
-
-    # Merge and reproject
-    param = gdal.WarpOptions(
-        warpOptions=["overwrite"],
-        srcSRS="EPSG:4326",
-        dstSRS=proj,
-        outputBounds=extent,
-        targetAlignedPixels=True,
-        resampleAlg=gdal.GRA_Bilinear,
-        xRes=90,
-        yRes=90,
-        creationOptions=copts,
-        callback=cback,
-    )
-    gdal.Warp("altitude.tif", "srtm.vrt", options=param)
-
-    # Compute slope
-    param = gdal.DEMProcessingOptions(
-        creationOptions=copts, computeEdges=True, callback=cback
-    )
-    gdal.DEMProcessing("_slope.tif", "altitude.tif", processing="slope",
-                       options=param)
-
-    # Convert to Int16
-    param = gdal.TranslateOptions(
-        outputType=gdal.GDT_Int16,
-        creationOptions=copts,
-        callback=cback
-    )
-    gdal.Translate("slope.tif", "_slope.tif", options=param)
+            members = [m for m in file.namelist()
+                       if os.path.basename(m).startswith("srtm_")
+                       and m.endswith(".tif")]
+        tif_srtm_files += [f"/vsizip/{zip_path}/{m}" for m in members]
+    srtm_vrt = f"/vsimem/srtm_{uuid.uuid4().hex}.vrt"
+    gdal.BuildVRT(srtm_vrt, tif_srtm_files)
+
+    # Output grid (target aligned pixels)
+    res = 90
+    xmin = math.floor(extent[0] / res) * res
+    ymin = math.floor(extent[1] / res) * res
+    xmax = math.ceil(extent[2] / res) * res
+    ymax = math.ceil(extent[3] / res) * res
+    ncol = int(round((xmax - xmin) / res))
+    nrow = int(round((ymax - ymin) / res))
+    gt = (xmin, res, 0, ymax, 0, -res)
+
+    # Create output rasters
+    srs = osr.SpatialReference()
+    srs.SetFromUserInput(proj)
+    driver = gdal.GetDriverByName("GTiff")
+    out_ds = []
+    out_band = []
+    for (ofile, nodata) in (("altitude.tif", -32768), ("slope.tif", -9999)):
+        ofile = os.path.join(work_dir, ofile)
+        ds = driver.Create(ofile, ncol, nrow, 1, gdal.GDT_Int16, copts)
+        ds.SetGeoTransform(gt)
+        ds.SetProjection(srs.ExportToWkt())
+        band = ds.GetRasterBand(1)
+        band.SetNoDataValue(nodata)
+        out_ds.append(ds)
+        out_band.append(band)
+
+    # Strips
+    y = list(range(0, nrow, blk_rows))
+    nblock = len(y)
+
+    def compute_strip(b):
+        """Reproject elevation with a halo and compute slope."""
+        ny = min(blk_rows, nrow - y[b])
+        bounds = (xmin - res, ymax - (y[b] + ny + 1) * res,
+                  xmax + res, ymax - (y[b] - 1) * res)
+        param = gdal.WarpOptions(
+            format="MEM",
+            srcSRS="EPSG:4326",
+            dstSRS=proj,
+            outputBounds=bounds,
+            width=ncol + 2,
+            height=ny + 2,
+            resampleAlg=gdal.GRA_Bilinear,
+            outputType=gdal.GDT_Int16,
+            dstNodata=-32768,
+        )
+        mem_ds = gdal.Warp("", srtm_vrt, options=param)
+        z = mem_ds.GetRasterBand(1).ReadAsArray()
+        mem_ds = None
+        slope, valid = horn_slope(z, res, res)
+        slope = np.where(valid, np.rint(slope), -9999).astype(np.int16)
+        return (z[1:-1, 1:-1], slope)
+
+    # Loop on strips
+    for (b, (alt, slope)) in enumerate(map_blocks(compute_strip, nblock,
+                                                  n_jobs)):
+        if verbose:
+            progress_bar(nblock, b + 1)
+        out_band[0].WriteArray(alt, 0, y[b])
+        out_band[1].WriteArray(slope, 0, y[b])
+
+    # Dereference drivers and remove vrt
+    for band in out_band:
+        band.FlushCache()
+    out_band = None
+    out_ds = None
+    gdal.Unlink(srtm_vrt)
 
 
 # End
@@ -1,9 +1,12 @@
 """Processing WDPA data."""
 
+import os
+
 from osgeo import gdal
 
 
-def compute_wdpa(iso, proj, extent, where=None, verbose=False):
+def compute_wdpa(iso, proj, extent, where=None, verbose=False,
+                 work_dir="."):
     """Process geospatial data on protected areas.
 
     :param iso: Country iso code.
@@ -21,6 +24,9 @@ def compute_wdpa(iso, proj, extent, where=None, verbose=False):
     :param verbose: Logical. Whether to print messages or not. Default
         to ``False``.
 
+    :param work_dir: Working directory with input files where output
+        files are written. Default to the current directory.
+
     """
 
     # Callback
@@ -49,7 +55,9 @@ def compute_wdpa(iso, proj, extent, where=None, verbose=False):
         layerCreationOptions=["ENCODING=UTF-8"],
         callback=cback
     )
-    gdal.VectorTranslate("pa_proj.shp", "pa_" + iso + ".shp", options=param)
+    pa_file = os.path.join(work_dir, "pa_" + iso + ".shp")
+    pa_proj = os.path.join(work_dir, "pa_proj.shp")
+    gdal.VectorTranslate(pa_proj, pa_file, options=param)
 
     # Rasterize
     param = gdal.RasterizeOptions(
@@ -66,7 +74,7 @@ def compute_wdpa(iso, proj, extent, where=None, verbose=False):
         creationOptions=["COMPRESS=DEFLATE", "PREDICTOR=2", "BIGTIFF=YES"],
         callback=cback
     )
-    gdal.Rasterize("pa.tif", "pa_proj.shp", options=param)
+    gdal.Rasterize(os.path.join(work_dir, "pa.tif"), pa_proj, options=param)
 
 
 # End
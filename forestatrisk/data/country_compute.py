@@ -14,6 +14,7 @@ from .compute import (
     compute_wdpa, compute_osm
 )
 from .compute import compute_biomass_avitabile
+from .pipeline import run_tasks
 
 
 def get_iso_wdpa(isocode):
@@ -47,6 +48,7 @@ def country_compute(
     data_forest=True,
     data_agb=False,
     keep_temp_dir=False,
+    n_jobs=1,
 ):
     """Process country geospatial data.
 
@@ -78,7 +80,17 @@ def country_compute(
         to "False".
 
     :param keep_temp_dir: Boolean to keep the temporary
-        directory. Default to "False".
+        directory. Default to "False". If "True", a manifest file
+        (``manifest.json``) recording the hashes of inputs and
+        parameters of each computation stage is kept in the
+        temporary directory. When ``country_compute()`` is run again,
+        stages whose inputs, parameters, and outputs have not changed
+        are skipped.
+
+    :param n_jobs: Number of processes used to run independent
+        computation stages (OSM, SRTM, WDPA, AGB, and forest)
+        concurrently. Also used as the number of threads to compute
+        forest rasters. Default to 1 (stages are run sequentially).
 
     """
 
@@ -93,39 +105,75 @@ def country_compute(
     ofile = os.path.join(temp_dir, "aoi_proj.gpkg")
     extent_reg = compute_gadm(ifile, ofile, proj, buff=5000)
 
-    # Computing country data
+    # Computation stages with input and output files
+    def tmp(fname):
+        """Path to a file in the temporary directory."""
+        return os.path.join(temp_dir, fname)
+
+    tasks = []
     if data_country:
-        # Changing working directory
-        wd = os.getcwd()
-        os.chdir(temp_dir)
         # Get iso for wdpa
         iso_wdpa = get_iso_wdpa(iso_code)
-        # Perform computations
-        compute_osm(proj, extent_reg)
-        compute_srtm(proj, extent_reg)
-        compute_wdpa(iso_wdpa, proj, extent_reg)
+        common = {"proj": proj, "extent": extent_reg, "work_dir": temp_dir}
+        tasks.append({
+            "name": "osm", "fun": compute_osm, "kwargs": common,
+            "inputs": [tmp("country.osm.pbf")],
+            "outputs": ([tmp(f"dist_{c}.tif") for c in
+                         ("road", "town", "river")] +
+                        [tmp(f"{c}_proj.shp") for c in
+                         ("roads", "towns", "rivers")])})
+        tasks.append({
+            "name": "srtm", "fun": compute_srtm, "kwargs": common,
+            "inputs": glob(tmp("SRTM_*.zip")),
+            "outputs": [tmp("altitude.tif"), tmp("slope.tif")]})
+        tasks.append({
+            "name": "wdpa", "fun": compute_wdpa,
+            "kwargs": {"iso": iso_wdpa, **common},
+            "inputs": [tmp(f"pa_{iso_wdpa}{ext}")
+                       for ext in (".shp", ".dbf")],
+            "outputs": [tmp("pa.tif"), tmp("pa_proj.shp")]})
         if data_agb:
-            compute_biomass_avitabile(proj, extent_reg)
-        # Moving created files
-        dist_files = [f for f in glob("dist_*.tif") if f[-6] != "t"]
-        aoi_files = ["aoi_proj.tif", "aoi_proj.gpkg"]
-        proj_files = [f for f in glob("*_proj.*") if f not in aoi_files]
-        other_files = ["altitude.tif", "slope.tif", "pa.tif"]
+            tasks.append({
+                "name": "agb", "fun": compute_biomass_avitabile,
+                "kwargs": common, "inputs": [],
+                "outputs": [tmp("AGB.tif")]})
+    if data_forest:
+        tasks.append({
+            "name": "forest", "fun": compute_forest,
+            "kwargs": {"proj": proj, "extent": extent_reg,
+                       "n_jobs": n_jobs, "work_dir": temp_dir},
+            # aoi_proj.gpkg is computed again at each run from the
+            # source aoi file which is used as input instead
+            "inputs": ([ifile] +
+                       glob(tmp(os.path.join("forest_tiles",
+                                             "forest_*.tif")))),
+            "outputs": ([tmp("forest_src.tif"), tmp("aoi_proj.tif"),
+                         tmp("fcc13.tif"), tmp("fcc123.tif")] +
+                        [tmp(f"forest_t{i + 1}.tif") for i in range(3)] +
+                        [tmp(f"dist_edge_t{i + 1}.tif")
+                         for i in range(3)])})
+
+    # Run independent stages concurrently, skipping stages which are
+    # up to date when the temporary directory is kept
+    manifest = tmp("manifest.json") if keep_temp_dir else None
+    run_tasks(tasks, n_jobs=n_jobs, manifest=manifest)
+
+    # Copy country data
+    if data_country:
+        dist_files = [f for f in glob(tmp("dist_*.tif")) if f[-6] != "t"]
+        aoi_files = [tmp("aoi_proj.tif"), tmp("aoi_proj.gpkg")]
+        proj_files = [f for f in glob(tmp("*_proj.*"))
+                      if f not in aoi_files]
+        other_files = [tmp("altitude.tif"), tmp("slope.tif"),
+                       tmp("pa.tif")]
         if data_agb:
-            other_files.append("AGB.tif")
+            other_files.append(tmp("AGB.tif"))
         ifiles = dist_files + proj_files + other_files
         for ifile in ifiles:
-            copy2(ifile, os.path.join(wd, output_dir))
-        os.chdir(wd)
+            copy2(ifile, output_dir)
 
-    # Computing forest data
+    # Copy forest data for modelling
     if data_forest:
-        # Changing working directory
-        wd = os.getcwd()
-        os.chdir(temp_dir)
-        # Perform computations
-        compute_forest(proj, extent_reg)
-        # Copy files for modelling
         forest_files = [f"forest_t{i + 1}.tif" for i in range(3)]
         dist_edge_files = [f"dist_edge_t{i + 1}.tif" for i in range(3)]
         dist_defor_files = [f"dist_defor_t{i + 1}.tif" for i in range(3)]
@@ -134,9 +182,8 @@ def country_compute(
         ifiles = (forest_files + dist_edge_files +
                   dist_defor_files + fcc_files + aoi_file)
         for ifile in ifiles:
-            if os.path.isfile(ifile):
-                copy2(ifile, os.path.join(wd, output_dir))
-        os.chdir(wd)
+            if os.path.isfile(tmp(ifile)):
+                copy2(tmp(ifile), output_dir)
 
     # Keep or remove directory
     if not keep_temp_dir:
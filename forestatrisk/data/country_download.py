@@ -1,6 +1,7 @@
 """Download country geospatial data."""
 
 import os
+from concurrent.futures import ThreadPoolExecutor
 import importlib.resources as importlib_resources
 
 import pandas as pd
@@ -21,7 +22,10 @@ def country_download(
         srtm=True,
         wdpa=True,
         osm=True,
-        forest=True):
+        forest=True,
+        n_jobs=4,
+        cache_dir=None,
+        mirror=None):
     """Download country geospatial data.
 
     Function to download all the data for a specific country. It
@@ -57,6 +61,18 @@ def country_download(
 
     :param forest: Toggle forest data download.
 
+    :param n_jobs: Number of parallel downloads for SRTM tiles. SRTM
+        and OSM data are also downloaded concurrently.
+
+    :param cache_dir: Local cache directory shared between runs (eg.
+        for several countries). Files are taken from the cache when
+        present, and downloaded files are added to the cache. Default
+        to ``None`` (no cache).
+
+    :param mirror: Base url of a local mirror with the same layout as
+        the cache directory, eg. a ``file://`` url or a local HTTP
+        server. Default to ``None`` (no mirror).
+
     """
 
     # Message
@@ -78,13 +94,25 @@ def country_download(
         # AOI arg must be used here, not iso3
         aoi = get_fcc_args["aoi"]
         ofile = opj(output_dir, "gadm41_" + aoi + "_0.gpkg")
-        download_gadm(iso3=aoi, output_file=ofile)
-    if srtm:
-        download_srtm(iso3=iso3, output_dir=output_dir)
+        download_gadm(iso3=aoi, output_file=ofile,
+                      cache_dir=cache_dir, mirror=mirror)
+    # WDPA before other downloads (pywdpa changes working directory)
     if wdpa:
-        download_wdpa(iso3=iso_wdpa, output_dir=output_dir)
-    if osm:
-        download_osm(iso3=iso3, output_dir=output_dir)
+        download_wdpa(iso3=iso_wdpa, output_dir=output_dir,
+                      cache_dir=cache_dir, mirror=mirror)
+    # SRTM and OSM concurrently (after GADM used for SRTM)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        futures = []
+        if srtm:
+            futures.append(pool.submit(
+                download_srtm, iso3=iso3, output_dir=output_dir,
+                n_jobs=n_jobs, cache_dir=cache_dir, mirror=mirror))
+        if osm:
+            futures.append(pool.submit(
+                download_osm, iso3=iso3, output_dir=output_dir,
+                cache_dir=cache_dir, mirror=mirror))
+        for fut in futures:
+            fut.result()
     if forest:
         gf.get_fcc(
             aoi=get_fcc_args["aoi"],
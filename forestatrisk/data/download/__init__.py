@@ -4,3 +4,4 @@ from .download_gadm import download_gadm
 from .download_osm import download_osm
 from .download_srtm import download_srtm
 from .download_wdpa import download_wdpa
+from .download_manager import download_file, download_files
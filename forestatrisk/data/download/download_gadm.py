@@ -1,10 +1,11 @@
 """Download GADM data."""
 
 import os
-from urllib.request import urlretrieve
 
+from .download_manager import download_file
 
-def download_gadm(iso3, output_file):
+
+def download_gadm(iso3, output_file, cache_dir=None, mirror=None):
     """Download GADM data for a country.
 
     Download GADM (Global Administrative Areas) for a specific
@@ -14,6 +15,12 @@ def download_gadm(iso3, output_file):
 
     :param output_file: Path to output GPKG file.
 
+    :param cache_dir: Local cache directory shared between runs (see
+        ``download_file()``). Default to ``None`` (no cache).
+
+    :param mirror: Base url of a local mirror, eg. a ``file://`` url
+        (see ``download_file()``). Default to ``None`` (no mirror).
+
     """
 
     # Check for existing file
@@ -22,7 +29,7 @@ def download_gadm(iso3, output_file):
         # Download the file from gadm.org
         url = ("https://geodata.ucdavis.edu/gadm/gadm4.1/"
                f"gpkg/gadm41_{iso3}.gpkg")
-        urlretrieve(url, output_file)
+        download_file(url, output_file, cache_dir=cache_dir, mirror=mirror)
 
 
 # End
@@ -0,0 +1,327 @@
+"""Download files with resume, checksums, and a local cache."""
+
+import os
+import errno
+import hashlib
+from contextlib import contextmanager
+from shutil import copy2
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlparse
+from urllib.request import Request, urlopen
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def sha256sum(path):
+    """Compute the sha256 checksum of a file.
+
+    :param path: Path to the file.
+
+    :return: The sha256 checksum (hexadecimal string).
+    """
+
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def read_checksum(path):
+    """Read the checksum recorded for a file.
+
+    :param path: Path to the file. The checksum is read from the
+        ``path + ".sha256"`` file (``sha256sum`` format).
+
+    :return: The sha256 checksum or ``None`` if there is no checksum
+        file.
+    """
+
+    checksum_file = path + ".sha256"
+    if not os.path.isfile(checksum_file):
+        return None
+    with open(checksum_file, encoding="utf-8") as f:
+        return f.read().split()[0]
+
+
+def write_checksum(path, digest):
+    """Record the checksum of a file.
+
+    :param path: Path to the file. The checksum is written to the
+        ``path + ".sha256"`` file (``sha256sum`` format).
+
+    :param digest: The sha256 checksum of the file.
+    """
+
+    with open(path + ".sha256", "w", encoding="utf-8") as f:
+        f.write(f"{digest}  {os.path.basename(path)}\n")
+
+
+def cache_file(url, cache_dir):
+    """Path of a file in the local cache.
+
+    The cache mirrors the host and path of the url (eg.
+    ``cache_dir/download.geofabrik.de/africa/...``).
+
+    :param url: Url of the file.
+
+    :param cache_dir: Cache directory.
+
+    :return: Path to the file in the cache.
+    """
+
+    u = urlparse(url)
+    return os.path.join(cache_dir, u.netloc, *u.path.lstrip("/").split("/"))
+
+
+def mirror_url(url, mirror):
+    """Url of a file on a mirror.
+
+    The mirror has the same layout as the cache directory (see
+    ``cache_file()``).
+
+    :param url: Url of the file.
+
+    :param mirror: Base url of the mirror (eg.
+        ``file:///data/mirror`` or ``http://localhost:8000``).
+
+    :return: Url of the file on the mirror.
+    """
+
+    u = urlparse(url)
+    return mirror.rstrip("/") + "/" + u.netloc + u.path
+
+
+def not_found(err):
+    """Check if a download error means that the file does not exist.
+
+    :param err: Exception raised when opening the url.
+
+    :return: ``True`` for an HTTP error 404 or a missing local file
+        (``file://`` url), ``False`` otherwise.
+    """
+
+    if isinstance(err, HTTPError):
+        return err.code == 404
+    if isinstance(err, URLError):
+        err = err.reason
+    return (isinstance(err, FileNotFoundError)
+            or getattr(err, "errno", None) == errno.ENOENT)
+
+
+@contextmanager
+def file_lock(lock_file):
+    """Exclusive lock on a file shared between threads and processes.
+
+    The lock is released when the context exits or when the process
+    ends, so that a lock is never left behind by an interrupted
+    download.
+
+    :param lock_file: Path to the lock file (created if needed).
+    """
+
+    with open(lock_file, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def fetch(url, output_file, chunk_size=1 << 20, timeout=60):
+    """Download a url to a file, resuming a partial download.
+
+    Data is downloaded to ``output_file + ".part"``. If this file
+    exists, an HTTP range request is used to download the remaining
+    bytes. If the server does not support range requests, the file is
+    downloaded again from the beginning. The partial file is renamed
+    when the download is complete.
+
+    :param url: Url of the file (``http(s)://`` or ``file://``).
+
+    :param output_file: Path to the output file.
+
+    :param chunk_size: Size of the chunks read from the connection.
+
+    :param timeout: Timeout in seconds for the connection.
+    """
+
+    part_file = output_file + ".part"
+    start = os.path.getsize(part_file) if os.path.isfile(part_file) else 0
+    req = Request(url)
+    if start > 0:
+        req.add_header("Range", f"bytes={start}-")
+    try:
+        resp = urlopen(req, timeout=timeout)
+    except HTTPError as err:
+        # Range not satisfiable: partial file is complete or invalid
+        if err.code != 416:
+            raise
+        os.remove(part_file)
+        return fetch(url, output_file, chunk_size, timeout)
+    with resp:
+        # Append if partial content, else restart
+        mode = "ab" if getattr(resp, "status", None) == 206 else "wb"
+        with open(part_file, mode) as f:
+            for chunk in iter(lambda: resp.read(chunk_size), b""):
+                f.write(chunk)
+    os.replace(part_file, output_file)
+    return None
+
+
+def download_file(url, output_file, sha256=None, cache_dir=None,
+                  mirror=None, timeout=60):
+    """Download a file with resume, checksum, and a local cache.
+
+    The file is taken from the cache directory if it is present. Else,
+    it is downloaded from the mirror (if any) and then from the
+    original url if the mirror fails. Downloaded files are stored in
+    the cache with a ``.sha256`` checksum file, which is used to check
+    the cached copy before it is used. Download is skipped if
+    ``output_file`` already exists.
+
+    :param url: Url of the file.
+
+    :param output_file: Path to the output file.
+
+    :param sha256: Expected sha256 checksum. If ``None``, the checksum
+        is not checked against an expected value.
+
+    :param cache_dir: Local cache directory shared between runs (eg.
+        for several countries). Default to ``None`` (no cache).
+
+    :param mirror: Base url of a mirror with the same layout as the
+        cache directory (see ``mirror_url()``), eg. a ``file://`` url
+        or a local HTTP server. Default to ``None`` (no mirror).
+
+    :param timeout: Timeout in seconds for the connection.
+
+    :return: Path to the output file.
+
+    :raises FileNotFoundError: If the file is not found at the url
+        (HTTP error 404 or missing ``file://`` url), or if it is not
+        found on the mirror and the url cannot be reached (offline).
+    """
+
+    # Check for existing file
+    if os.path.isfile(output_file):
+        return output_file
+
+    # Destination (cache or output file)
+    dest = output_file if cache_dir is None else cache_file(url, cache_dir)
+    dest_dir = os.path.dirname(dest)
+    if dest_dir:
+        os.makedirs(dest_dir, exist_ok=True)
+
+    # One download at a time for a destination (the partial file and
+    # the cache can be shared between threads and processes)
+    with file_lock(dest + ".lock"):
+        download_dest(url, dest, sha256, cache_dir, mirror, timeout)
+    if cache_dir is not None:
+        copy2(dest, output_file)
+    return output_file
+
+
+def download_dest(url, dest, sha256, cache_dir, mirror, timeout):
+    """Download a file to its destination (see ``download_file()``).
+
+    Must be called with a lock on the destination.
+    """
+
+    # Check the cached copy (possibly downloaded by another process
+    # while waiting for the lock)
+    if cache_dir is not None and os.path.isfile(dest):
+        expected = sha256 if sha256 is not None else read_checksum(dest)
+        if expected is None or sha256sum(dest) == expected:
+            return
+        os.remove(dest)
+
+    # Download from mirror, then from url
+    sources = [url] if mirror is None else [mirror_url(url, mirror), url]
+    mirror_missing = False
+    for (i, src) in enumerate(sources):
+        try:
+            fetch(src, dest, timeout=timeout)
+            break
+        except (HTTPError, URLError, OSError) as err:
+            if i < len(sources) - 1:
+                mirror_missing = not_found(err)
+                continue
+            # Not found, or not on the mirror and network unreachable
+            offline = (isinstance(err, URLError)
+                       and not isinstance(err, HTTPError))
+            if not_found(err) or (mirror_missing and offline):
+                msg = f"File not found: {url}."
+                raise FileNotFoundError(msg) from err
+            raise
+
+    # Checksum
+    digest = sha256sum(dest)
+    if sha256 is not None and digest != sha256:
+        os.remove(dest)
+        msg = f"Checksum mismatch for {url}."
+        raise ValueError(msg)
+    if cache_dir is not None:
+        write_checksum(dest, digest)
+
+
+def download_files(files, n_jobs=4, cache_dir=None, mirror=None,
+                   missing_ok=False, timeout=60):
+    """Download several files concurrently.
+
+    :param files: List of tuples (url, output_file) or (url,
+        output_file, sha256).
+
+    :param n_jobs: Number of parallel downloads (threads).
+
+    :param cache_dir: Local cache directory (see ``download_file()``).
+
+    :param mirror: Base url of a mirror (see ``download_file()``).
+
+    :param missing_ok: If ``True``, files which are not found (see
+        ``download_file()``) are skipped. Else, an error is raised.
+
+    :param timeout: Timeout in seconds for the connection.
+
+    :return: List of tuples (url, output_file) for files not found.
+    """
+
+    def download(f):
+        """Download one file."""
+        url, output_file = f[0], f[1]
+        sha256 = f[2] if len(f) > 2 else None
+        try:
+            download_file(url, output_file, sha256=sha256,
+                          cache_dir=cache_dir, mirror=mirror,
+                          timeout=timeout)
+        except FileNotFoundError:
+            if missing_ok:
+                return (url, output_file)
+            raise
+        return None
+
+    n_jobs = 1 if n_jobs is None else max(1, n_jobs)
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        results = list(pool.map(download, files))
+    return [r for r in results if r is not None]
+
+
+# End
@@ -2,11 +2,6 @@
 
 import os
 
-try:
-    from urllib.request import urlretrieve  # Python 3
-except ImportError:
-    from urllib import urlretrieve  # urlretrieve with Python 2
-
 try:
     import importlib.resources as importlib_resources  # Python >= 3.9
 except ImportError:
@@ -15,9 +10,10 @@ except ImportError:
 import pandas as pd
 
 from ...misc import make_dir
+from .download_manager import download_file
 
 
-def download_osm(iso3, output_dir="."):
+def download_osm(iso3, output_dir=".", cache_dir=None, mirror=None):
     """Download OSM data for a country.
 
     Download OpenStreetMap data from Geofabrik.de or OpenStreetMap.fr
@@ -28,6 +24,12 @@ def download_osm(iso3, output_dir="."):
     :param output_dir: Directory where data is downloaded. Default to
         current working directory.
 
+    :param cache_dir: Local cache directory shared between runs (see
+        ``download_file()``). Default to ``None`` (no cache).
+
+    :param mirror: Base url of a local mirror, eg. a ``file://`` url
+        (see ``download_file()``). Default to ``None`` (no mirror).
+
     """
 
     # Create directory
@@ -58,7 +60,7 @@ def download_osm(iso3, output_dir="."):
                 "-latest.osm.pbf",
             ]
             url = "".join(url)
-            urlretrieve(url, fname)
+            download_file(url, fname, cache_dir=cache_dir, mirror=mirror)
         # Else use openstreetmap.fr
         else:
             # Country
@@ -76,7 +78,7 @@ def download_osm(iso3, output_dir="."):
                 ".osm.pbf",
             ]
             url = "".join(url)
-            urlretrieve(url, fname)
+            download_file(url, fname, cache_dir=cache_dir, mirror=mirror)
 
 
 # End
@@ -2,22 +2,15 @@
 
 import os
 
-try:
-    from urllib.request import urlretrieve  # Python 3
-except ImportError:
-    from urllib import urlretrieve  # urlretrieve with Python 2
-try:
-    from urllib.error import HTTPError  # Python 3
-except ImportError:
-    from urllib2 import HTTPError  # HTTPError with Python 2
-
 from ...misc import make_dir
 from ..get_vector_extent import get_vector_extent
 from .tiles_srtm import tiles_srtm
 from .download_gadm import download_gadm
+from .download_manager import download_files
 
 
-def download_srtm(iso3, output_dir="."):
+def download_srtm(iso3, output_dir=".", n_jobs=4, cache_dir=None,
+                  mirror=None):
     """Download SRTM data for a country.
 
     Download SRTM data (Shuttle Radar Topographic Mission v4.1) from
@@ -25,13 +18,21 @@ def download_srtm(iso3, output_dir="."):
     to download the country borders (as a shapefile) from `GADM
     <https://gadm.org>`_. Download is skipped if the shapefile is
     already present. Country borders are used to identify the SRTM
-    tiles to be downloaded.
+    tiles to be downloaded. Tiles are downloaded concurrently.
 
     :param iso3: Country ISO 3166-1 alpha-3 code.
 
     :param output_dir: Directory where data is downloaded. Default to
         current working directory.
 
+    :param n_jobs: Number of parallel downloads.
+
+    :param cache_dir: Local cache directory shared between runs (see
+        ``download_file()``). Default to ``None`` (no cache).
+
+    :param mirror: Base url of a local mirror, eg. a ``file://`` url
+        (see ``download_file()``). Default to ``None`` (no mirror).
+
     """
 
     # Create directory
@@ -44,7 +45,8 @@ def download_srtm(iso3, output_dir="."):
         if os.path.isfile(aoi_file):
             gpkg_file = aoi_file
         else:
-            download_gadm(iso3, gpkg_file)
+            download_gadm(iso3, gpkg_file, cache_dir=cache_dir,
+                          mirror=mirror)
 
     # Compute extent and SRTM tiles
     extent_latlong = get_vector_extent(gpkg_file)
@@ -57,42 +59,33 @@ def download_srtm(iso3, output_dir="."):
     tlong_seq = list(range(tiles_long[0], tiles_long[1] + 1))
     tlat_seq = list(range(tiles_lat[0], tiles_lat[1] + 1))
 
-    # Download SRTM data from CSI CGIAR
-    for (i, tlong_i) in enumerate(tlong_seq):
-        for (j, tlat_j) in enumerate(tlat_seq):
+    # List SRTM tiles
+    files = []
+    for tlong_i in tlong_seq:
+        for tlat_j in tlat_seq:
             # Convert to string
             tlong = str(tlong_i).zfill(2)
             tlat = str(tlat_j).zfill(2)
-            # Check for existing data
             fname = os.path.join(
                 output_dir,
                 "SRTM_V41_" + tlong + "_" + tlat + ".zip"
             )
-            if os.path.isfile(fname) is not True:
-                # Download
-                url = [
-                    "http://srtm.csi.cgiar.org/",
-                    "wp-content/uploads/files/srtm_5x5/TIFF/srtm_",
-                    tlong,
-                    "_",
-                    tlat,
-                    ".zip",
-                ]
-                url = "".join(url)
-                try:
-                    urlretrieve(url, fname)
-                except HTTPError as err:
-                    if err.code == 404:
-                        msg = [
-                            "SRTM not existing for tile: ",
-                            tlong,
-                            "_",
-                            tlat
-                        ]
-                        msg = "".join(msg)
-                        print(msg)
-                    else:
-                        raise
+            url = [
+                "http://srtm.csi.cgiar.org/",
+                "wp-content/uploads/files/srtm_5x5/TIFF/srtm_",
+                tlong,
+                "_",
+                tlat,
+                ".zip",
+            ]
+            files.append(("".join(url), fname))
+
+    # Download SRTM data from CSI CGIAR
+    missing = download_files(files, n_jobs=n_jobs, cache_dir=cache_dir,
+                             mirror=mirror, missing_ok=True)
+    for (url, _) in missing:
+        tile = os.path.splitext(url.split("srtm_", 1)[1])[0]
+        print("SRTM not existing for tile: " + tile)
 
 
 # End
@@ -1,13 +1,115 @@
 """Download WDPA data."""
 
 import os
+from glob import glob
+from shutil import copy2
 
 from pywdpa import get_wdpa
 
 from ...misc import make_dir
+from .download_manager import (
+    sha256sum, read_checksum, write_checksum, file_lock, download_file)
 
+# Files of the shapefile which must be present
+WDPA_EXT = (".shp", ".shx", ".dbf", ".prj")
 
-def download_wdpa(iso3, output_dir="."):
+
+def wdpa_files(directory, iso3):
+    """Files of the shapefile of protected areas in a directory.
+
+    :param directory: Directory.
+
+    :param iso3: Country ISO 3166-1 alpha-3 code.
+
+    :return: List of paths (without checksum, lock, or partial
+        files).
+    """
+
+    files = glob(os.path.join(directory, "pa_" + iso3 + ".*"))
+    return sorted(f for f in files
+                  if not f.endswith((".sha256", ".lock", ".part")))
+
+
+def cached_wdpa(cache_wdpa, iso3):
+    """Files of the shapefile of protected areas in the cache.
+
+    The cached shapefile is used only if all the files in
+    ``WDPA_EXT`` are present and if each file matches its recorded
+    checksum (files are added to the cache with their checksum once
+    complete).
+
+    :param cache_wdpa: WDPA cache directory.
+
+    :param iso3: Country ISO 3166-1 alpha-3 code.
+
+    :return: List of paths or ``None`` if the cache is incomplete or
+        invalid.
+    """
+
+    files = wdpa_files(cache_wdpa, iso3)
+    exts = {os.path.splitext(f)[1] for f in files}
+    if not set(WDPA_EXT) <= exts:
+        return None
+    for ifile in files:
+        expected = read_checksum(ifile)
+        if expected is None or sha256sum(ifile) != expected:
+            return None
+    return files
+
+
+def mirror_wdpa(iso3, output_dir, mirror, timeout=60):
+    """Download the shapefile of protected areas from a mirror.
+
+    The mirror has the same layout as the cache directory (files
+    ``wdpa/pa_<iso3>.<ext>`` with their ``.sha256`` checksum files).
+
+    :param iso3: Country ISO 3166-1 alpha-3 code.
+
+    :param output_dir: Output directory.
+
+    :param mirror: Base url of the mirror.
+
+    :param timeout: Timeout in seconds for the connection.
+
+    :return: ``True`` if the shapefile was downloaded, ``False`` if
+        it is not on the mirror or if the mirror can't be reached.
+    """
+
+    base = mirror.rstrip("/") + "/wdpa/pa_" + iso3
+    for ext in WDPA_EXT + (".cpg",):
+        ofile = os.path.join(output_dir, "pa_" + iso3 + ext)
+        try:
+            download_file(base + ext + ".sha256", ofile + ".sha256",
+                          timeout=timeout)
+            sha256 = read_checksum(ofile)
+            os.remove(ofile + ".sha256")
+            download_file(base + ext, ofile, sha256=sha256,
+                          timeout=timeout)
+        except OSError:
+            # Optional file, or not on the mirror (or offline)
+            if ext in WDPA_EXT:
+                return False
+    return True
+
+
+def get_wdpa_dir(iso3, output_dir):
+    """Download protected areas with ``pywdpa`` in a directory.
+
+    :param iso3: Country ISO 3166-1 alpha-3 code.
+
+    :param output_dir: Output directory.
+    """
+
+    owd = os.getcwd()
+    os.chdir(output_dir)
+    try:
+        get_wdpa(iso3)
+    finally:
+        os.chdir(owd)
+
+
+def download_wdpa(iso3, output_dir=".", cache_dir=None, mirror=None,
+                  timeout=60):
     """Download protected areas.
 
     Protected areas come from the World Database on Protected Areas
@@ -19,6 +121,20 @@ def download_wdpa(iso3, output_dir="."):
     :param output_dir: Directory where shapefiles for protected areas
         are downloaded. Default to current working directory.
 
+    :param cache_dir: Local cache directory shared between runs.
+        Shapefiles are copied from ``cache_dir/wdpa`` if the cached
+        files are complete and match their ``.sha256`` checksum
+        files, and copied there with their checksums after download.
+        Default to ``None`` (no cache).
+
+    :param mirror: Base url of a mirror with the same layout as the
+        cache directory (see ``download_file()``). Shapefiles are
+        downloaded with ``pywdpa`` if they are not on the mirror.
+        Default to ``None`` (no mirror).
+
+    :param timeout: Timeout in seconds for the connection to the
+        mirror.
+
     """
 
     # Create directory
@@ -26,11 +142,35 @@ def download_wdpa(iso3, output_dir="."):
 
     # Check for existing data
     fname = os.path.join(output_dir, "pa_" + iso3 + ".shp")
-    if os.path.isfile(fname) is not True:
-        owd = os.getcwd()
-        os.chdir(output_dir)
-        get_wdpa(iso3)
-        os.chdir(owd)
+    if os.path.isfile(fname):
+        return
+    if cache_dir is None:
+        if mirror is None or not mirror_wdpa(iso3, output_dir, mirror,
+                                             timeout):
+            get_wdpa_dir(iso3, output_dir)
+        return
+
+    # One download at a time for a country (the cache can be shared
+    # between threads and processes)
+    cache_wdpa = os.path.join(cache_dir, "wdpa")
+    make_dir(cache_wdpa)
+    with file_lock(os.path.join(cache_wdpa, "pa_" + iso3 + ".lock")):
+        # Cached shapefiles
+        cached = cached_wdpa(cache_wdpa, iso3)
+        if cached is None:
+            if mirror is None or not mirror_wdpa(iso3, output_dir, mirror,
+                                                 timeout):
+                get_wdpa_dir(iso3, output_dir)
+            # Copy to cache: checksum files are written once the
+            # copy is complete
+            for ifile in wdpa_files(output_dir, iso3):
+                cfile = os.path.join(cache_wdpa, os.path.basename(ifile))
+                copy2(ifile, cfile + ".part")
+                os.replace(cfile + ".part", cfile)
+                write_checksum(cfile, sha256sum(cfile))
+            return
+    for ifile in cached:
+        copy2(ifile, output_dir)
 
 
 # End
@@ -0,0 +1,291 @@
+"""Run data processing tasks as a dependency graph."""
+
+import os
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from .. import __version__
+
+
+def file_hash(path, hashes=None):
+    """Compute the sha256 hash of a file.
+
+    Hashes are cached in the ``hashes`` dictionary with the file size
+    and modification time. The hash is computed again only if the
+    file size or modification time have changed.
+
+    :param path: Path to the file.
+
+    :param hashes: Dictionary with paths as keys and lists [size,
+        mtime_ns, hash] as values. Updated in place.
+
+    :return: The sha256 hash of the file (hexadecimal string).
+    """
+
+    st = os.stat(path)
+    if hashes is not None and path in hashes:
+        size, mtime_ns, digest = hashes[path]
+        if size == st.st_size and mtime_ns == st.st_mtime_ns:
+            return digest
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+    if hashes is not None:
+        hashes[path] = [st.st_size, st.st_mtime_ns, digest]
+    return digest
+
+
+def task_key(task, hashes=None):
+    """Compute a key identifying a task from its inputs and parameters.
+
+    The key is the sha256 hash of the function name, keyword
+    arguments, hashes of input files, and version of the package.
+
+    :param task: Task (see ``run_tasks()``).
+
+    :param hashes: Dictionary of cached file hashes (see
+        ``file_hash()``).
+
+    :return: The key of the task (hexadecimal string).
+    """
+
+    fun = task["fun"]
+    content = {
+        "fun": f"{fun.__module__}.{fun.__qualname__}",
+        "kwargs": task.get("kwargs", {}),
+        "inputs": {f: file_hash(f, hashes)
+                   for f in sorted(task.get("inputs", []))},
+        "version": __version__,
+    }
+    content = json.dumps(content, sort_keys=True, default=str)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def file_stat(path):
+    """Size and modification time of a file.
+
+    :param path: Path to the file.
+
+    :return: List [size, mtime_ns] or ``None`` if the file does not
+        exist.
+    """
+
+    if not os.path.exists(path):
+        return None
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def read_manifest(manifest):
+    """Read a manifest file.
+
+    :param manifest: Path to the manifest file (JSON).
+
+    :return: Dictionary with keys ``files`` (cached file hashes) and
+        ``tasks`` (key and outputs of each task done).
+    """
+
+    if manifest is not None and os.path.isfile(manifest):
+        with open(manifest, encoding="utf-8") as f:
+            content = json.load(f)
+        if content.get("version") == __version__:
+            return content
+    return {"version": __version__, "files": {}, "tasks": {}}
+
+
+def write_manifest(manifest, content):
+    """Write a manifest file atomically.
+
+    :param manifest: Path to the manifest file (JSON).
+
+    :param content: Dictionary to write (see ``read_manifest()``).
+    """
+
+    tmp_file = manifest + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(content, f, indent=1)
+    os.replace(tmp_file, manifest)
+
+
+def task_graph(tasks):
+    """Dependencies between tasks from their input and output files.
+
+    A task depends on the tasks which produce one of its input
+    files.
+
+    :param tasks: List of tasks (dictionaries with keys ``name``,
+        ``fun``, ``kwargs``, ``inputs``, and ``outputs``).
+
+    :return: Dictionary with task names as keys and sets of task
+        names they depend on as values.
+    """
+
+    # Task producing each file
+    producer = {}
+    for task in tasks:
+        for ofile in task.get("outputs", []):
+            if ofile in producer:
+                msg = (f"File {ofile} is produced by tasks "
+                       f"'{producer[ofile]}' and '{task['name']}'.")
+                raise ValueError(msg)
+            producer[ofile] = task["name"]
+
+    # Dependencies
+    deps = {}
+    for task in tasks:
+        deps[task["name"]] = {producer[ifile]
+                              for ifile in task.get("inputs", [])
+                              if ifile in producer}
+        deps[task["name"]].discard(task["name"])
+    return deps
+
+
+def run_tasks(tasks, n_jobs=1, manifest=None, verbose=False):
+    """Run tasks in the order given by their dependencies.
+
+    Each task is a dictionary with the following keys:
+
+    - ``name``: Name of the task.
+    - ``fun``: Function to call (must be importable to be run in a
+      separate process).
+    - ``kwargs``: Dictionary of keyword arguments for ``fun``.
+    - ``inputs``: List of input files.
+    - ``outputs``: List of output files.
+
+    A task is run when all the tasks producing its input files are
+    done. Input files which are not produced by a task must exist
+    before running the tasks. Independent tasks are run concurrently
+    in a pool of ``n_jobs`` processes.
+
+    If a ``manifest`` file is given, a key is recorded for each task
+    done, computed from the hashes of its input files and its
+    parameters (see ``task_key()``). A task is skipped if its key is
+    unchanged and its output files have not been modified since it
+    was run.
+
+    :param tasks: List of tasks.
+
+    :param n_jobs: Number of processes. If <= 1, tasks are run
+        sequentially in the current process.
+
+    :param manifest: Path to a manifest file (JSON) used to skip tasks
+        which are up to date. Default to ``None`` (no cache).
+
+    :param verbose: Logical. Whether to print messages or not. Default
+        to ``False``.
+
+    :return: Dictionary with task names as keys and values returned
+        by the tasks as values (``None`` for skipped tasks).
+    """
+
+    # Check names
+    names = [task["name"] for task in tasks]
+    if len(set(names)) != len(names):
+        msg = "Task names must be unique."
+        raise ValueError(msg)
+    task_dict = {task["name"]: task for task in tasks}
+
+    # Dependencies
+    deps = task_graph(tasks)
+
+    # Check input files which are not produced by tasks
+    produced = {f for task in tasks for f in task.get("outputs", [])}
+    missing = [f for task in tasks for f in task.get("inputs", [])
+               if f not in produced and not os.path.exists(f)]
+    if missing:
+        msg = "Missing input files: " + ", ".join(missing) + "."
+        raise ValueError(msg)
+
+    # Topological order (to detect cycles)
+    order = []
+    remaining = {name: set(d) for (name, d) in deps.items()}
+    while remaining:
+        ready = [name for name in names
+                 if name in remaining and not remaining[name]]
+        if not ready:
+            msg = ("Circular dependencies between tasks: "
+                   + ", ".join(remaining) + ".")
+            raise ValueError(msg)
+        for name in ready:
+            order.append(name)
+            del remaining[name]
+        for d in remaining.values():
+            d.difference_update(ready)
+
+    # Manifest
+    content = read_manifest(manifest)
+    keys = {}
+
+    def up_to_date(name):
+        """Check if a task is up to date and compute its key."""
+        if manifest is None:
+            return False
+        task = task_dict[name]
+        keys[name] = task_key(task, content["files"])
+        record = content["tasks"].get(name)
+        if record is None or record["key"] != keys[name]:
+            return False
+        return all(file_stat(f) is not None and file_stat(f) == stat
+                   for (f, stat) in record["outputs"].items())
+
+    def record_task(name):
+        """Record a task done in the manifest."""
+        if manifest is None:
+            return
+        outputs = task_dict[name].get("outputs", [])
+        content["tasks"][name] = {
+            "key": keys[name],
+            "outputs": {f: file_stat(f) for f in outputs},
+        }
+        write_manifest(manifest, content)
+
+    # Run tasks
+    results = {}
+    done = set()
+    submitted = set()
+    pool = (ProcessPoolExecutor(max_workers=n_jobs)
+            if n_jobs is not None and n_jobs > 1 else None)
+    try:
+        running = {}
+        while len(done) < len(order):
+            # Skip, run, or submit tasks with all dependencies done
+            for name in order:
+                if name in submitted or not deps[name] <= done:
+                    continue
+                submitted.add(name)
+                task = task_dict[name]
+                if up_to_date(name):
+                    if verbose:
+                        print(f"Skip task '{name}' (up to date)")
+                    results[name] = None
+                    done.add(name)
+                    continue
+                if verbose:
+                    print(f"Run task '{name}'")
+                if pool is None:
+                    results[name] = task["fun"](**task.get("kwargs", {}))
+                    done.add(name)
+                    record_task(name)
+                else:
+                    fut = pool.submit(task["fun"], **task.get("kwargs", {}))
+                    running[fut] = name
+            if not running:
+                continue
+            # Wait for one task to finish
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                name = running.pop(fut)
+                results[name] = fut.result()
+                done.add(name)
+                record_task(name)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return results
+
+
+# End
@@ -4,3 +4,9 @@ from .countpix import countpix
 from .miscellaneous import invlogit, make_dir
 from .miscellaneous import makeblock, progress_bar
 from .miscellaneous import make_square, rescale
+from .histogram import hist_block, set_histogram, get_histogram
+from .histogram import set_statistics
+from .histogram import zonal_hist_block
+from .histogram import write_zonal_histogram, read_zonal_histogram
+from .parallel import map_blocks, BlockReader
+from .reclassify import reclassify
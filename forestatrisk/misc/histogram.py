@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+# author          :Ghislain Vieilledent
+# email           :ghislain.vieilledent@cirad.fr, ghislainv@gmail.com
+# web             :https://ecology.ghislainv.fr
+# python_version  :>=3
+# license         :GPLv3
+# ==============================================================================
+
+# Standard library imports
+import os
+
+# Third party imports
+import numpy as np
+
+# Number of values for probabilities rescaled to [1, 65535] (0 is nodata)
+NVALUES = 65536
+
+
+# hist_block
+def hist_block(data):
+    """Count the values of a block of rescaled probabilities.
+
+    :param data: Numpy array of integer values in [0, 65535].
+
+    :return: Numpy array of counts of shape (65536,) with the number
+        of pixels for each value (index 0 for nodata).
+
+    """
+
+    return np.bincount(data.ravel().astype(np.int64), minlength=NVALUES)
+
+
+# zonal_hist_block
+def zonal_hist_block(zone_counts, data, zones, zone_nodata=None):
+    """Add the counts of a block of rescaled probabilities per zone.
+
+    Counts are only stored for the zones which are present in the
+    raster, so that zone identifiers can be sparse or large (e.g.
+    administrative codes). The zones do not need to be known in
+    advance: new zones found in a block are added to the counts.
+    Pixels with negative zone identifiers or with the nodata value of
+    the zone raster are ignored.
+
+    :param zone_counts: Tuple (zone_ids, counts) with the sorted
+        array of zone identifiers and a numpy array of shape (nzone,
+        65536) with counts per zone, or ``None`` for the first block.
+    :param data: Numpy array of integer values in [0, 65535].
+    :param zones: Numpy array of zone identifiers with the same shape
+        as ``data``.
+    :param zone_nodata: Nodata value of the zone raster.
+
+    :return: Updated tuple (zone_ids, counts).
+
+    """
+
+    if zone_counts is None:
+        zone_counts = (np.zeros(0, dtype=np.int64),
+                       np.zeros((0, NVALUES), dtype=np.int64))
+    zone_ids, counts = zone_counts
+    zones = zones.ravel()
+    w = zones >= 0
+    if zone_nodata is not None:
+        w &= zones != zone_nodata
+    zones = zones[w].astype(np.int64)
+    if zones.size == 0:
+        return (zone_ids, counts)
+    # Add new zones
+    block_ids = np.unique(zones)
+    new_ids = np.setdiff1d(block_ids, zone_ids, assume_unique=True)
+    if new_ids.size > 0:
+        all_ids = np.union1d(zone_ids, new_ids)
+        all_counts = np.zeros((all_ids.size, NVALUES), dtype=np.int64)
+        all_counts[np.searchsorted(all_ids, zone_ids)] = counts
+        zone_ids, counts = all_ids, all_counts
+    # Counts for (zone, value) keys present in the block
+    key = np.searchsorted(zone_ids, zones) * NVALUES + data.ravel()[w]
+    keys, nkey = np.unique(key, return_counts=True)
+    counts.reshape(-1)[keys] += nkey
+    return (zone_ids, counts)
+
+
+# set_histogram
+def set_histogram(band, counts):
+    """Save histogram and statistics for a band of probabilities.
+
+    The histogram is saved as the default histogram of the band (in
+    the PAM ``.aux.xml`` sidecar file for GeoTIFF files) with 65535
+    buckets between 0.5 and 65535.5. Statistics (min, max, mean and
+    standard deviation) are computed from the histogram, which avoids
+    a new pass over the raster with ``ComputeStatistics()``.
+
+    :param band: GDAL raster band opened in update mode.
+    :param counts: Numpy array of counts of shape (65536,) as
+        returned by ``hist_block()``.
+
+    """
+
+    counts = np.asarray(counts, dtype=np.int64)
+    band.SetDefaultHistogram(0.5, 65535.5, counts[1:].tolist())
+    # Statistics from histogram
+    set_statistics(band, counts[1:], np.arange(1, NVALUES))
+
+
+# set_statistics
+def set_statistics(band, counts, values):
+    """Save statistics computed from counts of values for a band.
+
+    Statistics (min, max, mean and standard deviation) are computed
+    from the number of pixels for each value, which avoids a new pass
+    over the raster with ``ComputeStatistics()``. Nothing is saved if
+    there are no pixels.
+
+    :param band: GDAL raster band opened in update mode.
+    :param counts: Numpy array of counts (number of valid pixels for
+        each value).
+    :param values: Numpy array of values with the same shape as
+        ``counts``.
+
+    """
+
+    counts = np.asarray(counts)
+    values = np.asarray(values, dtype=np.float64)
+    n = counts.sum()
+    if n > 0:
+        w = np.nonzero(counts)[0]
+        vmin = float(values[w].min())
+        vmax = float(values[w].max())
+        mean = float(np.sum(values * counts) / n)
+        var = float(np.sum(counts * (values - mean) ** 2) / n)
+        band.SetStatistics(vmin, vmax, mean, np.sqrt(var))
+
+
+# get_histogram
+def get_histogram(band):
+    """Get the histogram of a band of probabilities.
+
+    The histogram saved with ``set_histogram()`` (default histogram
+    of the band) is used when it is available. Otherwise, the
+    histogram is computed from the raster data.
+
+    :param band: GDAL raster band of probabilities rescaled to [1,
+        65535] with 0 as nodata value.
+
+    :return: List of counts of length 65535 for values 1 to 65535.
+
+    """
+
+    hist = band.GetDefaultHistogram(force=False)
+    if hist is not None:
+        hmin, hmax, nbuckets, counts = hist
+        if (hmin, hmax, nbuckets) == (0.5, 65535.5, NVALUES - 1):
+            return list(counts)
+    return band.GetHistogram(0.5, 65535.5, NVALUES - 1, 0, 0)
+
+
+# zonal_histogram_file
+def zonal_histogram_file(input_raster):
+    """Name of the sidecar file for zonal histograms.
+
+    :param input_raster: Path to the raster of probabilities.
+
+    :return: Path to the ``.zonehist.npz`` sidecar file.
+
+    """
+
+    return input_raster + ".zonehist.npz"
+
+
+# zone_raster_id
+def zone_raster_id(zone_raster):
+    """Identify a zone raster file.
+
+    :param zone_raster: Path to the zone raster.
+
+    :return: String with the absolute path, size, and modification
+        time of the file.
+
+    """
+
+    st = os.stat(zone_raster)
+    return f"{os.path.abspath(zone_raster)}:{st.st_size}:{st.st_mtime_ns}"
+
+
+# write_zonal_histogram
+def write_zonal_histogram(input_raster, zone_counts, zone_raster):
+    """Save zonal histograms in a sidecar file.
+
+    :param input_raster: Path to the raster of probabilities.
+    :param zone_counts: Tuple (zone_ids, counts) as returned by
+        ``zonal_hist_block()``.
+    :param zone_raster: Path to the zone raster used to compute the
+        counts.
+
+    """
+
+    zone_ids, counts = zone_counts
+    np.savez_compressed(zonal_histogram_file(input_raster),
+                        zone_ids=zone_ids, counts=counts,
+                        zone_raster=zone_raster_id(zone_raster))
+
+
+# read_zonal_histogram
+def read_zonal_histogram(input_raster, zone_raster):
+    """Read zonal histograms from a sidecar file.
+
+    :param input_raster: Path to the raster of probabilities.
+    :param zone_raster: Path to the zone raster.
+
+    :return: Tuple (zone_ids, counts) with the array of zone
+        identifiers and a numpy array of shape (nzone, 65536) with
+        counts per zone (index 0 of the second axis is for nodata),
+        or ``None`` if the sidecar file does not exist, is older than
+        the raster, or was computed with another zone raster (or a
+        modified one).
+
+    """
+
+    ifile = zonal_histogram_file(input_raster)
+    if not os.path.isfile(ifile):
+        return None
+    if os.path.getmtime(ifile) < os.path.getmtime(input_raster):
+        return None
+    with np.load(ifile) as npz:
+        if not {"zone_raster", "zone_ids"} <= set(npz.files):
+            return None
+        if str(npz["zone_raster"]) != zone_raster_id(zone_raster):
+            return None
+        return (npz["zone_ids"], npz["counts"])
+
+
+# End
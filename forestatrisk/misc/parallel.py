@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+# author          :Ghislain Vieilledent
+# email           :ghislain.vieilledent@cirad.fr, ghislainv@gmail.com
+# web             :https://ecology.ghislainv.fr
+# python_version  :>=3
+# license         :GPLv3
+# ==============================================================================
+
+# Standard library imports
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+# Third party imports
+from osgeo import gdal
+
+
+# map_blocks
+def map_blocks(fun, nblock, n_jobs=1):
+    """Apply a function to blocks in parallel threads.
+
+    Results are yielded in block order so that they can be written
+    to a raster (or accumulated) in the calling thread. At most
+    ``2 * n_jobs`` blocks are processed ahead of the block being
+    yielded, which bounds memory use.
+
+    :param fun: Function taking a block number and returning a result.
+    :param nblock: Number of blocks.
+    :param n_jobs: Number of threads. If <= 1, blocks are processed
+        sequentially in the calling thread.
+
+    :return: Generator of results, one per block.
+
+    """
+
+    if n_jobs is None or n_jobs <= 1:
+        for b in range(nblock):
+            yield fun(b)
+        return
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        futures = deque()
+        for b in range(nblock):
+            futures.append(pool.submit(fun, b))
+            if len(futures) >= 2 * n_jobs:
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
+
+
+# BlockReader
+class BlockReader:
+    """Read blocks of a raster band with one GDAL dataset per thread.
+
+    GDAL datasets must not be shared between threads. Each thread
+    opens its own dataset the first time it reads a block.
+
+    :param rasterfile: Path to a raster file.
+    :param band: Band number (from 1).
+
+    """
+
+    def __init__(self, rasterfile, band=1):
+        self.rasterfile = rasterfile
+        self.band = band
+        self.local = threading.local()
+
+    def read(self, x, y, nx, ny):
+        """Read a block of data.
+
+        :param x: Offset on x axis.
+        :param y: Offset on y axis.
+        :param nx: Block size on x axis.
+        :param ny: Block size on y axis.
+
+        :return: Numpy array of data.
+
+        """
+
+        ds = getattr(self.local, "ds", None)
+        if ds is None:
+            ds = gdal.Open(self.rasterfile)
+            self.local.ds = ds
+        return ds.GetRasterBand(self.band).ReadAsArray(x, y, nx, ny)
+
+
+# End
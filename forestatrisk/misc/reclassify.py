@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+# author          :Ghislain Vieilledent
+# email           :ghislain.vieilledent@cirad.fr, ghislainv@gmail.com
+# web             :https://ecology.ghislainv.fr
+# python_version  :>=3
+# license         :GPLv3
+# ==============================================================================
+
+# Standard library imports
+import os
+
+# Third party imports
+import numpy as np
+from osgeo import gdal, gdal_array
+
+# Local application imports
+from .miscellaneous import makeblock, progress_bar
+from .parallel import map_blocks, BlockReader
+from .histogram import NVALUES, set_histogram, set_statistics
+
+
+# lut_statistics
+def lut_statistics(band, lut, cat_counts, nodata=None):
+    """Set statistics of a reclassified band without reading it.
+
+    Output values are ``lut[i]`` for the ``cat_counts[i]`` pixels of
+    category ``i``. Pixels with the nodata value are ignored. When
+    output values are integers in [0, 65535] with 0 as nodata value,
+    the histogram is also saved (see ``set_histogram()``).
+
+    :param band: GDAL raster band opened in update mode.
+    :param lut: Lookup table with the output data type.
+    :param cat_counts: Numpy array with the number of pixels for
+        each category of the input raster.
+    :param nodata: Nodata value of the output raster.
+
+    """
+
+    w = cat_counts > 0
+    if nodata is not None:
+        w &= lut != nodata
+    if np.issubdtype(lut.dtype, np.floating):
+        w &= ~np.isnan(lut)
+    if not w.any():
+        return
+    values = lut[w].astype(np.float64)
+    n = cat_counts[w]
+    if (nodata == 0 and np.issubdtype(lut.dtype, np.integer)
+            and values.min() >= 0 and values.max() < NVALUES):
+        counts = np.bincount(values.astype(np.int64), weights=n,
+                             minlength=NVALUES)
+        set_histogram(band, counts)
+        return
+    set_statistics(band, n, values)
+
+
+# reclassify
+def reclassify(input_raster, lut, output_file="output/reclass.tif",
+               dtype=gdal.GDT_Float32, nodata=None, blk_rows=128,
+               n_jobs=1, verbose=True):
+    """Reclassify a raster of categories with a lookup table.
+
+    Each pixel of the input raster is replaced by ``lut[value]``
+    using ``np.take()``. Blocks are reclassified in ``n_jobs``
+    parallel threads and written in order. Statistics of the output
+    raster are computed from the number of pixels in each category
+    (see ``lut_statistics()``), which avoids a new pass over the
+    output raster.
+
+    :param input_raster: Raster of categories (non-negative integers).
+    :param lut: Lookup table (array-like). Value at index ``i`` is the
+        new value for category ``i``. Its length must be greater than
+        the maximal category of the input raster.
+    :param output_file: Output raster file.
+    :param dtype: GDAL data type of the output raster (e.g.
+        ``gdal.GDT_Float32``).
+    :param nodata: Nodata value of the output raster. If None, no
+        nodata value is set.
+    :param blk_rows: If > 0, number of rows for block (else 256x256).
+    :param n_jobs: Number of threads.
+    :param verbose: Logical. Whether to print messages or not.
+
+    :return: None.
+
+    """
+
+    # Lookup table with output data type
+    np_type = gdal_array.GDALTypeCodeToNumericTypeCode(dtype)
+    lut = np.asarray(lut).astype(np_type)
+
+    # Input raster
+    inR = gdal.Open(input_raster)
+    gt = inR.GetGeoTransform()
+    proj = inR.GetProjection()
+    ncol = inR.RasterXSize
+    nrow = inR.RasterYSize
+    del inR
+
+    # Output raster
+    driver = gdal.GetDriverByName("GTiff")
+    if os.path.isfile(output_file):
+        os.remove(output_file)
+    outR = driver.Create(
+        output_file,
+        ncol,
+        nrow,
+        1,
+        dtype,
+        ["COMPRESS=DEFLATE", "PREDICTOR=2", "BIGTIFF=YES"],
+    )
+    outR.SetGeoTransform(gt)
+    outR.SetProjection(proj)
+    outB = outR.GetRasterBand(1)
+    if nodata is not None:
+        outB.SetNoDataValue(nodata)
+
+    # Make blocks
+    blockinfo = makeblock(input_raster, blk_rows=blk_rows)
+    nblock = blockinfo[0]
+    nblock_x = blockinfo[1]
+    x = blockinfo[3]
+    y = blockinfo[4]
+    nx = blockinfo[5]
+    ny = blockinfo[6]
+    if verbose:
+        print(f"Divide region in {nblock} blocks")
+
+    # Reclassify one block
+    reader = BlockReader(input_raster)
+
+    def reclass_block(b):
+        """Reclassify one block."""
+        px = b % nblock_x
+        py = b // nblock_x
+        data = reader.read(x[px], y[py], nx[px], ny[py])
+        if data.max() >= len(lut) or data.min() < 0:
+            msg = (f"Values of the input raster must be in "
+                   f"[0, {len(lut) - 1}] (length of the lookup table).")
+            raise ValueError(msg)
+        counts = np.bincount(data.ravel().astype(np.int64),
+                             minlength=len(lut))
+        return (np.take(lut, data), counts)
+
+    # Loop on blocks of data
+    if verbose:
+        print("Reclassify raster")
+    cat_counts = np.zeros(len(lut), dtype=np.int64)
+    for (b, (out_data, counts)) in enumerate(map_blocks(reclass_block,
+                                                        nblock, n_jobs)):
+        # Progress bar
+        if verbose:
+            progress_bar(nblock, b + 1)
+        px = b % nblock_x
+        py = b // nblock_x
+        outB.WriteArray(out_data, x[px], y[py])
+        cat_counts += counts
+
+    # Statistics from the number of pixels in each category
+    outB.FlushCache()  # Write cache data to disk
+    lut_statistics(outB, lut, cat_counts, nodata)
+
+    # Dereference driver
+    outB = None
+    del outR
+
+
+# End
@@ -11,6 +11,8 @@
 
 # Standard library imports
 from __future__ import division, print_function  # Python 3 compatibility
+import hashlib
+import os
 import sys
 
 # Third party imports
@@ -18,14 +20,150 @@ import numpy as np
 from osgeo import gdal
 
 
+# vector_hash
+def vector_hash(vector):
+    """Compute the SHA-1 hash of the features of a vector file.
+
+    The hash is computed from the spatial reference and the
+    geometries of the features of each layer, read with OGR. It thus
+    depends on all the files of a multi-file format (e.g. ``.shp``,
+    ``.shx`` and ``.prj`` for shapefiles) and works with GDAL virtual
+    file systems (e.g. ``/vsizip/``).
+
+    :param vector: Path to the vector file.
+
+    :return: Hexadecimal digest.
+
+    """
+
+    h = hashlib.sha1()
+    ds = gdal.OpenEx(vector, gdal.OF_VECTOR)
+    if ds is None:
+        msg = f"Cannot open vector file {vector}."
+        raise ValueError(msg)
+    for i in range(ds.GetLayerCount()):
+        lay = ds.GetLayer(i)
+        srs = lay.GetSpatialRef()
+        h.update((srs.ExportToWkt() if srs is not None else "").encode())
+        lay.ResetReading()
+        for feat in lay:
+            geom = feat.GetGeometryRef()
+            if geom is not None:
+                h.update(bytes(geom.ExportToWkb()))
+            h.update(b"\0")
+    ds = None
+    return h.hexdigest()
+
+
+# cache_load
+def cache_load(cache_dir, key, names):
+    """Load arrays from the neighborhood cache.
+
+    :param cache_dir: Cache directory.
+    :param key: Cache key.
+    :param names: Names of the arrays.
+
+    :return: Tuple of memory-mapped arrays or None if arrays are not
+        in the cache.
+
+    """
+
+    files = [os.path.join(cache_dir, f"{key}_{n}.npy") for n in names]
+    if not all(os.path.isfile(f) for f in files):
+        return None
+    return tuple(np.load(f, mmap_mode="r") for f in files)
+
+
+# cache_save
+def cache_save(cache_dir, key, names, arrays):
+    """Save arrays to the neighborhood cache.
+
+    :param cache_dir: Cache directory.
+    :param key: Cache key.
+    :param names: Names of the arrays.
+    :param arrays: Arrays to save.
+
+    """
+
+    os.makedirs(cache_dir, exist_ok=True)
+    for (n, a) in zip(names, arrays):
+        ofile = os.path.join(cache_dir, f"{key}_{n}.npy")
+        tmp_file = ofile + f".{os.getpid()}.tmp"
+        with open(tmp_file, "wb") as f:
+            np.save(f, a)
+        os.replace(tmp_file, ofile)
+
+
+# cache_key
+def cache_key(*items):
+    """Cache key from items.
+
+    :param items: Items identifying the neighborhood (function name,
+        extent, cell size, rank, projection, vector hash).
+
+    :return: Cache key.
+
+    """
+
+    return hashlib.sha1(repr(items).encode()).hexdigest()
+
+
+# neigh_csr
+def neigh_csr(mask, rank=1, chunk_size=1000000):
+    """Adjacency of cells in a grid in compressed sparse row format.
+
+    Neighbors of each cell are identified with shifted indices. For
+    each cell, neighbors are ordered by row and then by column, as in
+    a loop on the rows and columns of the neighborhood.
+
+    :param mask: Boolean numpy array of shape (nrow, ncol). Only cells
+        with ``True`` values are considered.
+    :param rank: Rank of the neighborhood (1 for chess king's move).
+    :param chunk_size: Number of cells processed at once.
+
+    :return: Tuple of length 2 with (i) number of neighbours for each
+        cell with ``True`` value in the mask (in row-major order), and
+        (ii) adjacent cells as indices in the flattened grid.
+
+    """
+
+    nrow, ncol = mask.shape
+    # Shifts of the neighborhood (without the center cell)
+    around = np.arange(-rank, rank + 1)
+    dy = np.repeat(around, len(around))
+    dx = np.tile(around, len(around))
+    center = (dy == 0) & (dx == 0)
+    dy = dy[~center]
+    dx = dx[~center]
+    # Cells in mask
+    cells = np.flatnonzero(mask)
+    nneigh = []
+    adj = []
+    for start in range(0, len(cells), chunk_size):
+        c = cells[start:start + chunk_size]
+        rows = c[:, None] // ncol + dy[None, :]
+        cols = c[:, None] % ncol + dx[None, :]
+        valid = (rows >= 0) & (rows < nrow) & (cols >= 0) & (cols < ncol)
+        valid[valid] = mask[rows[valid], cols[valid]]
+        nneigh.append(valid.sum(axis=1))
+        adj.append((rows * ncol + cols)[valid])
+    nneigh = np.concatenate(nneigh) if nneigh else np.array([], dtype=int)
+    adj = np.concatenate(adj) if adj else np.array([], dtype=int)
+    return (nneigh.astype(np.int64), adj.astype(np.int64))
+
+
 # cellneigh
-def cellneigh(raster=None, region=None, csize=10, rank=1):
+def cellneigh(raster=None, region=None, csize=10, rank=1, cache_dir=None):
     """Compute number of spatial cells and neighbours.
 
     :param raster: Path to raster file to compute region.
     :param region: List/tuple of region coordinates (east, west, south, north).
     :param csize: Spatial cell size (in km).
     :param rank: Rank of the neighborhood (1 for chess king's move).
+    :param cache_dir: Directory where neighborhoods are cached. The
+        cache key is computed from the region, the cell size and the
+        rank. Cached arrays are loaded memory-mapped (read-only). If
+        None, no cache is used.
 
     :return: Tuple of length 2 with number of neighbours for each cell
         and adjacent cells.
@@ -59,31 +197,28 @@ def cellneigh(raster=None, region=None, csize=10, rank=1):
     ncell = ncol * nrow
     print("... {} cells ({} x {})".format(ncell, nrow, ncol))
 
+    # Neighborhood from cache
+    names = ["nneigh", "adj"]
+    if cache_dir is not None:
+        key = cache_key("cellneigh", Xmin, Xmax, Ymin, Ymax, csize, rank)
+        cached = cache_load(cache_dir, key, names)
+        if cached is not None:
+            print("Load adjacent cells and number of neighbors from cache")
+            return cached
+
     # Adjacent cells and number of neighbors
     print("Identify adjacent cells and compute number of neighbors")
-    nneigh = []
-    adj = []
-    around = np.arange(-rank, rank + 1)
-    for i in range(nrow):
-        for j in range(ncol):
-            bigI = i + around
-            Iprim = bigI[(bigI >= 0) & (bigI < nrow)]
-            bigJ = j + around
-            Jprim = bigJ[(bigJ >= 0) & (bigJ < ncol)]
-            # Disregard the center cell
-            nneigh.append(len(Iprim) * len(Jprim) - 1)
-            for cy in Iprim:
-                for cx in Jprim:
-                    if not (cy == i and cx == j):
-                        adj.append(cy * ncol + cx)
-    nneigh = np.array(nneigh)
-    adj = np.array(adj)
+    mask = np.ones((nrow, ncol), dtype=bool)
+    nneigh, adj = neigh_csr(mask, rank=rank)
+    if cache_dir is not None:
+        cache_save(cache_dir, key, names, (nneigh, adj))
 
     return (nneigh, adj)
 
 
 # cellneigh_ctry
-def cellneigh_ctry(raster=None, region=None, vector=None, csize=10, rank=1):
+def cellneigh_ctry(raster=None, region=None, vector=None, csize=10, rank=1,
+                   cache_dir=None):
     """Compute number of spatial cells and neighbours inside country's
     borders.
 
@@ -93,6 +228,12 @@ def cellneigh_ctry(raster=None, region=None, vector=None, csize=10, rank=1):
     :param vector: Path to vector file with country's borders.
     :param csize: Spatial cell size (in km).
     :param rank: Rank of the neighborhood (1 for chess king's move).
+    :param cache_dir: Directory where neighborhoods are cached. The
+        cache key is computed from the region, the cell size, the
+        rank, the projection of the raster, and the hash of the
+        features of the vector file (see ``vector_hash()``). Cached
+        arrays are loaded memory-mapped (read-only). If None, no cache
+        is used.
 
     :return: Tuple of length 4 with (i) number of neighbours for each
         cell, (ii) adjacent cells, (iii) total number of cells inside
@@ -101,11 +242,13 @@ def cellneigh_ctry(raster=None, region=None, vector=None, csize=10, rank=1):
     """
 
     # Region
+    proj = ""
     if raster is not None:
         r = gdal.Open(raster)
         ncol_r = r.RasterXSize
         nrow_r = r.RasterYSize
         gt = r.GetGeoTransform()
+        proj = r.GetProjection()
         Xmin = gt[0]
         Xmax = gt[0] + gt[1] * ncol_r
         Ymin = gt[3] + gt[5] * nrow_r
@@ -129,6 +272,16 @@ def cellneigh_ctry(raster=None, region=None, vector=None, csize=10, rank=1):
     ncell = ncol * nrow
     print("... {} cells ({} x {})".format(ncell, nrow, ncol))
 
+    # Neighborhood from cache
+    names = ["nneigh", "adj", "cell_in"]
+    if cache_dir is not None:
+        key = cache_key("cellneigh_ctry", Xmin, Xmax, Ymin, Ymax, csize,
+                        rank, proj, vector_hash(vector))
+        cached = cache_load(cache_dir, key, names)
+        if cached is not None:
+            print("Load adjacent cells and number of neighbors from cache")
+            return cached + (ncell,)
+
     # Cells within country borders (rasterizing method)
     cb_ds = gdal.OpenEx(vector, gdal.OF_VECTOR)
     rOptions = gdal.RasterizeOptions(
@@ -149,30 +302,13 @@ def cellneigh_ctry(raster=None, region=None, vector=None, csize=10, rank=1):
 
     # Adjacent cells and number of neighbors
     print("Identify adjacent cells and compute number of neighbors")
-    nneigh = []
-    adj = []
-    adj_sort = []
-    around = np.arange(-rank, rank + 1)
-    for i in range(nrow):
-        for j in range(ncol):
-            if mask[i, j] == 1:
-                bigI = i + around
-                Iprim = bigI[(bigI >= 0) & (bigI < nrow)]
-                bigJ = j + around
-                Jprim = bigJ[(bigJ >= 0) & (bigJ < ncol)]
-                # Loop on potential neighbors
-                nneighbors = 0
-                for cy in Iprim:
-                    for cx in Jprim:
-                        if (not (cy == i and cx == j)) and (mask[cy, cx] == 1):
-                            adj.append(cy * ncol + cx)
-                            nneighbors += 1
-                nneigh.append(nneighbors)
-    nneigh = np.array(nneigh)
-    adj = np.array(adj)
-    for i in adj:
-        adj_sort.append(np.flatnonzero(cell_in == i)[0])
-    adj_sort = np.array(adj_sort)
+    nneigh, adj = neigh_csr(mask == 1, rank=rank)
+    # Reverse lookup from cell in grid to cell inside borders
+    lookup = np.full(ncell, -1, dtype=np.int64)
+    lookup[cell_in] = np.arange(len(cell_in))
+    adj_sort = lookup[adj]
+    if cache_dir is not None:
+        cache_save(cache_dir, key, names, (nneigh, adj_sort, cell_in))
     return (nneigh, adj_sort, cell_in, ncell)
 
 
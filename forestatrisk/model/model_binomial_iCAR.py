@@ -48,7 +48,9 @@ class model_binomial_iCAR(object):
         neighbors (adjacent entities) of each spatial entity. Must be
         of the form c(neighbors of entity 1, neighbors of entity 2,
         ... , neighbors of the last entity). Length of the neighbors
-        vector should be equal to sum(n.neighbors).
+        vector should be equal to sum(n.neighbors). A sparse adjacency
+        matrix (e.g. ``scipy.sparse.csr_matrix``) can also be
+        provided, in which case ``n_neighbors`` is ignored.
 
     :param NA_action: What to do with rows that contain missing
         values (see ``patsy.dmatrices``).
@@ -186,7 +188,9 @@ class model_binomial_iCAR(object):
         neighbors (adjacent entities) of each spatial entity. Must be
         of the form c(neighbors of entity 1, neighbors of entity 2,
         ... , neighbors of the last entity). Length of the neighbors
-        vector should be equal to sum(n.neighbors).
+        vector should be equal to sum(n.neighbors). A sparse adjacency
+        matrix (e.g. ``scipy.sparse.csr_matrix``) can also be
+        provided, in which case ``n_neighbors`` is ignored.
 
         :param NA_action: What to do with rows that contain missing
         values (see ``patsy.dmatrices``).
@@ -273,6 +277,13 @@ class model_binomial_iCAR(object):
         # ====================
 
         self.model_type = "binomial_iCAR"
+
+        # Sparse adjacency matrix
+        if hasattr(neighbors, "tocsr"):
+            adj = neighbors.tocsr().sorted_indices()
+            n_neighbors = np.diff(adj.indptr)
+            neighbors = adj.indices
+
         self.suitability_formula = suitability_formula
         self.data = data
         self.n_neighbors = n_neighbors
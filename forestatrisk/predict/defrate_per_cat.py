@@ -19,6 +19,79 @@ import pandas as pd
 from ..misc import progress_bar, makeblock
 
 
+# defrate_table
+def defrate_table(nfor, ndefor, time_interval, pixel_area):
+    """Table of deforestation rates per category of deforestation risk.
+
+    :param nfor: Numpy array with the number of forest pixels at the
+        beginning of the period for categories 1 to 65535.
+
+    :param ndefor: Numpy array with the number of deforested pixels
+        during the period for categories 1 to 65535.
+
+    :param time_interval: Time interval (in years) of the period.
+
+    :param pixel_area: Pixel area (in ha).
+
+    :return: A pandas DataFrame with deforestation rates per category.
+
+    """
+
+    # Number of deforestation categories
+    n_cat = 65535
+    cat = [c + 1 for c in range(n_cat)]
+
+    # Create a table to save the results
+    data = {"cat": cat, "nfor": nfor, "ndefor": ndefor}
+    df = pd.DataFrame(data)
+
+    # Annual deforestation rates per category (just fo info)
+    df["rate_obs"] = 1 - (1 - df["ndefor"] / df["nfor"]) ** (1 / time_interval)
+
+    # Relative spatial deforestation probability from model
+    df["rate_mod"] = ((df["cat"] - 1) * 999999 / 65534 + 1) * 1e-6
+
+    # Correction factor, either ndefor / sum_i p_i
+    # or theta * nfor / sum_i p_i
+    sum_ndefor = df["ndefor"].sum()
+    sum_pi = (df["nfor"] * df["rate_mod"]).sum()
+    correction_factor = sum_ndefor / sum_pi
+
+    # Absolute deforestation probability
+    df["rate_abs"] = df["rate_mod"] * correction_factor
+
+    # Time interval
+    df["time_interval"] = time_interval
+
+    # Pixel area
+    df["pixel_area"] = pixel_area
+
+    # Deforestation density (ha/pixel/yr)
+    df["defor_dens"] = df["rate_abs"] * pixel_area / time_interval
+
+    return df
+
+
+# fcc_cat_counts
+def fcc_cat_counts(fcc_data, defor_cat_data):
+    """Number of pixels per fcc value and category for one block.
+
+    :param fcc_data: Numpy array of forest cover change (1, 2 or 3,
+        other values are ignored).
+
+    :param defor_cat_data: Numpy array of categories of deforestation
+        risk (0 to 65535) with the same shape as ``fcc_data``.
+
+    :return: Numpy array of shape (4 * 65536,) with the number of
+        pixels for key ``fcc * 65536 + cat``.
+
+    """
+
+    w = (fcc_data > 0) & (fcc_data < 4)
+    key = fcc_data[w].astype(np.int64) * 65536 + defor_cat_data[w]
+    return np.bincount(key, minlength=4 * 65536)
+
+
 # defrate_per_cat
 def defrate_per_cat(fcc_file, riskmap_file, time_interval,
                     period="calibration",
@@ -29,6 +102,11 @@ def defrate_per_cat(fcc_file, riskmap_file, time_interval,
     This function computes the historical deforestation rates for each
     category of spatial deforestation risk.
 
+    Several periods can be provided at once. The number of forest and
+    deforested pixels per category is then computed for all periods
+    in a single pass over the rasters and one table is written per
+    period.
+
     :param fcc_file: Input raster file of forest cover change at three
         dates (123). 1: first period deforestation, 2: second period
         deforestation, 3: remaining forest at the end of the second
@@ -38,15 +116,18 @@ def defrate_per_cat(fcc_file, riskmap_file, time_interval,
         spatial deforestation risk.
 
     :param time_interval: Time interval (in years) for forest cover
-        change observations.
+        change observations. Either a number or a list with one time
+        interval per period.
 
     :param period: Either "calibration" (from t1 to t2), "validation"
         (from t2 to t3), "historical" or "forecast" (full
         historical period from t1 to t3). Default to "calibration".
+        A list of periods can be provided.
 
     :param tab_file_defrate: Path to the ``.csv`` output file with
         estimates of deforestation rates per category of deforestation
-        risk.
+        risk. A list with one file per period must be provided if
+        ``period`` is a list.
 
     :param blk_rows: If > 0, number of rows for computation by block.
 
@@ -54,11 +135,31 @@ def defrate_per_cat(fcc_file, riskmap_file, time_interval,
         to ``True``.
 
     :return: None. A ``.csv`` file with deforestation rates per
-        category of deforestation risk will be created (see
-        ``tab_file_defrate``).
+        category of deforestation risk will be created for each period
+        (see ``tab_file_defrate``).
 
     """
 
+    # ==============================================================
+    # Periods
+    # ==============================================================
+
+    if isinstance(period, str):
+        period = [period]
+    if isinstance(tab_file_defrate, str):
+        tab_file_defrate = [tab_file_defrate]
+    if np.ndim(time_interval) == 0:
+        time_interval = [time_interval] * len(period)
+    if not len(period) == len(tab_file_defrate) == len(time_interval):
+        msg = ("period, tab_file_defrate and time_interval must have "
+               "the same length.")
+        raise ValueError(msg)
+    for p in period:
+        if p not in ["calibration", "validation", "historical", "forecast"]:
+            msg = ("period must be either 'calibration', 'validation', "
+                   "'historical' or 'forecast'.")
+            raise ValueError(msg)
+
     # ==============================================================
     # Input rasters
     # ==============================================================
@@ -86,16 +187,12 @@ def defrate_per_cat(fcc_file, riskmap_file, time_interval,
     ny = blockinfo[6]
 
     # ==============================================
-    # Compute deforestation rates per cat
+    # Number of pixels per fcc value and category
     # ==============================================
 
-    # Number of deforestation categories
-    n_cat = 65535
-    cat = [c + 1 for c in range(n_cat)]
-
-    # Create a table to save the results
-    data = {"cat": cat, "nfor": 0, "ndefor": 0}
-    df = pd.DataFrame(data)
+    # counts[v, c]: number of pixels with fcc value v (1, 2 or 3)
+    # and category c
+    counts = np.zeros(4 * 65536, dtype=np.int64)
 
     # Loop on blocks of data
     for b in range(nblock):
@@ -109,51 +206,37 @@ def defrate_per_cat(fcc_file, riskmap_file, time_interval,
         fcc_data = fcc_band.ReadAsArray(x[px], y[py], nx[px], ny[py])
         defor_cat_data = defor_cat_band.ReadAsArray(
             x[px], y[py], nx[px], ny[py])
-        # Defor data on period
-        if period == "calibration":
-            data_for = defor_cat_data[fcc_data > 0]
-            data_defor = defor_cat_data[fcc_data == 1]
-        elif period == "validation":
-            data_for = defor_cat_data[fcc_data > 1]
-            data_defor = defor_cat_data[fcc_data == 2]
-        elif period in ["historical", "forecast"]:
-            data_for = defor_cat_data[fcc_data > 0]
-            data_defor = defor_cat_data[np.isin(fcc_data, [1, 2])]
-        # nfor_per_cat
-        cat_for = pd.Categorical(data_for.flatten(), categories=cat)
-        df["nfor"] += cat_for.value_counts().values
-        # ndefor_per_cat
-        cat_defor = pd.Categorical(data_defor.flatten(), categories=cat)
-        df["ndefor"] += cat_defor.value_counts().values
+        # Count pixels per (fcc, cat)
+        counts += fcc_cat_counts(fcc_data, defor_cat_data)
 
-    # Annual deforestation rates per category (just fo info)
-    df["rate_obs"] = 1 - (1 - df["ndefor"] / df["nfor"]) ** (1 / time_interval)
+    # Categories 1 to 65535 for each fcc value
+    counts = counts.reshape(4, 65536)[:, 1:]
 
-    # Relative spatial deforestation probability from model
-    df["rate_mod"] = ((df["cat"] - 1) * 999999 / 65534 + 1) * 1e-6
-
-    # Correction factor, either ndefor / sum_i p_i
-    # or theta * nfor / sum_i p_i
-    sum_ndefor = df["ndefor"].sum()
-    sum_pi = (df["nfor"] * df["rate_mod"]).sum()
-    correction_factor = sum_ndefor / sum_pi
-
-    # Absolute deforestation probability
-    df["rate_abs"] = df["rate_mod"] * correction_factor
-
-    # Time interval
-    df["time_interval"] = time_interval
+    # ==============================================
+    # Compute deforestation rates per cat
+    # ==============================================
 
     # Pixel area
     pixel_area = xres * yres / 10000
-    df["pixel_area"] = pixel_area
 
-    # Deforestation density (ha/pixel/yr)
-    df["defor_dens"] = df["rate_abs"] * pixel_area / time_interval
-
-    # Export the table of results
-    df.to_csv(tab_file_defrate, sep=",", header=True,
-              index=False, index_label=False)
+    for (p, ti, ofile) in zip(period, time_interval, tab_file_defrate):
+        # Defor data on period
+        if p == "calibration":
+            nfor = counts[1] + counts[2] + counts[3]
+            ndefor = counts[1]
+        elif p == "validation":
+            nfor = counts[2] + counts[3]
+            ndefor = counts[2]
+        else:
+            nfor = counts[1] + counts[2] + counts[3]
+            ndefor = counts[1] + counts[2]
+
+        # Table of deforestation rates
+        df = defrate_table(nfor, ndefor, ti, pixel_area)
+
+        # Export the table of results
+        df.to_csv(ofile, sep=",", header=True,
+                  index=False, index_label=False)
 
     # Dereference drivers
     del fcc_ds, defor_cat_ds
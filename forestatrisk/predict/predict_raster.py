@@ -25,6 +25,9 @@ from patsy.build import build_design_matrices
 # Local application imports
 from ..misc import rescale
 from ..misc import progress_bar, makeblock
+from ..misc import hist_block, set_histogram, write_zonal_histogram
+from ..misc import zonal_hist_block
+from .predictor import get_model_type, get_predictor
 
 
 # predict_raster
@@ -36,6 +39,9 @@ def predict_raster(
         output_file="predictions.tif",
         blk_rows=128,
         verbose=True,
+        n_jobs=1,
+        chunk_size=100000,
+        input_zone_raster=None,
 ):
     """Predict the spatial probability of deforestation from a
     statistical model.
@@ -45,7 +51,10 @@ def predict_raster(
     can be performed on large geographical areas.
 
     :param model: The model (glm, rf) to predict from. Must have a
-        model.predict_proba() function.
+        model.predict_proba() function. Fast paths are used for
+        ``sklearn.linear_model.LogisticRegression`` (closed-form
+        dot product) and ``sklearn.ensemble.RandomForestClassifier``
+        (chunked float32 tree evaluation) models.
     :param _x_design_info: Design matrix information from patsy.
     :param var_dir: Directory with rasters (.tif) of explicative variables.
     :param input_forest_raster: Path to forest raster (1 for forest).
@@ -53,6 +62,18 @@ def predict_raster(
     :param blk_rows: If > 0, number of rows for computation by block.
     :param verbose: Logical. Whether to print messages or not. Default
         to ``True``.
+    :param n_jobs: Number of threads used to evaluate random forest
+        trees.
+    :param chunk_size: Maximal number of pixels for which predictions
+        are computed at once. This limits the memory used by the
+        model within each block.
+    :param input_zone_raster: Optional path to a raster of zone
+        identifiers (integers) with the same extent and resolution as
+        the forest raster. Negative values and the nodata value of
+        the raster are ignored. If provided, histograms of
+        probabilities per zone are saved in a sidecar file
+        (``output_file + ".zonehist.npz"``), which is used by
+        ``allocate_deforestation_batch()`` with the same zone raster.
 
     """
 
@@ -143,6 +164,18 @@ def predict_raster(
     Pband = Pdrv.GetRasterBand(1)
     Pband.SetNoDataValue(0)
 
+    # Histogram of predictions (overall and per zone)
+    counts = np.zeros(65536, dtype=np.int64)
+    if input_zone_raster is not None:
+        zoneR = gdal.Open(input_zone_raster)
+        zoneB = zoneR.GetRasterBand(1)
+        zone_nodata = zoneB.GetNoDataValue()
+        zone_counts = None
+
+    # Predictor depending on model type
+    mod_type = get_model_type(model)
+    predictor = get_predictor(model, n_jobs=n_jobs, chunk_size=chunk_size)
+
     # Predict by block
     # Message
     if verbose:
@@ -201,27 +234,42 @@ def predict_raster(
         if len(w[0]) > 0:
             # Get X
             (x_new,) = build_design_matrices([_x_design_info], df)
-            if "LogisticRegression" in str(model):
+            if mod_type == "glm":
                 X_new = x_new[:, :-1]
             else:
                 X_new = x_new[:, 1:-1]
             # Get predictions into an array
-            p = model.predict_proba(X_new)[:, 1]
+            p = predictor(X_new)
             # Rescale and return to pred
             pred[w] = rescale(p)
         # Assign prediction to raster
-        pred = pred.reshape(ny[py], nx[px])
+        pred = pred.reshape(ny[py], nx[px]).astype(np.uint16)
         Pband.WriteArray(pred, x[px], y[py])
+        # Update histograms
+        counts += hist_block(pred)
+        if input_zone_raster is not None:
+            zones = zoneB.ReadAsArray(x[px], y[py], nx[px], ny[py])
+            zone_counts = zonal_hist_block(zone_counts, pred, zones,
+                                           zone_nodata)
 
-    # Compute statistics
+    # Save histogram and statistics (avoid new passes over the raster)
     if verbose:
-        print("Compute statistics")
+        print("Save histogram and statistics")
     Pband.FlushCache()  # Write cache data to disk
-    Pband.ComputeStatistics(False)
+    set_histogram(Pband, counts)
 
     # Dereference driver
     Pband = None
     del Pdrv
 
+    # Save zonal histograms
+    if input_zone_raster is not None:
+        zoneB = None
+        del zoneR
+        if zone_counts is None:
+            zone_counts = (np.zeros(0, dtype=np.int64),
+                           np.zeros((0, 65536), dtype=np.int64))
+        write_zonal_histogram(output_file, zone_counts, input_zone_raster)
+
 
 # End
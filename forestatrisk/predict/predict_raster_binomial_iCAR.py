@@ -25,6 +25,8 @@ from patsy.build import build_design_matrices
 # Local application imports
 from ..misc import invlogit, rescale
 from ..misc import progress_bar, makeblock
+from ..misc import hist_block, set_histogram, write_zonal_histogram
+from ..misc import zonal_hist_block
 
 
 # predict_binomial_iCAR
@@ -56,6 +58,7 @@ def predict_raster_binomial_iCAR(
         output_file="output/pred_binomial_iCAR.tif",
         blk_rows=128,
         verbose=True,
+        input_zone_raster=None,
 ):
     """Predict the spatial probability of deforestation from a model.
 
@@ -71,6 +74,13 @@ def predict_raster_binomial_iCAR(
     :param blk_rows: If > 0, number of rows for computation by block.
     :param verbose: Logical. Whether to print messages or not. Default
         to ``True``.
+    :param input_zone_raster: Optional path to a raster of zone
+        identifiers (integers) with the same extent and resolution as
+        the forest raster. Negative values and the nodata value of
+        the raster are ignored. If provided, histograms of
+        probabilities per zone are saved in a sidecar file
+        (``output_file + ".zonehist.npz"``), which is used by
+        ``allocate_deforestation_batch()`` with the same zone raster.
 
     """
 
@@ -161,6 +171,14 @@ def predict_raster_binomial_iCAR(
     Pband = Pdrv.GetRasterBand(1)
     Pband.SetNoDataValue(0)
 
+    # Histogram of predictions (overall and per zone)
+    counts = np.zeros(65536, dtype=np.int64)
+    if input_zone_raster is not None:
+        zoneR = gdal.Open(input_zone_raster)
+        zoneB = zoneR.GetRasterBand(1)
+        zone_nodata = zoneB.GetNoDataValue()
+        zone_counts = None
+
     # Predict by block
     # Message
     if verbose:
@@ -208,18 +226,33 @@ def predict_raster_binomial_iCAR(
             # Rescale and return to pred
             pred[w] = rescale(p)
         # Assign prediction to raster
-        pred = pred.reshape(ny[py], nx[px])
+        pred = pred.reshape(ny[py], nx[px]).astype(np.uint16)
         Pband.WriteArray(pred, x[px], y[py])
+        # Update histograms
+        counts += hist_block(pred)
+        if input_zone_raster is not None:
+            zones = zoneB.ReadAsArray(x[px], y[py], nx[px], ny[py])
+            zone_counts = zonal_hist_block(zone_counts, pred, zones,
+                                           zone_nodata)
 
-    # Compute statistics
+    # Save histogram and statistics (avoid new passes over the raster)
     if verbose:
-        print("Compute statistics")
+        print("Save histogram and statistics")
     Pband.FlushCache()  # Write cache data to disk
-    Pband.ComputeStatistics(False)
+    set_histogram(Pband, counts)
 
     # Dereference driver
     Pband = None
     del Pdrv
 
+    # Save zonal histograms
+    if input_zone_raster is not None:
+        zoneB = None
+        del zoneR
+        if zone_counts is None:
+            zone_counts = (np.zeros(0, dtype=np.int64),
+                           np.zeros((0, 65536), dtype=np.int64))
+        write_zonal_histogram(output_file, zone_counts, input_zone_raster)
+
 
 # End
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+# author          :Ghislain Vieilledent
+# email           :ghislain.vieilledent@cirad.fr, ghislainv@gmail.com
+# web             :https://ecology.ghislainv.fr
+# python_version  :>=3
+# license         :GPLv3
+# ==============================================================================
+
+# Standard library imports
+from concurrent.futures import ThreadPoolExecutor
+
+# Third party imports
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+
+# Local application imports
+from ..misc import invlogit
+
+
+# get_model_type
+def get_model_type(model):
+    """Get the type of a model used for predictions.
+
+    :param model: The model (glm, rf) to predict from.
+
+    :return: ``"glm"`` for a
+        ``sklearn.linear_model.LogisticRegression`` model, ``"rf"``
+        for a ``sklearn.ensemble.RandomForestClassifier`` model, and
+        ``"other"`` otherwise.
+
+    """
+
+    if isinstance(model, LogisticRegression):
+        return "glm"
+    if isinstance(model, RandomForestClassifier):
+        return "rf"
+    return "other"
+
+
+# predict_glm
+def predict_glm(model, X):
+    """Predictions from a logistic regression model.
+
+    Probabilities are computed in closed form with a dot product
+    instead of calling ``model.predict_proba()``.
+
+    :param model: A fitted ``sklearn.linear_model.LogisticRegression``
+        model with two classes.
+    :param X: Numpy array of explicative variables.
+
+    :return: Probabilities for class 1.
+
+    """
+
+    # Linear predictor
+    Xb = np.dot(X, model.coef_[0]) + model.intercept_[0]
+    # Probabilities
+    return invlogit(Xb)
+
+
+# predict_rf
+def predict_rf(model, X, n_jobs=1, chunk_size=100000):
+    """Predictions from a random forest model.
+
+    Trees are evaluated on chunks of at most ``chunk_size``
+    observations with float32 data (the data type used internally by
+    sklearn trees). Tree probabilities are summed in place so that
+    memory use does not depend on the number of trees. Trees are
+    evaluated in ``n_jobs`` parallel threads.
+
+    :param model: A fitted
+        ``sklearn.ensemble.RandomForestClassifier`` model with two
+        classes.
+    :param X: Numpy array of explicative variables.
+    :param n_jobs: Number of threads used to evaluate the trees.
+    :param chunk_size: Maximal number of observations per chunk.
+
+    :return: Probabilities for class 1.
+
+    """
+
+    # Data as float32 C-contiguous array (as expected by sklearn trees)
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    nobs = X.shape[0]
+    trees = model.estimators_
+    ntree = len(trees)
+    n_jobs = 1 if n_jobs is None else max(1, n_jobs)
+    # Trees are split in groups, one per thread
+    groups = np.array_split(np.arange(ntree), min(n_jobs, ntree))
+
+    def sum_proba(group, X_chunk):
+        """Sum of class 1 probabilities over a group of trees."""
+        s = np.zeros(X_chunk.shape[0])
+        for t in group:
+            s += trees[t].predict_proba(X_chunk, check_input=False)[:, 1]
+        return s
+
+    # Predictions by chunk
+    pred = np.zeros(nobs)
+    with ThreadPoolExecutor(max_workers=len(groups)) as pool:
+        for start in range(0, nobs, chunk_size):
+            X_chunk = X[start:start + chunk_size]
+            sums = pool.map(sum_proba, groups, [X_chunk] * len(groups))
+            for s in sums:
+                pred[start:start + chunk_size] += s
+    pred /= ntree
+    return pred
+
+
+# get_predictor
+def get_predictor(model, n_jobs=1, chunk_size=100000):
+    """Get a function computing probabilities from a model.
+
+    This function returns a predictor for the model with a fast path
+    depending on the model type: a closed-form dot product for
+    logistic regression and a chunked float32 tree evaluation for
+    random forests. Other models with a ``predict_proba()`` method
+    are evaluated by chunks of at most ``chunk_size`` observations.
+
+    :param model: The model (glm, rf) to predict from.
+    :param n_jobs: Number of threads used to evaluate random forest
+        trees.
+    :param chunk_size: Maximal number of observations per chunk.
+
+    :return: A function taking a Numpy array of explicative variables
+        and returning the probabilities for class 1.
+
+    """
+
+    # Model type
+    mod_type = get_model_type(model)
+
+    # Logistic regression
+    if mod_type == "glm":
+        return lambda X: predict_glm(model, X)
+
+    # Random forest
+    if mod_type == "rf":
+        return lambda X: predict_rf(model, X, n_jobs=n_jobs,
+                                    chunk_size=chunk_size)
+
+    # Other models
+    def predict_other(X):
+        """Chunked predictions using model.predict_proba()."""
+        pred = np.zeros(X.shape[0])
+        for start in range(0, X.shape[0], chunk_size):
+            X_chunk = X[start:start + chunk_size]
+            pred[start:start + chunk_size] = model.predict_proba(X_chunk)[:, 1]
+        return pred
+
+    return predict_other
+
+
+# End
@@ -11,7 +11,10 @@
 
 from .deforest_diffusion import deforest_diffusion, deforest_diffusion_t_nofor
 from .deforest import deforest
-from .emissions import emissions
+from .deforest_timeseries import deforest_timeseries
+from .emissions import emissions, emissions_mc
+from .emissions_zonal import emissions_zonal
 from .allocate_deforestation import allocate_deforestation
+from .allocate_deforestation import allocate_deforestation_batch
 
 # EOF
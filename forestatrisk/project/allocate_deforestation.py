@@ -3,23 +3,61 @@
 import os
 
 import numpy as np
-from osgeo import gdal
+from osgeo import gdal, ogr, osr
 import pandas as pd
 
 # Local application imports
-from forestatrisk.misc import progress_bar, makeblock
+from forestatrisk.misc import progress_bar, makeblock, get_histogram
+from forestatrisk.misc import reclassify
+from forestatrisk.misc import zonal_hist_block, read_zonal_histogram
 
 opj = os.path.join
 opd = os.path.dirname
 
 
+def compute_defor_dens(df_rate, defor_juris_ha, years_forecast):
+    """Compute deforestation density for each deforestation class.
+
+    :param df_rate: DataFrame with deforestation rates for each
+      deforestation class (columns "cat", "nfor", "rate_mod" and
+      "pixel_area").
+
+    :param defor_juris_ha: Expected deforestation at the
+      jurisdictional level (in hectares).
+
+    :param years_forecast: Length of the forecasting period (in years).
+
+    :return: DataFrame with two new columns "rate_abs" (absolute
+      deforestation rate) and "defor_dens" (deforestation density in
+      ha/pixel/year).
+
+    """
+
+    # Pixel area
+    pixel_area = df_rate.loc[0, "pixel_area"]
+
+    # Correction factor, either ndefor / sum_i p_i
+    # or theta * nfor / sum_i p_i
+    sum_pi = (df_rate["nfor"] * df_rate["rate_mod"]).sum()
+    correction_factor = defor_juris_ha / (pixel_area * sum_pi)
+
+    # Absolute deforestation rate
+    df_rate["rate_abs"] = df_rate["rate_mod"] * correction_factor
+
+    # Deforestation density (ha/pixel/yr)
+    df_rate["defor_dens"] = df_rate["rate_abs"] * pixel_area / years_forecast
+
+    return df_rate
+
+
 def allocate_deforestation(riskmap_juris_file, defor_rate_tab,
                            defor_juris_ha, years_forecast,
                            project_borders,
                            output_file="defor_project.csv",
                            defor_density_map=False,
                            blk_rows=128,
-                           verbose=False):
+                           verbose=False,
+                           n_jobs=1):
     """Allocating deforestation.
 
     :param riskmap_juris_file: Raster file with classes of deforestation
@@ -41,15 +79,18 @@ def allocate_deforestation(riskmap_juris_file, defor_rate_tab,
     :param defor_density_map: Compute the deforestation density map
       for the jurisdiction. Deforestation density is provided in
       ha/pixel/year (hectares of deforestation per pixel per year).
-      Deforestation densities are floating-point numbers. For large
-      jurisdictions (e.g. country scale) and high resolutions (e.g. 30
-      m), this will produce a large raster file which will occupy
-      a large amount of space on disk (e.g. several gigabytes).
+      Deforestation densities are single precision floating-point
+      numbers (Float32). For large jurisdictions (e.g. country scale)
+      and high resolutions (e.g. 30 m), this will produce a large
+      raster file which will occupy a large amount of space on disk.
 
     :param blk_rows: If > 0, number of rows for block (else 256x256).
 
     :param verbose: If True, print messages.
 
+    :param n_jobs: Number of threads used to compute the
+      deforestation density map.
+
     """
 
     # Callback
@@ -75,10 +116,9 @@ def allocate_deforestation(riskmap_juris_file, defor_rate_tab,
     # Compute number of pixels for each class
     # ---------------------------------------
 
-    nvalues = 65535
     with gdal.Open(ofile) as ds:
         band = ds.GetRasterBand(1)
-        counts = band.GetHistogram(0.5, 65535.5, nvalues, 0, 0)
+        counts = get_histogram(band)
     data = {
         "cat": [i + 1 for i in range(65535)],
         "counts": counts}
@@ -91,19 +131,7 @@ def allocate_deforestation(riskmap_juris_file, defor_rate_tab,
     # Compute deforestation density
     # -----------------------------
 
-    # Pixel area
-    pixel_area = df_rate.loc[0, "pixel_area"]
-
-    # Correction factor, either ndefor / sum_i p_i
-    # or theta * nfor / sum_i p_i
-    sum_pi = (df_rate["nfor"] * df_rate["rate_mod"]).sum()
-    correction_factor = defor_juris_ha / (pixel_area * sum_pi)
-
-    # Absolute deforestation rate
-    df_rate["rate_abs"] = df_rate["rate_mod"] * correction_factor
-
-    # Deforestation density (ha/pixel/yr)
-    df_rate["defor_dens"] = df_rate["rate_abs"] * pixel_area / years_forecast
+    df_rate = compute_defor_dens(df_rate, defor_juris_ha, years_forecast)
 
     # Save the df_rate table
     ofile = opj(out_dir, "defrate_cat_forecast.csv")
@@ -135,73 +163,325 @@ def allocate_deforestation(riskmap_juris_file, defor_rate_tab,
     # -----------------------------
 
     if defor_density_map:
-        riskmap_r = gdal.Open(riskmap_juris_file)
-        riskmap_b = riskmap_r.GetRasterBand(1)
-        gt = riskmap_r.GetGeoTransform()
-        proj = riskmap_r.GetProjection()
-        ncol = riskmap_r.RasterXSize
-        nrow = riskmap_r.RasterYSize
-
-        output_file = opj(out_dir, "deforestation_density_map.tif")
-        driver = gdal.GetDriverByName("GTiff")
-        if os.path.isfile(output_file):
-            os.remove(output_file)
-        ddm_r = driver.Create(
-            output_file,
-            ncol,
-            nrow,
-            1,
-            gdal.GDT_Float64,
-            ["COMPRESS=DEFLATE", "PREDICTOR=2", "BIGTIFF=YES"],
-        )
-        ddm_r.SetGeoTransform(gt)
-        ddm_r.SetProjection(proj)
-        ddm_b = ddm_r.GetRasterBand(1)
-        ddm_b.SetNoDataValue(-9999.0)
-
-        # Make blocks
-        blockinfo = makeblock(riskmap_juris_file, blk_rows=blk_rows)
-        nblock = blockinfo[0]
-        nblock_x = blockinfo[1]
-        x = blockinfo[3]
-        y = blockinfo[4]
-        nx = blockinfo[5]
-        ny = blockinfo[6]
+        # Lookup table from risk class to deforestation density
+        lut = np.full(65536, -9999.0, dtype=np.float32)
+        lut[df_rate["cat"].to_numpy()] = df_rate["defor_dens"].to_numpy()
         if verbose:
-            print(f"Divide region in {nblock} blocks")
+            print("Write deforestation density raster")
+        reclassify(
+            riskmap_juris_file, lut,
+            output_file=opj(out_dir, "deforestation_density_map.tif"),
+            dtype=gdal.GDT_Float32,
+            nodata=-9999.0,
+            blk_rows=blk_rows,
+            n_jobs=n_jobs,
+            verbose=verbose)
+
+
+def count_zones(riskmap_juris_file, zone_raster, blk_rows=128,
+                verbose=False):
+    """Number of pixels for each deforestation class and each zone.
+
+    Counts are read from the zonal histogram sidecar file of the risk
+    map when it has been computed with the same zone raster (see
+    ``predict_raster()``). Otherwise, they are computed in one pass
+    over the risk map and the zone raster.
+
+    :param riskmap_juris_file: Raster file with classes of
+      deforestation risk at the jurisdictional level.
 
-        # Write raster of dd
+    :param zone_raster: Raster file of zone identifiers with the same
+      extent and resolution as the risk map.
+
+    :param blk_rows: If > 0, number of rows for block (else 256x256).
+
+    :param verbose: If True, print messages.
+
+    :return: Tuple (zone_ids, counts) with the sorted array of zone
+      identifiers present in the zone raster and a numpy array of
+      shape (nzone, 65536) with counts per zone (index 0 of the second
+      axis is for nodata).
+
+    """
+
+    # Zonal histogram sidecar file
+    counts = read_zonal_histogram(riskmap_juris_file, zone_raster)
+    if counts is not None:
+        if verbose:
+            print("Use zonal histograms of the risk map")
+        return counts
+
+    # Make blocks
+    blockinfo = makeblock(riskmap_juris_file, blk_rows=blk_rows)
+    nblock = blockinfo[0]
+    nblock_x = blockinfo[1]
+    x = blockinfo[3]
+    y = blockinfo[4]
+    nx = blockinfo[5]
+    ny = blockinfo[6]
+    if verbose:
+        print(f"Divide region in {nblock} blocks")
+        print("Compute number of pixels for each class and zone")
+
+    # Loop on blocks of data
+    riskmap_r = gdal.Open(riskmap_juris_file)
+    riskmap_b = riskmap_r.GetRasterBand(1)
+    zone_r = gdal.Open(zone_raster)
+    zone_b = zone_r.GetRasterBand(1)
+    zone_nodata = zone_b.GetNoDataValue()
+    counts = None
+    for b in range(nblock):
+        # Progress bar
         if verbose:
-            print("Write deforestation density raster")
-        # Loop on blocks of data
-        for b in range(nblock):
-            # Progress bar
             progress_bar(nblock, b + 1)
-            # Position in 1D-arrays
-            px = b % nblock_x
-            py = b // nblock_x
-            # Data for one block
-            risk_data = riskmap_b.ReadAsArray(x[px], y[py], nx[px], ny[py])
-            risk_data = risk_data.flatten(order="C")
-            # Get defor density from risk class
-            defor_dens = np.zeros(len(risk_data))
-            defor_dens[risk_data == 0] = -9999.0
-            which_rows = risk_data[risk_data != 0] - 1
-            defor_dens[risk_data != 0] = df_rate.loc[which_rows, "defor_dens"]
-            defor_dens = defor_dens.reshape((ny[py], nx[px]), order="C")
-            # Write deforestation densities
-            ddm_b.WriteArray(defor_dens, x[px], y[py])
-
-        # Compute statistics
+        # Position in 1D-arrays
+        px = b % nblock_x
+        py = b // nblock_x
+        # Data for one block
+        risk_data = riskmap_b.ReadAsArray(x[px], y[py], nx[px], ny[py])
+        zone_data = zone_b.ReadAsArray(x[px], y[py], nx[px], ny[py])
+        counts = zonal_hist_block(counts, risk_data, zone_data,
+                                  zone_nodata)
+
+    # Dereference gdal datasets
+    riskmap_b = None
+    zone_b = None
+    del riskmap_r, zone_r
+
+    if counts is None:
+        counts = (np.zeros(0, dtype=np.int64),
+                  np.zeros((0, 65536), dtype=np.int64))
+    return counts
+
+
+def count_projects(riskmap_juris_file, projects_file, id_field=None,
+                   blk_rows=128, verbose=False):
+    """Number of pixels for each deforestation class and each project.
+
+    Each project polygon is rasterized in memory over the window of
+    the risk map covering its bounding box, by strips of ``blk_rows``
+    rows. Pixels touched by the polygon are included in the project
+    (as with ``CUTLINE_ALL_TOUCHED`` in ``allocate_deforestation()``),
+    so that pixels covered by several overlapping polygons are
+    counted in each project. Features without geometry have no
+    pixels.
+
+    :param riskmap_juris_file: Raster file with classes of
+      deforestation risk at the jurisdictional level.
+
+    :param projects_file: Vector file with one polygon per project.
+
+    :param id_field: Field of the vector file used to identify
+      projects. If None, the feature identifier (FID) is used.
+
+    :param blk_rows: If > 0, number of rows for strips (else 256).
+
+    :param verbose: If True, print messages.
+
+    :return: A tuple (project_ids, counts) with the list of project
+      identifiers and a numpy array of shape (nproject + 1, 65536)
+      with counts per project (from index 1).
+
+    """
+
+    # Risk map
+    riskmap_r = gdal.Open(riskmap_juris_file)
+    riskmap_b = riskmap_r.GetRasterBand(1)
+    gt = riskmap_r.GetGeoTransform()
+    ncol = riskmap_r.RasterXSize
+    nrow = riskmap_r.RasterYSize
+    srs = osr.SpatialReference(wkt=riskmap_r.GetProjection())
+    srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    strip_rows = blk_rows if blk_rows > 0 else 256
+
+    # Projects
+    vect_ds = ogr.Open(projects_file)
+    vect_lay = vect_ds.GetLayer()
+    vect_srs = vect_lay.GetSpatialRef()
+    transform = None
+    if vect_srs is not None and not vect_srs.IsSame(srs):
+        vect_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        transform = osr.CoordinateTransformation(vect_srs, srs)
+    nproject = vect_lay.GetFeatureCount()
+    project_ids = []
+    zone_counts = np.zeros((nproject + 1, 65536), dtype=np.int64)
+
+    if verbose:
+        print("Compute number of pixels for each class and project")
+
+    for (i, feat) in enumerate(vect_lay):
         if verbose:
-            print("Compute statistics")
-        ddm_b.FlushCache()  # Write cache data to disk
-        ddm_b.ComputeStatistics(False)
-
-        # Dereference gdal datasets
-        riskmap_b = None
-        ddm_b = None
-        del riskmap_r, ddm_r
+            progress_bar(nproject, i + 1)
+        project_ids.append(feat.GetField(id_field) if id_field
+                           else feat.GetFID())
+        # Features without geometry have no pixels
+        geom = feat.GetGeometryRef()
+        if geom is None or geom.IsEmpty():
+            continue
+        geom = geom.Clone()
+        if transform is not None:
+            geom.Transform(transform)
+
+        # Window of the risk map (with one pixel margin)
+        xmin, xmax, ymin, ymax = geom.GetEnvelope()
+        x0 = max(int(np.floor((xmin - gt[0]) / gt[1])) - 1, 0)
+        x1 = min(int(np.ceil((xmax - gt[0]) / gt[1])) + 1, ncol)
+        y0 = max(int(np.floor((ymax - gt[3]) / gt[5])) - 1, 0)
+        y1 = min(int(np.ceil((ymin - gt[3]) / gt[5])) + 1, nrow)
+        if x1 <= x0 or y1 <= y0:
+            continue
+
+        # Memory layer with the project polygon
+        mem_ds = ogr.GetDriverByName("Memory").CreateDataSource("project")
+        mem_lay = mem_ds.CreateLayer("project", srs=srs,
+                                     geom_type=ogr.wkbUnknown)
+        mem_feat = ogr.Feature(mem_lay.GetLayerDefn())
+        mem_feat.SetGeometry(geom)
+        mem_lay.CreateFeature(mem_feat)
+        mem_feat = None
+
+        # Rasterize by strips
+        for y in range(y0, y1, strip_rows):
+            ny = min(strip_rows, y1 - y)
+            mask_r = gdal.GetDriverByName("MEM").Create(
+                "", x1 - x0, ny, 1, gdal.GDT_Byte)
+            mask_r.SetGeoTransform((gt[0] + x0 * gt[1], gt[1], gt[2],
+                                    gt[3] + y * gt[5], gt[4], gt[5]))
+            mask_r.SetProjection(srs.ExportToWkt())
+            gdal.RasterizeLayer(mask_r, [1], mem_lay, burn_values=[1],
+                                options=["ALL_TOUCHED=TRUE"])
+            mask = mask_r.GetRasterBand(1).ReadAsArray() == 1
+            del mask_r
+            if not mask.any():
+                continue
+            risk_data = riskmap_b.ReadAsArray(x0, y, x1 - x0, ny)
+            zone_counts[i + 1] += np.bincount(
+                risk_data[mask].astype(np.int64), minlength=65536)
+        mem_lay = None
+        del mem_ds
+
+    # Dereference gdal datasets
+    riskmap_b = None
+    vect_lay = None
+    del riskmap_r, vect_ds
+
+    zone_counts[0] = 0
+    return (project_ids, zone_counts)
+
+
+def allocate_deforestation_batch(riskmap_juris_file, defor_rate_tab,
+                                 defor_juris_ha, years_forecast,
+                                 projects_file,
+                                 id_field=None,
+                                 output_file="defor_projects.csv",
+                                 blk_rows=128,
+                                 verbose=False,
+                                 zone_raster=None):
+    """Allocating deforestation to several projects.
+
+    Project polygons are rasterized in memory and the number of
+    pixels for each deforestation class and each project is computed
+    from the window of the risk map covering each project (see
+    ``count_projects()``). This avoids cropping the risk map to a new
+    raster file for each project as done with
+    ``allocate_deforestation()``.
+
+    Pixels touched by a polygon are included in the project (as with
+    ``CUTLINE_ALL_TOUCHED`` for one project). Pixels covered by
+    several overlapping polygons are counted in each project, so that
+    results are the same as with ``allocate_deforestation()`` for
+    each project.
+
+    Projects can also be given as a raster of zone identifiers
+    (``zone_raster``), each zone > 0 being a project. In this case,
+    the zonal histograms saved with the risk map by
+    ``predict_raster()`` (with ``input_zone_raster=zone_raster``) are
+    used when available, which avoids a new pass over the risk map.
+
+    :param riskmap_juris_file: Raster file with classes of deforestation
+      risk at the jurisdictional level.
+
+    :param defor_rate_tab: CSV file including the table with
+      deforestation rates for each deforestation class.
+
+    :param defor_juris_ha: Expected deforestation at the
+      jurisdictional level (in hectares).
+
+    :param years_forecast: Length of the forecasting period (in years).
+
+    :param projects_file: Vector file with one polygon per project.
+      Can be None if ``zone_raster`` is provided.
+
+    :param id_field: Field of the vector file used to identify
+      projects. If None, the feature identifier (FID) is used.
+
+    :param output_file: Output file with deforestation allocated to
+      each project.
+
+    :param blk_rows: If > 0, number of rows for block (else 256x256).
+
+    :param verbose: If True, print messages.
+
+    :param zone_raster: Raster file of zone identifiers (projects)
+      with the same extent and resolution as the risk map, used
+      instead of ``projects_file``. Zone identifiers <= 0 and the
+      nodata value of the raster are outside projects.
+
+    :return: DataFrame with deforestation allocated to each project
+      (one row per project).
+
+    """
+
+    out_dir = opd(output_file)
+
+    # ---------------------------------------
+    # Number of pixels for each class and zone
+    # ---------------------------------------
+
+    if zone_raster is not None:
+        zone_ids, zone_counts = count_zones(
+            riskmap_juris_file, zone_raster, blk_rows=blk_rows,
+            verbose=verbose)
+        w = (zone_ids > 0) & (zone_counts[:, 1:].sum(axis=1) > 0)
+        project_ids = zone_ids[w].tolist()
+        counts = np.zeros((len(project_ids) + 1, 65536), dtype=np.int64)
+        counts[1:] = zone_counts[w]
+    else:
+        project_ids, counts = count_projects(
+            riskmap_juris_file, projects_file, id_field=id_field,
+            blk_rows=blk_rows, verbose=verbose)
+
+    # -----------------------------
+    # Compute deforestation density
+    # -----------------------------
+
+    # Upload deforestation rates
+    df_rate = pd.read_csv(defor_rate_tab)
+    df_rate = compute_defor_dens(df_rate, defor_juris_ha, years_forecast)
+
+    # Save the df_rate table
+    ofile = opj(out_dir, "defrate_cat_forecast.csv")
+    df_rate.to_csv(ofile)
+
+    # Deforestation density for each class (0 for missing classes)
+    defor_dens = np.zeros(65536)
+    defor_dens[df_rate["cat"].to_numpy()] = (
+        df_rate["defor_dens"].fillna(0).to_numpy())
+
+    # Annual deforestation (ha) for each project
+    defor_projects = counts[1:].dot(defor_dens)
+
+    # Save results
+    data = {
+        "project": project_ids,
+        "annual deforestation (ha)": np.round(defor_projects, 1),
+        "entire deforestation (ha)": np.round(
+            defor_projects * years_forecast, 1),
+    }
+    res = pd.DataFrame(data)
+    res.to_csv(output_file, header=True, index=False)
+
+    return res
 
 
 # # Test
@@ -19,24 +19,224 @@ import numpy as np
 from osgeo import gdal
 
 # Local application imports
-from ..misc import progress_bar, makeblock
+from ..misc import progress_bar, makeblock, get_histogram
+
+
+# find_threshold
+def find_threshold(counts, ndefor):
+    """Find probability thresholds from a histogram of probabilities.
+
+    For each number of pixels to deforest, this function identifies
+    the probability threshold above which (>=) pixels are deforested
+    so that the number of deforested pixels is the closest to the
+    target. Computations use a reverse cumulative sum of the histogram
+    and ``np.searchsorted()`` so that many targets can be processed at
+    once.
+
+    :param counts: Histogram of deforestation probabilities (number
+        of pixels for each value from 1 to 65535).
+    :param ndefor: Number of pixels to deforest. Either an integer or
+        an array of integers.
+
+    :return: A tuple of two elements (with the shape of ``ndefor``):
+        the probability thresholds and the number of deforested
+        pixels.
+
+    """
+
+    counts = np.asarray(counts, dtype=np.int64)
+    nvalues = len(counts)
+    ndefor = np.asarray(ndefor, dtype=np.int64)
+
+    # Reverse cumulative sum: number of pixels with index >= i
+    cum = np.zeros(nvalues + 1, dtype=np.int64)
+    cum[:nvalues] = np.cumsum(counts[::-1])[::-1]
+    nfp = cum[0]
+
+    # Identify threshold: largest index with cum >= ndefor
+    index = nvalues - np.searchsorted(cum[::-1], ndefor, side="left")
+    index = np.clip(index, 0, nvalues - 1)
+
+    # Minimize error
+    diff_inf = ndefor - cum[index + 1]
+    diff_sup = cum[index] - ndefor
+    index = np.where(diff_sup >= diff_inf, index + 1, index)
+
+    # If deforestation >= forest (everything is deforested)
+    index = np.where(ndefor >= nfp, 0, index)
+
+    # Threshold and number of deforested pixels
+    threshold = index + 1
+    ndp = cum[index]
+
+    return (threshold, ndp)
+
+
+# pixel_hash
+def pixel_hash(rows, cols, ncol, seed=1234):
+    """Seeded hash of pixel positions.
+
+    The hash is the splitmix64 finalizer applied to the pixel index in
+    the raster (``row * ncol + col``) shifted by the seed. It is used
+    to break ties deterministically between pixels with the same
+    probability of deforestation.
+
+    :param rows: Numpy array of row indices in the raster.
+    :param cols: Numpy array of column indices in the raster.
+    :param ncol: Number of columns of the raster.
+    :param seed: Seed of the hash.
+
+    :return: Numpy array of hash values of type uint32.
+
+    """
+
+    z = (np.asarray(rows, dtype=np.uint64) * np.uint64(ncol)
+         + np.asarray(cols, dtype=np.uint64))
+    with np.errstate(over="ignore"):
+        z = z + np.uint64(seed) * np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        z = z ^ (z >> np.uint64(31))
+    return (z >> np.uint64(32)).astype(np.uint32)
+
+
+# radix_select
+def radix_select(counts, k):
+    """Select the bucket containing the k-th largest value.
+
+    :param counts: Numpy array of counts per bucket (buckets ordered
+        by increasing values).
+    :param k: Rank (from 1) of the value to select, starting from the
+        largest value.
+
+    :return: A tuple (bucket, k_bucket) with the index of the bucket
+        containing the k-th largest value and the rank of this value
+        inside the bucket.
+
+    """
+
+    cum = np.zeros(len(counts) + 1, dtype=np.int64)
+    cum[:-1] = np.cumsum(np.asarray(counts)[::-1])[::-1]
+    bucket = int(np.nonzero(cum[:-1] >= k)[0][-1])
+    return (bucket, int(k - cum[bucket + 1]))
+
+
+# select_in_category
+def select_in_category(band, value, k, seed, blockinfo):
+    """Find the hash cutoff to deforest k pixels in one category.
+
+    The cutoff on the 32-bit pixel hash is found with two streaming
+    passes over the raster: the first pass counts the 16 high bits of
+    the hash and the second pass counts the 16 low bits inside the
+    selected high bucket. Only one block is in memory at a time.
+
+    :param band: GDAL raster band of probabilities.
+    :param value: Probability category in which pixels are selected.
+    :param k: Number of pixels to select in the category.
+    :param seed: Seed of the pixel hash.
+    :param blockinfo: Block information as returned by ``makeblock()``.
+
+    :return: A tuple (hcut, nties) where pixels with hash > hcut are
+        selected, together with the first ``nties`` pixels (in block
+        order) with hash == hcut.
+
+    """
+
+    nblock, nblock_x, _, x, y, nx, ny = blockinfo
+    ncol = band.XSize
+    high = None
+    for shift in (16, 0):
+        hcounts = np.zeros(65536, dtype=np.int64)
+        for b in range(nblock):
+            px = b % nblock_x
+            py = b // nblock_x
+            data = band.ReadAsArray(x[px], y[py], nx[px], ny[py])
+            r, c = np.nonzero(data == value)
+            h = pixel_hash(r + y[py], c + x[px], ncol, seed)
+            if high is not None:
+                h = h[(h >> 16) == high]
+            hcounts += np.bincount((h >> shift) & 0xFFFF, minlength=65536)
+        bucket, k = radix_select(hcounts, k)
+        if high is None:
+            high = bucket
+    hcut = (high << 16) | bucket
+    return (hcut, k)
+
+
+# deforestation_error
+def deforestation_error(ndp, ndefor, nfp, hectares, surface_pixel):
+    """Error on deforested hectares.
+
+    There is no error if deforestation is larger than the forest
+    cover (everything is deforested). A warning is issued if the
+    error is >= 1%.
+
+    :param ndp: Number of deforested pixels.
+    :param ndefor: Number of pixels to deforest.
+    :param nfp: Number of forest pixels.
+    :param hectares: Number of hectares to deforest.
+    :param surface_pixel: Surface of a pixel (in m2).
+
+    :return: A tuple (error, error_perc) with the error (in ha) and
+        the percentage of error.
+
+    """
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        error = np.where(ndefor < nfp,
+                         (ndp * surface_pixel / 10000.0) - hectares, 0)
+        error_perc = np.where(ndefor < nfp,
+                              np.round(100 * error / hectares, 2), 0.0)
+    error_perc_abs = np.abs(error_perc)
+    if np.any(error_perc_abs >= 1.0):
+        msg = (
+            "The error on deforested area (in ha) is high "
+            "({}% >= 1%). "
+            "This means that the number of categories for the "
+            "deforestation probability [1, 65535] is too low to find "
+            "an accurate probability threshold for deforestation. "
+            "You might either i) reduce the size of the study area, "
+            "or ii) project deforestation on a shorter "
+            "period of time."
+        ).format(np.max(error_perc_abs))
+        warnings.warn(msg)
+    return (error, error_perc)
 
 
 # deforest
-def deforest(input_raster, hectares, output_file="output/fcc.tif", blk_rows=128):
+def deforest(input_raster, hectares, output_file="output/fcc.tif", blk_rows=128,
+             exact=False, seed=1234):
     """Function to map the future forest-cover change.
 
     This function computes the future forest cover map based on (i) a
     raster of probability of deforestation (rescaled from 1 to 65535),
     and (ii) a surface (in hectares) to be deforested.
 
+    A list of surfaces can be provided to compute the probability
+    thresholds for several targets (e.g. Monte Carlo scenarios or
+    yearly targets) from a single histogram. In this case, statistics
+    are returned as arrays and no raster is written (see
+    ``deforest_timeseries()`` to map several targets in one raster).
+
+    Because probabilities are rescaled to 65535 categories, whole
+    categories are deforested and the deforested area can differ from
+    the target. With ``exact=True``, the threshold category is split:
+    pixels of this category are ranked with a seeded hash of their
+    position and only the number of pixels needed to reach the target
+    are deforested. The hash cutoff is found with two streaming passes
+    over the raster.
+
     :param input_raster: Raster of probability of deforestation (1 to 65535
         with 0 as nodata value).
-    :param hectares: Number of hectares to deforest.
+    :param hectares: Number of hectares to deforest. Either a number
+        or a list of numbers.
     :param output_file: Name of the raster file for forest cover map.
     :param blk_rows: If > 0, number of rows for block (else 256x256).
-    :param figsize: Figure size in inches.
-    :param dpi: Resolution for output image.
+    :param exact: If ``True``, deforest exactly the number of pixels
+        corresponding to ``hectares`` by breaking ties inside the
+        threshold category. Only used with one target.
+    :param seed: Seed of the pixel hash used to break ties when
+        ``exact=True``.
 
     :return: A dictionary of statistics (counts, hectares, threshold,
         error, error_perc, ndp, nfp).
@@ -44,7 +244,8 @@ def deforest(input_raster, hectares, output_file="output/fcc.tif", blk_rows=128)
         - counts: histogram of deforestation probabilities.
         - hectares: number of hectares to be deforested.
         - threshold: probability threshold above which (>=) pixels are
-          deforested.
+          deforested. With ``exact=True``, pixels of the threshold
+          category can be partially deforested.
         - error: difference between hectares to be deforested and
           hectares trully deforested (in ha).
         - error_perc: percentage of error (must be < 1%).
@@ -61,70 +262,62 @@ def deforest(input_raster, hectares, output_file="output/fcc.tif", blk_rows=128)
     ncol = probR.RasterXSize
     nrow = probR.RasterYSize
 
+    # Several targets
+    multiple = np.ndim(hectares) > 0
+    hectares_arr = np.asarray(hectares, dtype=float)
+
     # Number of pixels to deforest
     surface_pixel = -gt[1] * gt[5]
-    ndefor = np.around((hectares * 10000) / surface_pixel).astype(int)
+    ndefor = np.around((hectares_arr * 10000) / surface_pixel).astype(int)
 
-    # Compute the histogram of values
-    nvalues = 65535
-    counts = probB.GetHistogram(0.5, 65535.5, nvalues, 0, 0)
+    # Get the histogram of values (saved histogram is used if available)
+    counts = get_histogram(probB)
 
     # Number of forest pixels
     nfp = np.sum(counts)
 
-    # If deforestation < forest
-    if ndefor < nfp:
-        # Identify threshold
-        print("Identify threshold")
-        quant = ndefor / (nfp * 1.0)
-        cS = 0.0
-        cumSum = np.zeros(nvalues, dtype=float)
-        go_on = True
-        for i in np.arange(nvalues - 1, -1, -1):
-            cS += counts[i] / (nfp * 1.0)
-            cumSum[i] = cS
-            if (cS >= quant) & (go_on is True):
-                go_on = False
-                index = i
-                threshold = index + 1
-        # Minimize error
-        print("Minimize error on deforested hectares")
-        diff_inf = ndefor - cumSum[index + 1] * nfp
-        diff_sup = cumSum[index] * nfp - ndefor
-        if diff_sup >= diff_inf:
-            index = index + 1
-            threshold = index + 1
-        # Number of deforested pixels
-        ndp = np.sum(counts[index:])
-
-    # If deforestation > forest (everything is deforested)
-    else:
-        index = 0
-        threshold = 1
-        ndp = nfp
+    # Identify thresholds
+    print("Identify threshold")
+    threshold, ndp = find_threshold(counts, ndefor)
+
+    # Make blocks
+    blockinfo = makeblock(input_raster, blk_rows=blk_rows)
+
+    # Exact number of deforested pixels: the threshold category is
+    # split with the pixel hash (ties broken in block order)
+    hcut = None
+    if exact and not multiple and 0 < ndefor < nfp:
+        cat, k = radix_select(counts, ndefor)
+        if k < counts[cat]:
+            print("Break ties in threshold category")
+            hcut, nties = select_in_category(probB, cat + 1, k, seed,
+                                             blockinfo)
+        threshold = cat + 1
+        ndp = ndefor
 
     # Estimates of error on deforested hectares
-    # If deforestation < forest
-    if ndefor < nfp:
-        error = (ndp * surface_pixel / 10000.0) - hectares
-        error_perc = np.round(100 * error / hectares, 2)
-        error_perc_abs = abs(error_perc)
-        if error_perc_abs >= 1.0:
-            msg = (
-                "The error on deforested area (in ha) is high "
-                "({}% >= 1%). "
-                "This means that the number of categories for the "
-                "deforestation probability [1, 65535] is too low to find "
-                "an accurate probability threshold for deforestation. "
-                "You might either i) reduce the size of the study area, "
-                "or ii) project deforestation on a shorter "
-                "period of time."
-            ).format(error_perc_abs)
-            warnings.warn(msg)
-    # If deforestation > forest (everything is deforested)
-    else:
-        error = 0
-        error_perc = 0.0
+    error, error_perc = deforestation_error(ndp, ndefor, nfp, hectares_arr,
+                                            surface_pixel)
+
+    # Return statistics only if several targets
+    if multiple:
+        del probR
+        stats = {
+            "counts": counts,
+            "hectares": hectares_arr,
+            "threshold": threshold,
+            "error": error,
+            "error_perc": error_perc,
+            "ndp": ndp,
+            "nfp": nfp,
+        }
+        return stats
+
+    # Scalar values for one target
+    threshold = int(threshold)
+    ndp = int(ndp)
+    error = float(error)
+    error_perc = float(error_perc)
 
     # Raster of predictions
     print("Create a raster file on disk for forest-cover change")
@@ -144,8 +337,7 @@ def deforest(input_raster, hectares, output_file="output/fcc.tif", blk_rows=128)
     fccB = fccR.GetRasterBand(1)
     fccB.SetNoDataValue(255)
 
-    # Make blocks
-    blockinfo = makeblock(input_raster, blk_rows=blk_rows)
+    # Blocks
     nblock = blockinfo[0]
     nblock_x = blockinfo[1]
     x = blockinfo[3]
@@ -166,7 +358,16 @@ def deforest(input_raster, hectares, output_file="output/fcc.tif", blk_rows=128)
         # Data for one block
         prob_data = probB.ReadAsArray(x[px], y[py], nx[px], ny[py])
         # Number of pixels that are really deforested
-        deforpix = np.nonzero(prob_data >= threshold)
+        if hcut is None:
+            deforpix = prob_data >= threshold
+        else:
+            deforpix = prob_data > threshold
+            r, c = np.nonzero(prob_data == threshold)
+            h = pixel_hash(r + y[py], c + x[px], ncol, seed)
+            deforpix[r[h > hcut], c[h > hcut]] = True
+            w = np.nonzero(h == hcut)[0][:nties]
+            deforpix[r[w], c[w]] = True
+            nties -= len(w)
         # Forest-cover change
         for_data = np.ones(shape=prob_data.shape).astype(int)
         for_data = for_data * 255  # nodata
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+# author          :Ghislain Vieilledent
+# email           :ghislain.vieilledent@cirad.fr, ghislainv@gmail.com
+# web             :https://ecology.ghislainv.fr
+# python_version  :>=3
+# license         :GPLv3
+# ==============================================================================
+
+# Standard library imports
+import os
+
+# Third party imports
+import numpy as np
+from osgeo import gdal
+
+# Local application imports
+from ..misc import progress_bar, makeblock, get_histogram
+from .deforest import find_threshold, deforestation_error
+
+
+# deforest_timeseries
+def deforest_timeseries(input_raster, hectares_by_year,
+                        output_file="output/defor_year.tif",
+                        blk_rows=128, verbose=True):
+    """Map the year of deforestation for several deforestation targets.
+
+    This function computes the probability thresholds for several
+    cumulative deforestation targets (one per year) from a single
+    histogram of the raster of probability of deforestation. It then
+    writes, in one pass, a raster where each pixel stores the year it
+    is deforested. The forest cover map for a given year can then be
+    derived by comparison: forest pixels at the end of year ``t`` are
+    pixels with value > ``t``.
+
+    Output raster values are:
+
+    - 0: nodata (non-forest pixels),
+    - year: year of deforestation,
+    - 255 (Byte) or 65535 (UInt16): forest pixels which are not
+      deforested at the end of the last year.
+
+    The raster is of type Byte if all years are < 255 (e.g. years
+    numbered from 1) and UInt16 otherwise.
+
+    :param input_raster: Raster of probability of deforestation (1 to
+        65535 with 0 as nodata value).
+    :param hectares_by_year: Cumulative number of hectares deforested
+        at the end of each year. Either a dictionary with years as
+        keys (e.g. ``{2021: 1000, 2022: 2000}``) or a list of
+        cumulative hectares for years 1, 2, ..., n.
+    :param output_file: Name of the raster file for the year of
+        deforestation.
+    :param blk_rows: If > 0, number of rows for block (else 256x256).
+    :param verbose: Logical. Whether to print messages or not. Default
+        to ``True``.
+
+    :return: A dictionary of statistics (years, hectares, threshold,
+        ndp, error, error_perc, nfp). Values are arrays with one
+        element per year.
+
+        - years: years of deforestation.
+        - hectares: cumulative number of hectares to be deforested.
+        - threshold: probability threshold above which (>=) pixels are
+          deforested at the end of each year.
+        - ndp: cumulative number of deforested pixels.
+        - error: difference between hectares to be deforested and
+          hectares trully deforested (in ha).
+        - error_perc: percentage of error.
+        - nfp: number of forest pixels before deforestation.
+
+    """
+
+    # Years and cumulative hectares
+    if isinstance(hectares_by_year, dict):
+        years = np.array(sorted(hectares_by_year.keys()), dtype=int)
+        hectares = np.array([hectares_by_year[i] for i in years],
+                            dtype=float)
+    else:
+        hectares = np.asarray(hectares_by_year, dtype=float)
+        years = np.arange(1, len(hectares) + 1)
+    if np.any(np.diff(hectares) < 0):
+        msg = "Deforested hectares must be cumulative (non-decreasing)."
+        raise ValueError(msg)
+    if np.any(years <= 0) or np.max(years) >= 65535:
+        msg = "Years must be in [1, 65534]."
+        raise ValueError(msg)
+
+    # Output data type
+    if np.max(years) < 255:
+        gdal_type = gdal.GDT_Byte
+        np_type = np.uint8
+        forest_value = 255
+    else:
+        gdal_type = gdal.GDT_UInt16
+        np_type = np.uint16
+        forest_value = 65535
+
+    # Load raster and band
+    probR = gdal.Open(input_raster)
+    probB = probR.GetRasterBand(1)
+    gt = probR.GetGeoTransform()
+    proj = probR.GetProjection()
+    ncol = probR.RasterXSize
+    nrow = probR.RasterYSize
+
+    # Number of pixels to deforest
+    surface_pixel = -gt[1] * gt[5]
+    ndefor = np.around((hectares * 10000) / surface_pixel).astype(int)
+
+    # Thresholds from one histogram
+    if verbose:
+        print("Identify thresholds")
+    counts = get_histogram(probB)
+    nfp = np.sum(counts)
+    threshold, ndp = find_threshold(counts, ndefor)
+    error, error_perc = deforestation_error(ndp, ndefor, nfp, hectares,
+                                            surface_pixel)
+
+    # Lookup table from probability to year of deforestation.
+    # Thresholds decrease with years: we start from the last year so
+    # that earlier years overwrite higher probabilities.
+    lut = np.full(65536, forest_value, dtype=np_type)
+    for (th, yr) in zip(threshold[::-1], years[::-1]):
+        lut[th:] = yr
+    lut[0] = 0
+
+    # Raster of year of deforestation
+    if verbose:
+        print("Create a raster file on disk for year of deforestation")
+    driver = gdal.GetDriverByName("GTiff")
+    if os.path.isfile(output_file):
+        os.remove(output_file)
+    yearR = driver.Create(
+        output_file,
+        ncol,
+        nrow,
+        1,
+        gdal_type,
+        ["COMPRESS=DEFLATE", "PREDICTOR=2", "BIGTIFF=YES"],
+    )
+    yearR.SetGeoTransform(gt)
+    yearR.SetProjection(proj)
+    yearB = yearR.GetRasterBand(1)
+    yearB.SetNoDataValue(0)
+
+    # Make blocks
+    blockinfo = makeblock(input_raster, blk_rows=blk_rows)
+    nblock = blockinfo[0]
+    nblock_x = blockinfo[1]
+    x = blockinfo[3]
+    y = blockinfo[4]
+    nx = blockinfo[5]
+    ny = blockinfo[6]
+    if verbose:
+        print(f"Divide region in {nblock} blocks")
+
+    # Write raster of year of deforestation
+    if verbose:
+        print("Write raster of year of deforestation")
+    # Loop on blocks of data
+    for b in range(nblock):
+        # Progress bar
+        if verbose:
+            progress_bar(nblock, b + 1)
+        # Position in 1D-arrays
+        px = b % nblock_x
+        py = b // nblock_x
+        # Data for one block
+        prob_data = probB.ReadAsArray(x[px], y[py], nx[px], ny[py])
+        # Year of deforestation
+        year_data = np.take(lut, prob_data)
+        yearB.WriteArray(year_data, x[px], y[py])
+
+    # Statistics from histogram (no new pass over the raster)
+    yearB.FlushCache()  # Write cache data to disk
+    if nfp > 0:
+        year_counts = np.bincount(lut[1:], weights=counts)
+        values = np.nonzero(year_counts)[0]
+        mean = np.sum(values * year_counts[values]) / nfp
+        var = np.sum(year_counts[values] * (values - mean) ** 2) / nfp
+        yearB.SetStatistics(float(values[0]), float(values[-1]),
+                            float(mean), float(np.sqrt(var)))
+
+    # Dereference driver
+    yearB = None
+    del yearR, probR
+
+    # Return results
+    stats = {
+        "years": years,
+        "hectares": hectares,
+        "threshold": threshold,
+        "ndp": ndp,
+        "error": error,
+        "error_perc": error_perc,
+        "nfp": nfp,
+    }
+    return stats
+
+
+# End
@@ -11,6 +11,7 @@
 
 # Import
 from __future__ import division, print_function  # Python 3 compatibility
+import uuid
 
 # Third party imports
 import numpy as np
@@ -18,6 +19,7 @@ from osgeo import gdal
 
 # Local application imports
 from ..misc import progress_bar, makeblock
+from ..misc import map_blocks, BlockReader
 
 
 # emissions
@@ -61,15 +63,16 @@ def emissions(
         yRes=-gt[5],
         separate=True,
     )
-    gdal.BuildVRT("/vsimem/var.vrt", raster_list, options=param)
-    stack = gdal.Open("/vsimem/var.vrt")
+    vrt_file = "/vsimem/var_{}.vrt".format(uuid.uuid4().hex)
+    gdal.BuildVRT(vrt_file, raster_list, options=param)
+    stack = gdal.Open(vrt_file)
 
     # NoData value for stocks
     # stocksB = stack.GetRasterBand(2)
     # stocksND = stocksB.GetNoDataValue()
 
     # Make blocks
-    blockinfo = makeblock("/vsimem/var.vrt", blk_rows=blk_rows)
+    blockinfo = makeblock(vrt_file, blk_rows=blk_rows)
     nblock = blockinfo[0]
     nblock_x = blockinfo[1]
     x = blockinfo[3]
@@ -100,6 +103,9 @@ def emissions(
         data_Forest = data[0]
         # Sum of emitted stocks
         sum_Stocks = sum_Stocks + np.sum(data_Stocks[data_Forest == 0])
+    # Remove vrt
+    del stack
+    gdal.Unlink(vrt_file)
     # Pixel area (in ha)
     Area = gt[1] * (-gt[5]) / 10000
     # Carbon emissions in Mg
@@ -110,4 +116,158 @@ def emissions(
     return Carbon
 
 
+# emissions_mc
+def emissions_mc(
+    input_stocks="data/emissions/AGB.tif",
+    input_forest="output/forest_cover_2050.tif",
+    input_stocks_sd=None,
+    stocks_rel_sd=0.0,
+    coefficient=0.47,
+    coefficient_sd=0.0,
+    nsim=1000,
+    level=0.95,
+    seed=1234,
+    blk_rows=128,
+    n_jobs=1,
+    verbose=True,
+):
+    """Uncertainty of the carbon emissions associated to deforestation.
+
+    This function propagates the uncertainty on carbon stocks and on
+    the conversion coefficient to carbon emissions with ``nsim``
+    Monte Carlo realizations. Three sources of uncertainty can be
+    combined:
+
+    - a per-pixel standard deviation of stocks (``input_stocks_sd``),
+      with independent normal errors between pixels,
+    - a global relative error on stocks (``stocks_rel_sd``), common to
+      all pixels,
+    - a standard deviation for the coefficient (``coefficient_sd``).
+
+    Input rasters are read only once. The sum of independent pixel
+    errors follows a normal distribution with variance equal to the
+    sum of pixel variances, so this sum of variances is accumulated
+    by block and realizations are drawn for the total stocks instead
+    of drawing ``nsim`` values for each pixel. Negative values of
+    stocks are not truncated to zero in realizations.
+
+    :param input_stocks: Path to raster of biomass or carbon stocks
+        (in Mg/ha).
+    :param input_forest: Path to forest-cover change raster
+        (0=deforestation).
+    :param input_stocks_sd: Path to raster of standard deviation of
+        stocks (in Mg/ha). If None, no per-pixel error.
+    :param stocks_rel_sd: Global relative standard deviation of stocks
+        (e.g. 0.1 for 10%).
+    :param coefficient: Coefficient to convert stocks in MgC/ha (can
+        be 1).
+    :param coefficient_sd: Standard deviation of the coefficient.
+    :param nsim: Number of Monte Carlo realizations.
+    :param level: Level of the confidence interval.
+    :param seed: Seed for the random number generator.
+    :param blk_rows: If > 0, number of rows for computation by block.
+    :param n_jobs: Number of threads.
+    :param verbose: Logical. Whether to print messages or not.
+
+    :return: A dictionary with the point estimate of emissions
+        (emissions), the mean (mean) and standard deviation (sd) of
+        the realizations, the lower (ci_lower) and upper (ci_upper)
+        bounds of the confidence interval, and the realizations
+        (samples), in MgC.
+
+    """
+
+    # Landscape variables from forest raster
+    forestR = gdal.Open(input_forest)
+    gt = forestR.GetGeoTransform()
+    ncol = forestR.RasterXSize
+    nrow = forestR.RasterYSize
+    del forestR
+    Xmin = gt[0]
+    Xmax = gt[0] + gt[1] * ncol
+    Ymin = gt[3] + gt[5] * nrow
+    Ymax = gt[3]
+
+    # Make vrt (unique name in memory)
+    if verbose:
+        print("Make virtual raster")
+    raster_list = [input_forest, input_stocks]
+    if input_stocks_sd is not None:
+        raster_list.append(input_stocks_sd)
+    vrt_file = "/vsimem/var_{}.vrt".format(uuid.uuid4().hex)
+    param = gdal.BuildVRTOptions(
+        resolution="user",
+        outputBounds=(Xmin, Ymin, Xmax, Ymax),
+        xRes=gt[1],
+        yRes=-gt[5],
+        separate=True,
+    )
+    gdal.BuildVRT(vrt_file, raster_list, options=param)
+
+    # Make blocks
+    blockinfo = makeblock(vrt_file, blk_rows=blk_rows)
+    nblock = blockinfo[0]
+    nblock_x = blockinfo[1]
+    x = blockinfo[3]
+    y = blockinfo[4]
+    nx = blockinfo[5]
+    ny = blockinfo[6]
+    if verbose:
+        print("Divide region in {} blocks".format(nblock))
+
+    # Readers (one per band)
+    readers = [BlockReader(vrt_file, band=i + 1)
+               for i in range(len(raster_list))]
+
+    def sum_block(b):
+        """Sum of stocks and of stock variances for one block."""
+        px = b % nblock_x
+        py = b // nblock_x
+        win = (x[px], y[py], nx[px], ny[py])
+        w = readers[0].read(*win) == 0
+        data_stocks = readers[1].read(*win)[w].astype(np.float64)
+        data_stocks[data_stocks < 0] = 0
+        var_stocks = 0.0
+        if input_stocks_sd is not None:
+            data_sd = readers[2].read(*win)[w].astype(np.float64)
+            data_sd[data_sd < 0] = 0
+            var_stocks = np.sum(data_sd ** 2)
+        return (np.sum(data_stocks), var_stocks)
+
+    # Computation by block
+    if verbose:
+        print("Compute carbon emissions by block")
+    sum_stocks = 0.0
+    sum_var = 0.0
+    for (b, res) in enumerate(map_blocks(sum_block, nblock, n_jobs)):
+        # Progress bar
+        if verbose:
+            progress_bar(nblock, b + 1)
+        sum_stocks += res[0]
+        sum_var += res[1]
+    gdal.Unlink(vrt_file)
+
+    # Pixel area (in ha)
+    Area = gt[1] * (-gt[5]) / 10000
+
+    # Monte Carlo realizations
+    rng = np.random.default_rng(seed)
+    stocks_sim = sum_stocks + np.sqrt(sum_var) * rng.standard_normal(nsim)
+    stocks_sim *= 1 + stocks_rel_sd * rng.standard_normal(nsim)
+    coef_sim = coefficient + coefficient_sd * rng.standard_normal(nsim)
+    samples = stocks_sim * coef_sim * Area
+
+    # Summary of the distribution
+    alpha = (1 - level) / 2
+    stats = {
+        "emissions": sum_stocks * coefficient * Area,
+        "mean": np.mean(samples),
+        "sd": np.std(samples, ddof=1) if nsim > 1 else 0.0,
+        "ci_lower": np.quantile(samples, alpha),
+        "ci_upper": np.quantile(samples, 1 - alpha),
+        "samples": samples,
+    }
+    return stats
+
+
 # End
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+# author          :Ghislain Vieilledent
+# email           :ghislain.vieilledent@cirad.fr, ghislainv@gmail.com
+# web             :https://ecology.ghislainv.fr
+# python_version  :>=3
+# license         :GPLv3
+# ==============================================================================
+
+# Standard library imports
+import uuid
+
+# Third party imports
+import numpy as np
+from osgeo import gdal
+import pandas as pd
+
+# Local application imports
+from ..misc import progress_bar, makeblock
+from ..misc import map_blocks, BlockReader
+
+
+# emissions_zonal
+def emissions_zonal(
+    input_stocks="data/emissions/AGB.tif",
+    input_defor_year="output/defor_year.tif",
+    input_zones=None,
+    coefficient=0.47,
+    output_file=None,
+    blk_rows=128,
+    n_jobs=1,
+    verbose=True,
+):
+    """Carbon emissions by zone and year of deforestation.
+
+    This function computes the carbon emissions associated to future
+    deforestation for each zone (e.g. jurisdictions or projects) and
+    each year of deforestation. The raster of biomass or carbon
+    stocks is read only once: emissions for all zones and years are
+    accumulated in a single pass over blocks, which are processed in
+    ``n_jobs`` parallel threads.
+
+    The raster of year of deforestation can be obtained with
+    ``deforest_timeseries()``: 0 is nodata, values in [1, 254] (Byte)
+    or [1, 65534] (UInt16) are years of deforestation, and 255 (Byte)
+    or 65535 (UInt16) are forest pixels which are not deforested.
+
+    :param input_stocks: Path to raster of biomass or carbon stocks
+        (in Mg/ha).
+    :param input_defor_year: Path to raster of year of deforestation.
+    :param input_zones: Path to raster of zone identifiers (positive
+        integers). Pixels with zone identifiers <= 0 or with the
+        nodata value of the raster are outside zones and are
+        ignored. If None, all pixels belong to zone 0.
+    :param coefficient: Coefficient to convert stocks in MgC/ha (can
+        be 1).
+    :param output_file: Path to a CSV file to save the emissions. If
+        None, emissions are not saved.
+    :param blk_rows: If > 0, number of rows for computation by block.
+    :param n_jobs: Number of threads.
+    :param verbose: Logical. Whether to print messages or not.
+
+    :return: A pandas DataFrame of carbon emissions (in MgC) with one
+        row per zone and one column per year of deforestation.
+
+    """
+
+    # Landscape variables from year of deforestation raster
+    yearR = gdal.Open(input_defor_year)
+    gt = yearR.GetGeoTransform()
+    ncol = yearR.RasterXSize
+    nrow = yearR.RasterYSize
+    year_type = yearR.GetRasterBand(1).DataType
+    del yearR
+    Xmin = gt[0]
+    Xmax = gt[0] + gt[1] * ncol
+    Ymin = gt[3] + gt[5] * nrow
+    Ymax = gt[3]
+
+    # Value for forest pixels which are not deforested
+    nyear = 256 if year_type == gdal.GDT_Byte else 65536
+    forest_value = nyear - 1
+
+    # Make vrt (unique name in memory)
+    if verbose:
+        print("Make virtual raster")
+    raster_list = [input_defor_year, input_stocks]
+    zone_nodata = None
+    if input_zones is not None:
+        raster_list.append(input_zones)
+        with gdal.Open(input_zones) as zoneR:
+            zone_nodata = zoneR.GetRasterBand(1).GetNoDataValue()
+    vrt_file = f"/vsimem/emissions_{uuid.uuid4().hex}.vrt"
+    param = gdal.BuildVRTOptions(
+        resolution="user",
+        outputBounds=(Xmin, Ymin, Xmax, Ymax),
+        xRes=gt[1],
+        yRes=-gt[5],
+        separate=True,
+    )
+    gdal.BuildVRT(vrt_file, raster_list, options=param)
+
+    # Make blocks
+    blockinfo = makeblock(vrt_file, blk_rows=blk_rows)
+    nblock = blockinfo[0]
+    nblock_x = blockinfo[1]
+    x = blockinfo[3]
+    y = blockinfo[4]
+    nx = blockinfo[5]
+    ny = blockinfo[6]
+    if verbose:
+        print(f"Divide region in {nblock} blocks")
+
+    # Readers (one per band)
+    readers = [BlockReader(vrt_file, band=i + 1)
+               for i in range(len(raster_list))]
+
+    def sum_block(b):
+        """Sum of stocks by (zone, year) key for one block."""
+        px = b % nblock_x
+        py = b // nblock_x
+        win = (x[px], y[py], nx[px], ny[py])
+        data_year = readers[0].read(*win)
+        w = (data_year != 0) & (data_year != forest_value)
+        if input_zones is not None:
+            data_zones = readers[2].read(*win)
+            w &= data_zones > 0
+            if zone_nodata is not None:
+                w &= data_zones != zone_nodata
+        if not np.any(w):
+            return None
+        data_stocks = readers[1].read(*win)[w].astype(np.float64)
+        data_stocks[data_stocks < 0] = 0
+        key = data_year[w].astype(np.int64)
+        if input_zones is not None:
+            key += data_zones[w].astype(np.int64) * nyear
+        keys, inverse = np.unique(key, return_inverse=True)
+        return (keys, np.bincount(inverse, weights=data_stocks))
+
+    # Computation by block
+    if verbose:
+        print("Compute carbon emissions by block")
+    sum_stocks = {}
+    for (b, res) in enumerate(map_blocks(sum_block, nblock, n_jobs)):
+        # Progress bar
+        if verbose:
+            progress_bar(nblock, b + 1)
+        if res is None:
+            continue
+        for (k, s) in zip(*res):
+            sum_stocks[k] = sum_stocks.get(k, 0.0) + s
+    gdal.Unlink(vrt_file)
+
+    # Pixel area (in ha)
+    Area = gt[1] * (-gt[5]) / 10000
+
+    # Emissions by zone and year (in MgC)
+    keys = np.array(sorted(sum_stocks.keys()), dtype=np.int64)
+    values = np.array([sum_stocks[k] for k in keys])
+    df = pd.DataFrame({
+        "zone": keys // nyear,
+        "year": keys % nyear,
+        "emissions": values * coefficient * Area,
+    })
+    df = df.pivot(index="zone", columns="year", values="emissions")
+    df = df.fillna(0.0)
+    df.columns.name = None
+
+    # Save emissions
+    if output_file is not None:
+        df.to_csv(output_file, header=True, index=True)
+
+    # Return carbon emissions
+    return df
+
+
+# End
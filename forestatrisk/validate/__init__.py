@@ -9,9 +9,11 @@
 # license         :GPLv3
 # ===================================================================
 
+from .crosstab import crosstab
 from .diffproj import r_diffproj, mat_diffproj
 from .model_validation import computeAUC, accuracy_indices, cross_validation
 from .map_validation import map_validation
+from .map_auc import map_auc
 from .map_accuracy import map_confmat, map_accuracy
 from .resample_sum import resample_sum
 from .validation_npix import validation_npix  # Deprecated function
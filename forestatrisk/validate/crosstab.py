@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+# author          :Ghislain Vieilledent
+# email           :ghislain.vieilledent@cirad.fr, ghislainv@gmail.com
+# web             :https://ecology.ghislainv.fr
+# python_version  :>=3
+# license         :GPLv3
+# ==============================================================================
+
+# Standard library imports
+import os
+
+# Third party imports
+import numpy as np
+from osgeo import gdal
+
+# Local application imports
+from ..misc import progress_bar, makeblock, set_statistics
+from ..misc import map_blocks, BlockReader
+
+
+# check_values
+def check_values(data, nvalues, name):
+    """Check that values of a block are in [0, nvalues - 1].
+
+    :param data: Numpy array of integer values.
+    :param nvalues: Number of possible values.
+    :param name: Name of the raster used in the error message.
+
+    """
+
+    if data.size > 0 and (data.min() < 0 or data.max() >= nvalues):
+        msg = (f"Values of raster '{name}' must be in "
+               f"[0, {nvalues - 1}] (nvalues = {nvalues}).")
+        raise ValueError(msg)
+
+
+# crosstab
+def crosstab(obs, preds, nvalues=256, diff_lut=None, output_files=None,
+             mask_invalid=False, blk_rows=128, n_jobs=1, verbose=True):
+    """Cross-tabulation of rasters of predictions and observations.
+
+    This function computes, in a single pass over the rasters, the
+    number of pixels for each pair of values (pred, obs) for one or
+    several rasters of predictions against the same raster of
+    observations. The raster of observations is read only once. Pairs
+    are encoded as ``pred * nvalues + obs`` and counted with one
+    ``np.bincount`` per block. Blocks are processed in ``n_jobs``
+    parallel threads.
+
+    Optionally, a raster is derived for each prediction from the pair
+    of values with a lookup table (e.g. a raster of differences
+    between predictions and observations).
+
+    Rasters must have the same extent and resolution and integer values
+    in [0, nvalues - 1]. A ``ValueError`` is raised if a value is out
+    of this range, unless ``mask_invalid`` is ``True``.
+
+    :param obs: Path to the raster of observations.
+    :param preds: Path to a raster of predictions or list of paths.
+    :param nvalues: Number of possible values in rasters (256 for
+        Byte rasters).
+    :param diff_lut: Lookup table of length ``nvalues * nvalues``
+        giving the value of the output raster for each pair
+        ``pred * nvalues + obs``. Output values must be in [0, 255].
+    :param output_files: Path (or list of paths, one per prediction)
+        of output rasters computed with ``diff_lut``. Output rasters
+        are of type Byte with 255 as nodata value. Statistics of
+        output rasters are computed from the cross-tabulation.
+    :param mask_invalid: If ``True``, pixels with a value out of [0,
+        nvalues - 1] in the observations or in a prediction are
+        ignored (not counted and set to nodata in output rasters)
+        instead of raising an error.
+    :param blk_rows: If > 0, number of rows for block (else 256x256).
+    :param n_jobs: Number of threads.
+    :param verbose: Logical. Whether to print messages or not.
+
+    :return: A numpy array of shape (nvalues, nvalues) with the number
+        of pixels for each pair of values (predictions on lines and
+        observations on columns) or a list of arrays if ``preds`` is a
+        list.
+
+    """
+
+    # Predictions
+    multiple = not isinstance(preds, str)
+    if not multiple:
+        preds = [preds]
+        if output_files is not None:
+            output_files = [output_files]
+    npred = len(preds)
+    if diff_lut is not None:
+        diff_lut = np.asarray(diff_lut, dtype=np.uint8)
+    write_diff = diff_lut is not None and output_files is not None
+
+    # Landscape variables
+    ds_obs = gdal.Open(obs)
+    gt = ds_obs.GetGeoTransform()
+    ncol = ds_obs.RasterXSize
+    nrow = ds_obs.RasterYSize
+    proj = ds_obs.GetProjection()
+    del ds_obs
+
+    # Make blocks
+    blockinfo = makeblock(obs, blk_rows=blk_rows)
+    nblock = blockinfo[0]
+    nblock_x = blockinfo[1]
+    x = blockinfo[3]
+    y = blockinfo[4]
+    nx = blockinfo[5]
+    ny = blockinfo[6]
+    if verbose:
+        print("Divide region in {} blocks".format(nblock))
+
+    # Output rasters
+    driver = gdal.GetDriverByName("GTiff")
+    ds_out = []
+    band_out = []
+    if write_diff:
+        for ofile in output_files:
+            if os.path.isfile(ofile):
+                os.remove(ofile)
+            ds = driver.Create(
+                ofile,
+                ncol,
+                nrow,
+                1,
+                gdal.GDT_Byte,
+                ["COMPRESS=DEFLATE", "PREDICTOR=2", "BIGTIFF=YES"],
+            )
+            ds.SetGeoTransform(gt)
+            ds.SetProjection(proj)
+            band = ds.GetRasterBand(1)
+            band.SetNoDataValue(255)
+            ds_out.append(ds)
+            band_out.append(band)
+
+    # Readers
+    reader_obs = BlockReader(obs)
+    reader_preds = [BlockReader(p) for p in preds]
+
+    def crosstab_block(b):
+        """Counts (and output data) for one block."""
+        px = b % nblock_x
+        py = b // nblock_x
+        win = (x[px], y[py], nx[px], ny[py])
+        data_obs = reader_obs.read(*win).astype(np.int64)
+        if mask_invalid:
+            valid_obs = (data_obs >= 0) & (data_obs < nvalues)
+        else:
+            check_values(data_obs, nvalues, obs)
+        counts = []
+        diffs = []
+        for (reader, pred) in zip(reader_preds, preds):
+            data_pred = reader.read(*win).astype(np.int64)
+            if not mask_invalid:
+                check_values(data_pred, nvalues, pred)
+            key = data_pred * nvalues + data_obs
+            if not mask_invalid:
+                counts.append(np.bincount(key.ravel(),
+                                          minlength=nvalues * nvalues))
+                if write_diff:
+                    diffs.append(np.take(diff_lut, key))
+                continue
+            valid = valid_obs & (data_pred >= 0) & (data_pred < nvalues)
+            counts.append(np.bincount(key[valid],
+                                      minlength=nvalues * nvalues))
+            if write_diff:
+                diff = np.full(key.shape, 255, dtype=np.uint8)
+                diff[valid] = np.take(diff_lut, key[valid])
+                diffs.append(diff)
+        return (counts, diffs)
+
+    # Loop on blocks of data
+    if verbose:
+        print("Compute cross-tabulation")
+    mats = np.zeros((npred, nvalues * nvalues), dtype=np.int64)
+    for (b, res) in enumerate(map_blocks(crosstab_block, nblock, n_jobs)):
+        # Progress bar
+        if verbose:
+            progress_bar(nblock, b + 1)
+        px = b % nblock_x
+        py = b // nblock_x
+        counts, diffs = res
+        for i in range(npred):
+            mats[i] += counts[i]
+            if write_diff:
+                band_out[i].WriteArray(diffs[i], x[px], y[py])
+
+    # Statistics of output rasters from the cross-tabulation (no new
+    # pass over the rasters), without nodata (255)
+    for (i, band) in enumerate(band_out):
+        band.FlushCache()  # Write cache data to disk
+        out_counts = np.bincount(diff_lut, weights=mats[i], minlength=256)
+        set_statistics(band, out_counts[:255], np.arange(255))
+    band_out = None
+    del ds_out
+
+    # Confusion matrices
+    mats = [m.reshape(nvalues, nvalues) for m in mats]
+    if multiple:
+        return mats
+    return mats[0]
+
+
+# End
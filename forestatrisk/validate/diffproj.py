@@ -11,7 +11,6 @@
 
 # Standard library imports
 from __future__ import division, print_function  # Python 3 compatibility
-import os
 
 # Third party imports
 import numpy as np
@@ -19,103 +18,88 @@ from osgeo import gdal
 
 # Local application imports
 from ..misc import progress_bar, makeblock
+from ..misc import map_blocks, BlockReader
+from .crosstab import crosstab
+
+
+# diffproj_lut
+def diffproj_lut(nvalues=256):
+    """Lookup table for the raster of differences.
+
+    :param nvalues: Number of possible values in rasters.
+
+    :return: Lookup table of length ``nvalues * nvalues`` giving the
+        value of the raster of differences for each pair of values
+        ``A * nvalues + B``.
+
+    """
+
+    # Default to A
+    lut = np.repeat(np.arange(nvalues), nvalues)
+    lut[0 * nvalues + 0] = 0
+    lut[1 * nvalues + 1] = 1
+    # false negative (no pred. deforestation vs. obs. deforestation)
+    lut[1 * nvalues + 0] = 2
+    # false positive (pred. deforestation vs. no obs. deforestation)
+    lut[0 * nvalues + 1] = 3
+    lut[255 * nvalues + 255] = 255
+    return lut
 
 
 # r_diffproj
-def r_diffproj(inputA, inputB, output_file="diffproj.tif", blk_rows=128):
+def r_diffproj(inputA, inputB, output_file="diffproj.tif", blk_rows=128,
+               n_jobs=1):
     """Compute a raster of differences for comparison.
 
     This function compute a raster of differences between two rasters
     of future forest cover. Rasters must have the same extent and resolution.
 
-    :param inputA: Path to first raster (predictions).
+    The confusion matrix is computed in the same pass over the rasters
+    and is returned. Several rasters ``inputA`` can be compared to the
+    same raster ``inputB`` (read only once) by providing lists for
+    ``inputA`` and ``output_file``.
+
+    :param inputA: Path to first raster (predictions) or list of paths.
     :param inputB: Path to second raster of (sd. predictions or observations).
-    :param output_file: Name of the output raster file for differences.
+    :param output_file: Name of the output raster file for differences
+        (or list of names if ``inputA`` is a list).
     :param blk_rows: If > 0, number of rows for computation by block.
+    :param n_jobs: Number of threads.
 
-    """
-
-    # Inputs
-    ds_A = gdal.Open(inputA)
-    band_A = ds_A.GetRasterBand(1)
-    ds_B = gdal.Open(inputB)
-    band_B = ds_B.GetRasterBand(1)
-
-    # Landscape variables from forest raster
-    gt = ds_A.GetGeoTransform()
-    ncol = ds_A.RasterXSize
-    nrow = ds_A.RasterYSize
-    proj = ds_A.GetProjection()
+    :return: A confusion matrix [[n00, n01], [n10, n11]] as returned
+        by ``mat_diffproj()`` for the raster of differences (or a list
+        of matrices if ``inputA`` is a list).
 
-    # Make blocks
-    blockinfo = makeblock(inputA, blk_rows=blk_rows)
-    nblock = blockinfo[0]
-    nblock_x = blockinfo[1]
-    x = blockinfo[3]
-    y = blockinfo[4]
-    nx = blockinfo[5]
-    ny = blockinfo[6]
-    print("Divide region in {} blocks".format(nblock))
-
-    # Raster of predictions
-    print("Create a raster file on disk for projections")
-    driver = gdal.GetDriverByName("GTiff")
-    if os.path.isfile(output_file):
-        os.remove(output_file)
-    ds_out = driver.Create(
-        output_file,
-        ncol,
-        nrow,
-        1,
-        gdal.GDT_Byte,
-        ["COMPRESS=DEFLATE", "PREDICTOR=2", "BIGTIFF=YES"],
-    )
-    ds_out.SetGeoTransform(gt)
-    ds_out.SetProjection(proj)
-    band_out = ds_out.GetRasterBand(1)
-    band_out.SetNoDataValue(255)
+    """
 
-    # Compute differences
-    # Message
+    # Compute differences and cross-tabulation
     print("Compute differences")
-    # Loop on blocks of data
-    for b in range(nblock):
-        # Progress bar
-        progress_bar(nblock, b + 1)
-        # Position in 1D-arrays
-        px = b % nblock_x
-        py = b // nblock_x
-        # Data for one block of the stack (shape = (nband,nrow,ncol))
-        A = band_A.ReadAsArray(x[px], y[py], nx[px], ny[py])
-        B = band_B.ReadAsArray(x[px], y[py], nx[px], ny[py])
-        # Compute differences
-        data_diff = A
-        data_diff[np.where(np.logical_and(A == 0, B == 0))] = 0
-        data_diff[np.where(np.logical_and(A == 1, B == 1))] = 1
-        # false negative (no pred. deforestation vs. obs. deforestation)
-        data_diff[np.where(np.logical_and(A == 1, B == 0))] = 2
-        # false positive (pred. deforestation vs. no obs. deforestation)
-        data_diff[np.where(np.logical_and(A == 0, B == 1))] = 3
-        data_diff[np.where(np.logical_and(A == 255, B == 255))] = 255
-        # Write output data
-        band_out.WriteArray(data_diff, x[px], y[py])
-
-    # Compute statistics
-    print("Compute statistics")
-    band_out.FlushCache()  # Write cache data to disk
-    band_out.ComputeStatistics(False)
-
-    # Build overviews
-    print("Build overviews")
-    ds_out.BuildOverviews("nearest", [4, 8, 16, 32])
-
-    # Dereference driver
-    band_out = None
-    del ds_out
+    lut = diffproj_lut()
+    mats = crosstab(inputB, inputA, diff_lut=lut, output_files=output_file,
+                    blk_rows=blk_rows, n_jobs=n_jobs)
+    multiple = not isinstance(inputA, str)
+    if not multiple:
+        mats = [mats]
+        output_file = [output_file]
+
+    conf_mats = []
+    for (M, ofile) in zip(mats, output_file):
+        # Build overviews
+        print("Build overviews")
+        ds_out = gdal.Open(ofile, gdal.GA_Update)
+        ds_out.BuildOverviews("nearest", [4, 8, 16, 32])
+        del ds_out
+        # Confusion matrix from number of pixels per difference value
+        n = np.bincount(lut, weights=M.ravel(), minlength=256).astype(int)
+        conf_mats.append(np.array([[n[0], n[3]], [n[2], n[1]]]))
+
+    if multiple:
+        return conf_mats
+    return conf_mats[0]
 
 
 # mat_diffproj
-def mat_diffproj(input_raster, blk_rows=128):
+def mat_diffproj(input_raster, blk_rows=128, n_jobs=1):
     """Compute a confusion matrix from a raster of differences.
 
     This function computes a confusion matrix from a raster of
@@ -124,15 +108,13 @@ def mat_diffproj(input_raster, blk_rows=128):
 
     :param input_raster: Raster of differences obtain with
         forestatrisk.r_projdiff.
+    :param blk_rows: If > 0, number of rows for computation by block.
+    :param n_jobs: Number of threads.
 
     :return: A confusion matrix. [[np00, np01], [np10, np11]].
 
     """
 
-    # Inputs
-    ds = gdal.Open(input_raster)
-    band = ds.GetRasterBand(1)
-
     # Make blocks
     blockinfo = makeblock(input_raster, blk_rows=blk_rows)
     nblock = blockinfo[0]
@@ -143,29 +125,28 @@ def mat_diffproj(input_raster, blk_rows=128):
     ny = blockinfo[6]
     print("Divide region in {} blocks".format(nblock))
 
-    # Confusion matrix
-    n00 = n11 = n10 = n01 = 0
+    # Number of pixels per value for one block
+    reader = BlockReader(input_raster)
+
+    def count_block(b):
+        """Number of pixels per value for one block."""
+        px = b % nblock_x
+        py = b // nblock_x
+        data_diff = reader.read(x[px], y[py], nx[px], ny[py])
+        return np.bincount(data_diff.ravel(), minlength=256)[:256]
 
     # Compute differences
     # Message
     print("Compute confusion matrix")
+    n = np.zeros(256, dtype=np.int64)
     # Loop on blocks of data
-    for b in range(nblock):
+    for (b, counts) in enumerate(map_blocks(count_block, nblock, n_jobs)):
         # Progress bar
         progress_bar(nblock, b + 1)
-        # Position in 1D-arrays
-        px = b % nblock_x
-        py = b // nblock_x
-        # Data for one block of the stack (shape = (nband,nrow,ncol))
-        data_diff = band.ReadAsArray(x[px], y[py], nx[px], ny[py])
-        # Confusion matrix
-        n00 += (data_diff == 0).sum()
-        n11 += (data_diff == 1).sum()
-        n10 += (data_diff == 2).sum()
-        n01 += (data_diff == 3).sum()
+        n += counts
 
     # Return confusion matrix
-    conf_mat = np.array([[n00, n01], [n10, n11]])
+    conf_mat = np.array([[n[0], n[3]], [n[2], n[1]]])
     return conf_mat
 
 
@@ -11,6 +11,7 @@
 
 # Standard library imports
 from __future__ import division, print_function  # Python 3 compatibility
+import uuid
 
 # Third party imports
 import numpy as np
@@ -18,10 +19,11 @@ from osgeo import gdal
 
 # Local application imports
 from ..misc import progress_bar, makeblock
+from ..misc import map_blocks, BlockReader
 
 
 # Percentage_correct
-def map_confmat(r_obs0, r_obs1, r_pred0, r_pred1, blk_rows=0):
+def map_confmat(r_obs0, r_obs1, r_pred0, r_pred1, blk_rows=0, n_jobs=1):
     """Compute a confusion matrix.
 
     This function computes a confusion matrix at a given
@@ -33,6 +35,7 @@ def map_confmat(r_obs0, r_obs1, r_pred0, r_pred1, blk_rows=0):
     :param r_pred0: Raster counting the number of 0 for predictions.
     :param r_pred1: Raster counting the number of 1 for predictions.
     :param blk_rows: If > 0, number of lines per block.
+    :param n_jobs: Number of threads.
 
     :return: A numpy array of shape (2,2).
 
@@ -62,8 +65,8 @@ def map_confmat(r_obs0, r_obs1, r_pred0, r_pred1, blk_rows=0):
         yRes=-gt[5],
         separate=True,
     )
-    gdal.BuildVRT("/vsimem/temp.vrt", raster_list, options=param)
-    stack = gdal.Open("/vsimem/temp.vrt")
+    vrt_file = "/vsimem/temp_{}.vrt".format(uuid.uuid4().hex)
+    gdal.BuildVRT(vrt_file, raster_list, options=param)
 
     # Make blocks
     blockinfo = makeblock(r_obs0, blk_rows=blk_rows)
@@ -75,28 +78,32 @@ def map_confmat(r_obs0, r_obs1, r_pred0, r_pred1, blk_rows=0):
     ny = blockinfo[6]
     print("Divide region in {} blocks".format(nblock))
 
-    # Confusion matrix
-    conf_mat = np.zeros((2, 2), dtype=int)
+    # Readers (one per band)
+    readers = [BlockReader(vrt_file, band=i + 1) for i in range(4)]
 
-    # Loop on blocks of data
-    for b in range(nblock):
-        # Progress bar
-        progress_bar(nblock, b + 1)
-        # Position in 1D-arrays
+    def confmat_block(b):
+        """Local confusion matrix for one block."""
         px = b % nblock_x
         py = b // nblock_x
-        # Read the data
-        data = stack.ReadAsArray(x[px], y[py], nx[px], ny[py]).astype(np.int32)
-        # Local confusion matrix
+        win = (x[px], y[py], nx[px], ny[py])
+        data = np.array([r.read(*win) for r in readers]).astype(np.int32)
         n00 = np.sum(np.min(data[(0, 2), :, :], axis=0))
         n11 = np.sum(np.min(data[(1, 3), :, :], axis=0))
         n01 = np.sum(np.maximum(0, data[2, :, :] - data[0, :, :]))
         n10 = np.sum(np.maximum(0, data[3, :, :] - data[1, :, :]))
-        mat = np.array([n00, n01, n10, n11]).reshape(2, 2)
+        return np.array([n00, n01, n10, n11]).reshape(2, 2)
+
+    # Confusion matrix
+    conf_mat = np.zeros((2, 2), dtype=int)
+
+    # Loop on blocks of data
+    for (b, mat) in enumerate(map_blocks(confmat_block, nblock, n_jobs)):
+        # Progress bar
+        progress_bar(nblock, b + 1)
         conf_mat += mat
 
-    # Close stack
-    del stack
+    # Remove vrt
+    gdal.Unlink(vrt_file)
 
     # Return confusion matrix
     return conf_mat
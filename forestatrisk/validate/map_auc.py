@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# ==============================================================================
+# author          :Ghislain Vieilledent
+# email           :ghislain.vieilledent@cirad.fr, ghislainv@gmail.com
+# web             :https://ecology.ghislainv.fr
+# python_version  :>=3
+# license         :GPLv3
+# ==============================================================================
+
+# Third party imports
+import numpy as np
+
+# Local application imports
+from ..misc import progress_bar, makeblock
+from ..misc import map_blocks, BlockReader
+
+
+# auc_from_hist
+def auc_from_hist(pos_counts, neg_counts):
+    """Compute the AUC index from histograms of scores.
+
+    :param pos_counts: Number of positive observations for each score
+        (scores ordered by increasing values).
+    :param neg_counts: Number of negative observations for each score.
+
+    :return: AUC value (ties count for one half).
+
+    """
+
+    pos_counts = np.asarray(pos_counts, dtype=np.float64)
+    neg_counts = np.asarray(neg_counts, dtype=np.float64)
+    npos = pos_counts.sum()
+    nneg = neg_counts.sum()
+    # Number of negative observations with a lower score
+    neg_below = np.cumsum(neg_counts) - neg_counts
+    U = np.sum(pos_counts * (neg_below + 0.5 * neg_counts))
+    return U / (npos * nneg)
+
+
+# map_auc
+def map_auc(riskmap_file, fcc_file, period="validation", blk_rows=128,
+            n_jobs=1, verbose=True):
+    """Compute the AUC of a risk map against observed deforestation.
+
+    This function computes the Area Under the ROC Curve (AUC) from all
+    the forest pixels of the study area (without sampling). In one
+    pass over the rasters, it computes histograms of the probability
+    of deforestation (65535 categories) for each value of the forest
+    cover change raster. Histograms for deforested and non-deforested
+    pixels are then derived for each period and the AUC is computed
+    exactly from the histograms. Blocks are processed in ``n_jobs``
+    parallel threads.
+
+    :param riskmap_file: Raster of probability of deforestation (1 to
+        65535 with 0 as nodata value).
+
+    :param fcc_file: Input raster file of forest cover change at three
+        dates (123). 1: first period deforestation, 2: second period
+        deforestation, 3: remaining forest at the end of the second
+        period. No data value must be 0 (zero).
+
+    :param period: Either "calibration" (from t1 to t2), "validation"
+        (from t2 to t3), or "historical" (from t1 to t3). A list of
+        periods can be provided.
+
+    :param blk_rows: If > 0, number of rows for computation by block.
+
+    :param n_jobs: Number of threads.
+
+    :param verbose: Logical. Whether to print messages or not. Default
+        to ``True``.
+
+    :return: AUC value or list of AUC values if ``period`` is a list.
+
+    """
+
+    # Periods
+    multiple = not isinstance(period, str)
+    periods = list(period) if multiple else [period]
+    for p in periods:
+        if p not in ["calibration", "validation", "historical"]:
+            msg = ("period must be either 'calibration', 'validation' "
+                   "or 'historical'.")
+            raise ValueError(msg)
+
+    # Make blocks
+    blockinfo = makeblock(fcc_file, blk_rows=blk_rows)
+    nblock = blockinfo[0]
+    nblock_x = blockinfo[1]
+    x = blockinfo[3]
+    y = blockinfo[4]
+    nx = blockinfo[5]
+    ny = blockinfo[6]
+    if verbose:
+        print(f"Divide region in {nblock} blocks")
+
+    # Readers
+    reader_fcc = BlockReader(fcc_file)
+    reader_risk = BlockReader(riskmap_file)
+
+    def hist_block(b):
+        """Histograms of probabilities per fcc value for one block."""
+        px = b % nblock_x
+        py = b // nblock_x
+        win = (x[px], y[py], nx[px], ny[py])
+        fcc_data = reader_fcc.read(*win)
+        risk_data = reader_risk.read(*win)
+        w = (fcc_data > 0) & (fcc_data < 4) & (risk_data > 0)
+        key = fcc_data[w].astype(np.int64) * 65536 + risk_data[w]
+        return np.bincount(key, minlength=4 * 65536)
+
+    # Loop on blocks of data
+    if verbose:
+        print("Compute histograms of probabilities")
+    counts = np.zeros(4 * 65536, dtype=np.int64)
+    for (b, c) in enumerate(map_blocks(hist_block, nblock, n_jobs)):
+        # Progress bar
+        if verbose:
+            progress_bar(nblock, b + 1)
+        counts += c
+    counts = counts.reshape(4, 65536)
+
+    # AUC for each period (deforested pixels are positive observations)
+    AUC = []
+    for p in periods:
+        if p == "calibration":
+            pos = counts[1]
+            neg = counts[2] + counts[3]
+        elif p == "validation":
+            pos = counts[2]
+            neg = counts[3]
+        else:  # historical
+            pos = counts[1] + counts[2]
+            neg = counts[3]
+        AUC.append(auc_from_hist(pos, neg))
+
+    if multiple:
+        return AUC
+    return AUC[0]
+
+
+# End
@@ -10,16 +10,14 @@
 # ==============================================================================
 
 # Third party imports
-import numpy as np
-from osgeo import gdal
 import pandas as pd
 
 # Local application imports
-from ..misc import progress_bar, makeblock
+from .crosstab import crosstab
 
 
 # map_validation
-def map_validation(pred, obs, blk_rows=128):
+def map_validation(pred, obs, blk_rows=128, n_jobs=1):
     """Compute accuracy indices based on predicted and observed
     forest-cover change (fcc) maps.
 
@@ -28,95 +26,76 @@ def map_validation(pred, obs, blk_rows=128):
     Cohen's Kappa from a confusion matrix built on predictions
     vs. observations.
 
-    :param pred: Raster of predicted fcc.
+    Several rasters of predictions (e.g. for several models) can be
+    validated against the same raster of observations, which is read
+    only once.
+
+    Only values 0 (deforestation) and 1 (forest) are used: pixels with
+    other values (e.g. nodata) in the predictions or the observations
+    are ignored.
+
+    :param pred: Raster of predicted fcc or list of rasters.
     :param obs: Raster of observed fcc.
     :param blk_rows: If > 0, number of rows for block (else 256x256).
+    :param n_jobs: Number of threads.
 
-    :return: A dictionnary of accuracy indices.
+    :return: A dictionnary of accuracy indices or a list of
+        dictionnaries if ``pred`` is a list.
 
     """
 
-    # Load raster and band
-    predR = gdal.Open(pred)
-    predB = predR.GetRasterBand(1)
-    obsR = gdal.Open(obs)
-    obsB = obsR.GetRasterBand(1)
-
-    # Make blocks
-    blockinfo = makeblock(pred, blk_rows=blk_rows)
-    nblock = blockinfo[0]
-    nblock_x = blockinfo[1]
-    x = blockinfo[3]
-    y = blockinfo[4]
-    nx = blockinfo[5]
-    ny = blockinfo[6]
-    print("Divide region in {} blocks".format(nblock))
-
-    # Initialize the confusion matrix
-    n00 = 0.0
-    n10 = 0.0
-    n01 = 0.0
-    n11 = 0.0
-
-    # Compute the confusion matrix
+    # Cross-tabulation of predictions and observations
     print("Compute the confusion matrix")
-    # Loop on blocks of data
-    for b in range(nblock):
-        # Progress bar
-        progress_bar(nblock, b + 1)
-        # Position in 1D-arrays
-        px = b % nblock_x
-        py = b // nblock_x
-        # Data for one block
-        df_pred = predB.ReadAsArray(x[px], y[py], nx[px], ny[py])
-        df_pred = 1 - df_pred
-        df_obs = obsB.ReadAsArray(x[px], y[py], nx[px], ny[py])
-        df_obs = 1 - df_obs
-        # Update confusion matrix
-        n00 = n00 + np.sum((df_pred == 0) & (df_obs == 0))
-        n10 = n10 + np.sum((df_pred == 1) & (df_obs == 0))
-        n01 = n01 + np.sum((df_pred == 0) & (df_obs == 1))
-        n11 = n11 + np.sum((df_pred == 1) & (df_obs == 1))
-
-    # Dereference driver
-    predB = None
-    del predR
-    obsB = None
-    del obsR
-
-    # Print confusion matrix
-    mat = pd.DataFrame(
-        {
-            "obs0": pd.Series([n00, n10], index=["pred0", "pred1"]),
-            "obs1": pd.Series([n01, n11], index=["pred0", "pred1"]),
+    mats = crosstab(obs, pred, mask_invalid=True, blk_rows=blk_rows,
+                    n_jobs=n_jobs)
+    multiple = not isinstance(pred, str)
+    if not multiple:
+        mats = [mats]
+
+    res = []
+    for M in mats:
+        # Confusion matrix with 0 for deforestation and 1 for forest
+        n00 = float(M[1, 1])
+        n10 = float(M[0, 1])
+        n01 = float(M[1, 0])
+        n11 = float(M[0, 0])
+
+        # Print confusion matrix
+        mat = pd.DataFrame(
+            {
+                "obs0": pd.Series([n00, n10], index=["pred0", "pred1"]),
+                "obs1": pd.Series([n01, n11], index=["pred0", "pred1"]),
+            }
+        )
+        print(mat)
+
+        # Accuracy indices
+        print("Compute accuracy indices")
+        OA = (n11 + n00) / (n11 + n10 + n00 + n01)
+        FOM = n11 / (n11 + n10 + n01)
+        Sensitivity = n11 / (n11 + n01)
+        Specificity = n00 / (n00 + n10)
+        TSS = Sensitivity + Specificity - 1
+        N = n11 + n10 + n00 + n01
+        Observed_accuracy = (n11 + n00) / N
+        Expected_accuracy = (
+            (n11 + n10) * ((n11 + n01) / N) + (n00 + n01) * ((n00 + n10) / N)
+        ) / N
+        Kappa = (Observed_accuracy - Expected_accuracy) / (1 - Expected_accuracy)
+
+        r = {
+            "OA": round(OA, 2),
+            "FOM": round(FOM, 2),
+            "Sen": round(Sensitivity, 2),
+            "Spe": round(Specificity, 2),
+            "TSS": round(TSS, 2),
+            "K": round(Kappa, 2),
         }
-    )
-    print(mat)
-
-    # Accuracy indices
-    print("Compute accuracy indices")
-    OA = (n11 + n00) / (n11 + n10 + n00 + n01)
-    FOM = n11 / (n11 + n10 + n01)
-    Sensitivity = n11 / (n11 + n01)
-    Specificity = n00 / (n00 + n10)
-    TSS = Sensitivity + Specificity - 1
-    N = n11 + n10 + n00 + n01
-    Observed_accuracy = (n11 + n00) / N
-    Expected_accuracy = (
-        (n11 + n10) * ((n11 + n01) / N) + (n00 + n01) * ((n00 + n10) / N)
-    ) / N
-    Kappa = (Observed_accuracy - Expected_accuracy) / (1 - Expected_accuracy)
-
-    r = {
-        "OA": round(OA, 2),
-        "FOM": round(FOM, 2),
-        "Sen": round(Sensitivity, 2),
-        "Spe": round(Specificity, 2),
-        "TSS": round(TSS, 2),
-        "K": round(Kappa, 2),
-    }
-
-    return r
+        res.append(r)
+
+    if multiple:
+        return res
+    return res[0]
 
 
 # End
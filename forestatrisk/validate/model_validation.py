@@ -11,11 +11,12 @@
 
 # Standard library imports
 from __future__ import division, print_function  # Python 3 compatibility
+from concurrent.futures import ProcessPoolExecutor
 
 # Third party imports
 import numpy as np
 import pandas as pd
-from patsy import dmatrices
+from patsy import dmatrices, build_design_matrices
 from sklearn.linear_model import LogisticRegression
 from sklearn.ensemble import RandomForestClassifier
 
@@ -30,9 +31,15 @@ def computeAUC(pos_scores, neg_scores, n_sample=100000):
     Compute the Area Under the ROC Curve (AUC). See `Liu et al. 2011
     <https://doi.org/10.1111/j.1600-0587.2010.06354.x>`_\\ .
 
+    The AUC is computed exactly from the ranks of the scores
+    (Mann-Whitney U statistic) with average ranks for ties. This is
+    the probability that a positive observation has a higher score
+    than a negative observation, counting ties for one half.
+
     :param pos_scores: Scores of positive observations.
     :param neg_scores: Scores of negative observations.
-    :param n_samples: Number of samples to approximate AUC.
+    :param n_sample: Not used. Kept for backward compatibility (AUC
+        was previously approximated from ``n_sample`` random pairs).
 
     :return: AUC value.
 
@@ -40,9 +47,18 @@ def computeAUC(pos_scores, neg_scores, n_sample=100000):
 
     pos_scores = np.array(pos_scores, dtype=float)
     neg_scores = np.array(neg_scores, dtype=float)
-    pos_sample = np.random.choice(pos_scores, size=n_sample, replace=True)
-    neg_sample = np.random.choice(neg_scores, size=n_sample, replace=True)
-    AUC = np.mean(1.0 * (pos_sample > neg_sample) + 0.5 * (pos_sample == neg_sample))
+    npos = len(pos_scores)
+    nneg = len(neg_scores)
+
+    # Average ranks of scores (ties have the same rank)
+    scores = np.concatenate([pos_scores, neg_scores])
+    _, inverse, counts = np.unique(scores, return_inverse=True,
+                                   return_counts=True)
+    ranks = np.cumsum(counts) - (counts - 1) / 2.0
+
+    # Mann-Whitney U statistic
+    U = np.sum(ranks[inverse[:npos]]) - npos * (npos + 1) / 2.0
+    AUC = U / (npos * nneg)
 
     return AUC
 
@@ -97,6 +113,139 @@ def accuracy_indices(pred, obs):
     return r
 
 
+# cv_design_matrices
+def cv_design_matrices(formula, data_train, data_test):
+    """Design matrices for one repetition of cross-validation.
+
+    The design matrix is computed from the training dataset only and
+    the same transformations (e.g. ``scale()``) are applied to the
+    test dataset, so that test observations do not leak into the
+    model. Observations with NA are dropped.
+
+    :param formula: Model formula (the last term must be ``cell``).
+    :param data_train: Training dataset.
+    :param data_test: Test dataset.
+
+    :return: A tuple (data_train, data_test, X_train, Y_train, X_test)
+        with datasets without NA, design matrices without the column
+        of cells, and the response for the training dataset.
+
+    """
+
+    # Training matrices
+    y, x = dmatrices(formula, data=data_train, NA_action="drop",
+                     return_type="dataframe")
+    data_train = data_train.loc[x.index]
+    Y_train = y.to_numpy()[:, 0]
+    X_train = x.to_numpy()[:, :-1]  # We remove the last column (cells)
+    # Test matrices with the design of the training matrices
+    (x,) = build_design_matrices([x.design_info], data_test,
+                                 NA_action="drop", return_type="dataframe")
+    data_test = data_test.loc[x.index]
+    X_test = x.to_numpy()[:, :-1]  # We remove the last column (cells)
+    return (data_train, data_test, X_train, Y_train, X_test)
+
+
+# cv_repetition
+def cv_repetition(data_train, data_test, formula, mod_type, icar_args,
+                  rf_args, seed):
+    """One repetition of model cross-validation.
+
+    Design matrices are computed with ``cv_design_matrices()``.
+
+    :param data_train: Training dataset.
+    :param data_test: Test dataset.
+    :param formula: Model formula.
+    :param mod_type: Model type, can be either "icar", "glm", or "rf".
+    :param icar_args: Dictionnary of arguments for the binomial iCAR model.
+    :param rf_args: Dictionnary of arguments for the random forest model.
+    :param seed: Seed for the model (iCAR and random forest).
+
+    :return: A tuple of accuracy indices (AUC, OA, EA, FOM, Sen, Spe,
+        TSS, K).
+
+    """
+
+    # Design matrices
+    data_train, data_test, X_train, Y_train, X_test = cv_design_matrices(
+        formula, data_train, data_test)
+    data_test = data_test.copy()
+    nobs_test = data_test.shape[0]
+
+    # True threshold in data_test (might be slightly different from 0.5)
+    # nfor_test = sum(data_test.fcc23 == 1)
+    ndefor_test = sum(data_test.fcc23 == 0)
+    thresh_test = 1 - (ndefor_test / nobs_test)
+
+    # Compute deforestation probability
+    # icar
+    if mod_type == "icar":
+        # Training the model
+        mod_icar = model_binomial_iCAR(
+            # Observations
+            suitability_formula=formula,
+            data=data_train,
+            # Spatial structure
+            n_neighbors=icar_args["n_neighbors"],
+            neighbors=icar_args["neighbors"],
+            # Chains
+            burnin=icar_args["burnin"],
+            mcmc=icar_args["mcmc"],
+            thin=icar_args["thin"],
+            # Starting values
+            beta_start=icar_args["beta_start"],
+            # Various
+            seed=seed,
+        )
+        # Predictions for the test dataset
+        data_test["theta_pred"] = mod_icar.predict(new_data=data_test)
+    # glm
+    if mod_type == "glm":
+        # Training the model
+        glm = LogisticRegression(solver="lbfgs")
+        mod_glm = glm.fit(X_train, Y_train)
+        # Predictions for the test dataset
+        data_test["theta_pred"] = mod_glm.predict_proba(X_test)[:, 1]
+    # RF
+    if mod_type == "rf":
+        # Training the model
+        rf = RandomForestClassifier(
+            n_estimators=rf_args["n_estimators"], n_jobs=rf_args["n_jobs"],
+            random_state=seed,
+        )
+        mod_rf = rf.fit(X_train, Y_train)
+        # Predictions for the test dataset
+        data_test["theta_pred"] = mod_rf.predict_proba(X_test)[:, 1]
+
+    # Transform probabilities into binary data
+    proba_thresh = np.quantile(data_test["theta_pred"], thresh_test)
+    data_test["pred"] = 0
+    data_test.loc[data_test.theta_pred > proba_thresh, "pred"] = 1
+
+    # AUC
+    pos_scores = data_test.theta_pred[data_test.fcc23 == 0]
+    neg_scores = data_test.theta_pred[data_test.fcc23 == 1]
+    AUC = computeAUC(pos_scores, neg_scores)
+    # Accuracy indices
+    obs = 1 - data_test.fcc23
+    pred = data_test.pred
+    ai = accuracy_indices(obs, pred)
+
+    # Tupple of indices
+    acc_ind = (
+        AUC,
+        ai["OA"],
+        ai["EA"],
+        ai["FOM"],
+        ai["Sen"],
+        ai["Spe"],
+        ai["TSS"],
+        ai["K"],
+    )
+
+    return acc_ind
+
+
 # cross_validation
 def cross_validation(
     data,
@@ -114,11 +263,19 @@ def cross_validation(
         "beta_start": 0,
     },
     rf_args={"n_estimators": 100, "n_jobs": None},
+    fold="random",
+    n_jobs=1,
 ):
     """Model cross-validation
 
     Performs model cross-validation.
 
+    Design matrices are computed for each repetition from the
+    training dataset (see ``cv_repetition()``). Each repetition has
+    its own random number generator derived from ``seed`` so that
+    results do not depend on ``n_jobs``. Repetitions can be run in parallel
+    processes with ``n_jobs`` > 1.
+
     :param data: Full dataset.
     :param formula: Model formula.
     :param mod_type: Model type, can be either "icar", "glm", or "rf".
@@ -127,13 +284,19 @@ def cross_validation(
     :param seed: Seed for reproducibility.
     :param icar_args: Dictionnary of arguments for the binomial iCAR model.
     :param rf_args: Dictionnary of arguments for the random forest model.
+    :param fold: Either "random" (observations are sampled at random
+        for the test dataset) or "block" (spatial cells of the
+        ``cell`` column are sampled at random and all the observations
+        of the sampled cells are used for the test dataset).
+    :param n_jobs: Number of parallel processes for repetitions.
 
     :return: A Pandas data frame with cross-validation results.
 
     """
 
-    # Set random seed for reproducibility
-    np.random.seed(seed)
+    if fold not in ["random", "block"]:
+        msg = "fold must be either 'random' or 'block'."
+        raise ValueError(msg)
 
     # Result table
     CV_df = pd.DataFrame(
@@ -144,96 +307,54 @@ def cross_validation(
     nobs = data.shape[0]
     nobs_test = int(round(nobs * (ratio / 100)))
     rows = np.arange(nobs)
+    if fold == "block":
+        cells = data["cell"].to_numpy()
+        cell_ids, cell_counts = np.unique(cells, return_counts=True)
 
-    # Loop on repetitions
+    # Independent random number generators for repetitions
+    seeds = np.random.SeedSequence(seed).spawn(nrep)
+
+    # Arguments for each repetition
+    rep_args = []
     for i in range(nrep):
-        # Print message
-        print("Repetition #: " + str(i + 1))
+        rng = np.random.default_rng(seeds[i])
 
         # Data-sets for cross-validation
-        rows_test = np.random.choice(rows, size=nobs_test, replace=False)
-        rows_train = np.where(np.isin(rows, rows_test, invert=True))
-        data_test = data.iloc[rows_test].copy()
-        data_train = data.iloc[rows_train].copy()
-
-        # True threshold in data_test (might be slightly different from 0.5)
-        # nfor_test = sum(data_test.fcc23 == 1)
-        ndefor_test = sum(data_test.fcc23 == 0)
-        thresh_test = 1 - (ndefor_test / nobs_test)
-
-        # Training matrices
-        y, x = dmatrices(formula, data=data_train, NA_action="drop")
-        Y_train = y[:, 0]
-        X_train = x[:, :-1]  # We remove the last column (cells)
-        # Test matrices
-        y, x = dmatrices(formula, data=data_test, NA_action="drop")
-        # Y_test = y[:, 0]
-        X_test = x[:, :-1]  # We remove the last column (cells)
-
-        # Compute deforestation probability
-        # icar
-        if mod_type == "icar":
-            # Training the model
-            mod_icar = model_binomial_iCAR(
-                # Observations
-                suitability_formula=formula,
-                data=data_train,
-                # Spatial structure
-                n_neighbors=icar_args["n_neighbors"],
-                neighbors=icar_args["neighbors"],
-                # Chains
-                burnin=icar_args["burnin"],
-                mcmc=icar_args["mcmc"],
-                thin=icar_args["thin"],
-                # Starting values
-                beta_start=icar_args["beta_start"],
-            )
-            # Predictions for the test dataset
-            data_test["theta_pred"] = mod_icar.predict(new_data=data_test)
-        # glm
-        if mod_type == "glm":
-            # Training the model
-            glm = LogisticRegression(solver="lbfgs")
-            mod_glm = glm.fit(X_train, Y_train)
-            # Predictions for the test dataset
-            data_test["theta_pred"] = mod_glm.predict_proba(X_test)[:, 1]
-        # RF
-        if mod_type == "rf":
-            # Training the model
-            rf = RandomForestClassifier(
-                n_estimators=rf_args["n_estimators"], n_jobs=rf_args["n_jobs"]
-            )
-            mod_rf = rf.fit(X_train, Y_train)
-            # Predictions for the test dataset
-            data_test["theta_pred"] = mod_rf.predict_proba(X_test)[:, 1]
-
-        # Transform probabilities into binary data
-        proba_thresh = np.quantile(data_test["theta_pred"], thresh_test)
-        data_test["pred"] = 0
-        data_test.loc[data_test.theta_pred > proba_thresh, "pred"] = 1
-
-        # AUC
-        pos_scores = data_test.theta_pred[data_test.fcc23 == 0]
-        neg_scores = data_test.theta_pred[data_test.fcc23 == 1]
-        AUC = computeAUC(pos_scores, neg_scores)
-        # Accuracy indices
-        obs = 1 - data_test.fcc23
-        pred = data_test.pred
-        ai = accuracy_indices(obs, pred)
-
-        # Tupple of indices
-        acc_ind = (
-            AUC,
-            ai["OA"],
-            ai["EA"],
-            ai["FOM"],
-            ai["Sen"],
-            ai["Spe"],
-            ai["TSS"],
-            ai["K"],
-        )
+        if fold == "random":
+            rows_test = rng.choice(rows, size=nobs_test, replace=False)
+            is_test = np.isin(rows, rows_test)
+        else:
+            # Cells in random order until ratio is reached
+            perm = rng.permutation(len(cell_ids))
+            ncum = np.cumsum(cell_counts[perm])
+            ncell_test = np.searchsorted(ncum, nobs_test) + 1
+            is_test = np.isin(cells, cell_ids[perm[:ncell_test]])
+        if is_test.all():
+            msg = ("No observation left in the training dataset: "
+                   "decrease 'ratio' or use smaller spatial cells "
+                   "for block folds.")
+            raise ValueError(msg)
+        rep_args.append((
+            data[~is_test], data[is_test],
+            formula, mod_type, icar_args, rf_args,
+            int(rng.integers(1, 2**31 - 1)),
+        ))
 
-        # Results as data frame
+    # Loop on repetitions
+    if n_jobs is None or n_jobs <= 1:
+        results = []
+        for i in range(nrep):
+            # Print message
+            print("Repetition #: " + str(i + 1))
+            results.append(cv_repetition(*rep_args[i]))
+    else:
+        print("Run {} repetitions on {} processes".format(nrep, n_jobs))
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            futures = [pool.submit(cv_repetition, *a) for a in rep_args]
+            results = [f.result() for f in futures]
+
+    # Results as data frame
+    for (i, acc_ind) in enumerate(results):
         CV_df["rep" + str(i + 1)] = acc_ind
 
     # Mean over repetitions
@@ -22,6 +22,148 @@ import pandas as pd
 from ..misc import progress_bar, make_square
 
 
+# square_sum
+def square_sum(data, csize, nsquare_x):
+    """Sum values of a strip of data by square.
+
+    :param data: Numpy array for a full-width strip of at most
+        ``csize`` rows.
+    :param csize: Square size in number of pixels.
+    :param nsquare_x: Number of squares on x axis.
+
+    :return: Numpy array of length ``nsquare_x`` with the sum of
+        values in each square of the strip.
+
+    """
+
+    pad = nsquare_x * csize - data.shape[1]
+    if pad > 0:
+        data = np.pad(data, ((0, 0), (0, pad)))
+    data = data.reshape(data.shape[0], nsquare_x, csize)
+    return data.sum(axis=(0, 2), dtype=np.float64)
+
+
+# coarsen_grid
+def coarsen_grid(grid, factor):
+    """Sum values of a grid over squares of factor x factor cells.
+
+    :param grid: Numpy array of shape (nsquare_y, nsquare_x).
+    :param factor: Number of cells on each side of coarse squares.
+
+    :return: Numpy array of the coarse grid.
+
+    """
+
+    nrow = int(np.ceil(grid.shape[0] / factor))
+    ncol = int(np.ceil(grid.shape[1] / factor))
+    grid = np.pad(grid, ((0, nrow * factor - grid.shape[0]),
+                         (0, ncol * factor - grid.shape[1])))
+    return grid.reshape(nrow, factor, ncol, factor).sum(axis=(1, 3))
+
+
+# pred_obs_indices
+def pred_obs_indices(df, pix_area, period, model_name,
+                     csize_coarse_grid, csize_coarse_grid_ha,
+                     tab_file_pred, fig_file_pred, figsize, dpi):
+    """Indices and plot comparing predicted and observed deforestation.
+
+    :param df: DataFrame with observed and predicted deforestation per
+        grid cell.
+    :param pix_area: Pixel area (in unit square, eg. meter square).
+    :param period: Period name used in the plot title.
+    :param model_name: Model name used in the plot title.
+    :param csize_coarse_grid: Spatial cell size in number of pixels.
+    :param csize_coarse_grid_ha: Spatial cell size in ha.
+    :param tab_file_pred: Path to the ``.csv`` output file with
+        validation data.
+    :param fig_file_pred: Path to the ``.png`` output file for the
+        predictions vs. observations plot.
+    :param figsize: Figure size.
+    :param dpi: Resolution for output image.
+
+    :return: A dictionary of indices (see ``validation_udef_arp()``).
+
+    """
+
+    # Select cells with forest cover > 0
+    df = df[df["nfor_obs"] > 0]
+    ncell = df.shape[0]
+    # if ncell < 1000:
+    #     msg = ("Number of cells with forest cover > 0 ha is < 1000. "
+    #            "Please decrease the spatial cell size 'csize_coarse_grid' "
+    #            "to get more cells.")
+    #     raise ValueError(msg)
+
+    # Compute areas in ha
+    df["nfor_obs_ha"] = df["nfor_obs"] * pix_area / 10000
+    df["ndefor_obs_ha"] = df["ndefor_obs"] * pix_area / 10000
+
+    # Export the table of results
+    df.to_csv(tab_file_pred, sep=",", header=True,
+              index=False, index_label=False)
+
+    # Prediction error
+    error_pred = df["ndefor_pred_ha"] - df["ndefor_obs_ha"]
+
+    # Compute RMSE
+    squared_error = (error_pred) ** 2
+    RMSE = round(np.sqrt(np.mean(squared_error)), 2)
+
+    # Compute wRMSE
+    w = df["nfor_obs_ha"] / df["nfor_obs_ha"].sum()
+    wRMSE = round(np.sqrt(sum(squared_error * w)), 2)
+
+    # Compute MedAE
+    MedAE = round(np.median(np.absolute(error_pred)), 2)
+
+    # Calculate R square
+    # Get the correlation coefficient
+    r = np.corrcoef(df["ndefor_pred_ha"], df["ndefor_obs_ha"])[0, 1]
+    # Square the correlation coefficient
+    r_square = round(r ** 2, 2)
+
+    # Plot title
+    title = (
+        "{0} model, {1} period\n"
+        "Predicted vs. observed deforestation "
+        "in {2} ha grid cells."
+    )
+    title = title.format(model_name, period, csize_coarse_grid_ha)
+
+    # Points for identity line
+    p = [df[["ndefor_obs_ha", "ndefor_pred_ha"]].min(axis=None),
+         df[["ndefor_obs_ha", "ndefor_pred_ha"]].max(axis=None)]
+
+    # Plot predictions vs. observations
+    fig = plt.figure(figsize=figsize, dpi=dpi)
+    ax = plt.subplot(111)
+    ax.set_box_aspect(1)
+    plt.scatter(df["ndefor_obs_ha"], df["ndefor_pred_ha"],
+                color=None, marker="o", edgecolor="k")
+    plt.plot(p, p, "r--")
+    plt.title(title)
+    plt.xlabel("Observed deforestation (ha)")
+    plt.ylabel("Predicted deforestation (ha)")
+    # Text indices and ncell
+    t = ("MedAE = {0:.2f} ha\n"
+         "R2 = {1:.2f}\n"
+         "n = {2:d}")
+    t = t.format(MedAE, r_square, ncell)
+    x_text = 0
+    y_text = df[["ndefor_obs_ha", "ndefor_pred_ha"]].max(axis=None)
+    plt.text(x_text, y_text, t, ha="left", va="top")
+    fig.savefig(fig_file_pred)
+    plt.close(fig)
+
+    # Results
+    indices = {"RMSE": RMSE, "wRMSE": wRMSE, "MedAE": MedAE, "R2":
+               r_square, "ncell": ncell, "csize_coarse_grid":
+               csize_coarse_grid, "csize_coarse_grid_ha":
+               csize_coarse_grid_ha}
+
+    return indices
+
+
 # validation_udef_arp
 def validation_udef_arp(
         fcc_file,
@@ -66,13 +208,22 @@ def validation_udef_arp(
 
     :param csize_coarse_grid: Spatial cell size in number of pixels. Must
         correspond to a distance < 10 km. Default to 300 corresponding
-        to 9 km for a 30 m resolution raster.
+        to 9 km for a 30 m resolution raster. A list of cell sizes
+        which are multiples of the smallest size can be provided
+        (e.g. ``[100, 200, 300]``). Rasters are then read only once:
+        observed and predicted deforestation are computed for the
+        smallest size and summed for larger sizes.
+
+    :param indices_file_pred: Path to the ``.csv`` output file with
+        indices (one row per cell size).
 
     :param tab_file_pred: Path to the ``.csv`` output file with validation
-        data.
+        data. If several cell sizes are provided, the cell size is
+        added as a suffix to the file name (e.g. ``pred_obs_300.csv``).
 
     :param fig_file_pred: Path to the ``.png`` output file for the
-        predictions vs. observations plot.
+        predictions vs. observations plot. If several cell sizes are
+        provided, the cell size is added as a suffix to the file name.
 
     :param figsize: Figure size.
 
@@ -88,6 +239,8 @@ def validation_udef_arp(
         cover > 0 at the beginning of the validation period,
         ``csize_coarse_grid``: the coarse grid cell size in number of
         pixels, ``csize_coarse_grid_ha``: the coarse grid cell size in ha.
+        If several cell sizes are provided, a pandas DataFrame with
+        the same indices and one row per cell size.
 
     """
 
@@ -107,157 +260,117 @@ def validation_udef_arp(
     defor_dens_per_cat = pd.read_csv(tab_file_defor)
     cat = defor_dens_per_cat["cat"].values
 
+    # Lookup table of predicted deforestation (in ha) on the period
+    # per category. Some cat might not exist and have nan for defrate:
+    # predicted deforestation is set to zero for these categories and
+    # for category 0 (nodata).
+    defor_dens = defor_dens_per_cat["defor_dens"].values
+    defor_dens_period = np.nan_to_num(defor_dens * time_interval)
+    lut = np.zeros(65536)
+    lut[cat] = defor_dens_period
+    lut[0] = 0
+
     # Pixel area (in unit square, eg. meter square)
     gt = fcc_ds.GetGeoTransform()
     pix_area = gt[1] * (-gt[5])
 
-    # Make square
-    squareinfo = make_square(fcc_file, csize_coarse_grid)
-    nsquare = squareinfo[0]
+    # Grid sizes (multiples of the smallest size)
+    multiple = np.ndim(csize_coarse_grid) > 0
+    csize_list = [int(c) for c in np.atleast_1d(csize_coarse_grid)]
+    csize_base = min(csize_list)
+    if any(c % csize_base != 0 for c in csize_list):
+        msg = ("Grid sizes in 'csize_coarse_grid' must be multiples of "
+               "the smallest grid size.")
+        raise ValueError(msg)
+
+    # Make square (base grid)
+    squareinfo = make_square(fcc_file, csize_base)
     nsquare_x = squareinfo[1]
-    x = squareinfo[3]
+    nsquare_y = squareinfo[2]
     y = squareinfo[4]
-    nx = squareinfo[5]
     ny = squareinfo[6]
-
-    # Cell size in ha
-    csize_coarse_grid_ha = round(csize_coarse_grid *
-                                 csize_coarse_grid *
-                                 pix_area / 10000, 2)
-
-    # Create a table to save the results
-    data = {"cell": list(range(nsquare)), "nfor_obs": 0,
-            "ndefor_obs": 0, "nfor_obs_ha": 0.0,
-            "ndefor_obs_ha": 0.0, "ndefor_pred_ha": 0.0}
-    df = pd.DataFrame(data)
+    ncol = fcc_ds.RasterXSize
 
     # ==============================================================
-    # Loop on grid cells
+    # Loop on strips of grid cells
     # ==============================================================
 
-    # Loop on squares
-    for s in range(nsquare):
+    nfor_obs = np.zeros((nsquare_y, nsquare_x))
+    ndefor_obs = np.zeros((nsquare_y, nsquare_x))
+    ndefor_pred_ha = np.zeros((nsquare_y, nsquare_x))
+
+    # Loop on full-width strips of csize_base rows
+    for py in range(nsquare_y):
         # Progress bar
         if verbose:
-            progress_bar(nsquare, s + 1)
-        # Position in 1D-arrays
-        px = s % nsquare_x
-        py = s // nsquare_x
+            progress_bar(nsquare_y, py + 1)
         # Observed forest cover and deforestation
-        fcc_data = fcc_band.ReadAsArray(x[px], y[py], nx[px], ny[py])
+        fcc_data = fcc_band.ReadAsArray(0, y[py], ncol, ny[py])
         if period == "calibration":
-            df.loc[s, "nfor_obs"] = np.sum(fcc_data > 0)
-            df.loc[s, "ndefor_obs"] = np.sum(fcc_data == 1)
+            for_data = fcc_data > 0
+            defor_data = fcc_data == 1
         elif period == "validation":
-            df.loc[s, "nfor_obs"] = np.sum(fcc_data > 1)
-            df.loc[s, "ndefor_obs"] = np.sum(fcc_data == 2)
+            for_data = fcc_data > 1
+            defor_data = fcc_data == 2
         else:  # historical
-            df.loc[s, "nfor_obs"] = np.sum(fcc_data > 0)
-            df.loc[s, "ndefor_obs"] = np.sum(np.isin(fcc_data, [1, 2]))
-
-        # Predicted deforestation
-        defor_cat_data = defor_cat_band.ReadAsArray(
-            x[px], y[py], nx[px], ny[py])
-        defor_cat = pd.Categorical(defor_cat_data.flatten(), categories=cat)
-        defor_cat_count = defor_cat.value_counts().values
-
-        # Deforestation on period
-        defor_dens = defor_dens_per_cat["defor_dens"].values
-        defor_dens_period = defor_dens * time_interval
+            for_data = fcc_data > 0
+            defor_data = np.isin(fcc_data, [1, 2])
+        nfor_obs[py] = square_sum(for_data, csize_base, nsquare_x)
+        ndefor_obs[py] = square_sum(defor_data, csize_base, nsquare_x)
         # Predicted deforestation (area)
-        df.loc[s, "ndefor_pred_ha"] = np.nansum(defor_cat_count *
-                                                defor_dens_period)
-        # Note: np.nansum is used here as some cat might not exist and
-        # have nan for defrate.
+        defor_cat_data = defor_cat_band.ReadAsArray(0, y[py], ncol, ny[py])
+        pred_data = np.take(lut, defor_cat_data)
+        ndefor_pred_ha[py] = square_sum(pred_data, csize_base, nsquare_x)
 
     # Dereference drivers
     del fcc_ds, defor_cat_ds
 
     # ==============================================================
-    # Indices and plot
+    # Indices and plot for each grid size
     # ==============================================================
 
-    # Select cells with forest cover > 0
-    df = df[df["nfor_obs"] > 0]
-    ncell = df.shape[0]
-    # if ncell < 1000:
-    #     msg = ("Number of cells with forest cover > 0 ha is < 1000. "
-    #            "Please decrease the spatial cell size 'csize_coarse_grid' "
-    #            "to get more cells.")
-    #     raise ValueError(msg)
-
-    # Compute areas in ha
-    df["nfor_obs_ha"] = df["nfor_obs"] * pix_area / 10000
-    df["ndefor_obs_ha"] = df["ndefor_obs"] * pix_area / 10000
-
-    # Export the table of results
-    df.to_csv(tab_file_pred, sep=",", header=True,
-              index=False, index_label=False)
-
-    # Prediction error
-    error_pred = df["ndefor_pred_ha"] - df["ndefor_obs_ha"]
-
-    # Compute RMSE
-    squared_error = (error_pred) ** 2
-    RMSE = round(np.sqrt(np.mean(squared_error)), 2)
-
-    # Compute wRMSE
-    w = df["nfor_obs_ha"] / df["nfor_obs_ha"].sum()
-    wRMSE = round(np.sqrt(sum(squared_error * w)), 2)
-
-    # Compute MedAE
-    MedAE = round(np.median(np.absolute(error_pred)), 2)
-
-    # Calculate R square
-    # Get the correlation coefficient
-    r = np.corrcoef(df["ndefor_pred_ha"], df["ndefor_obs_ha"])[0, 1]
-    # Square the correlation coefficient
-    r_square = round(r ** 2, 2)
-
     # Identify model from file
     model_basename = os.path.basename(riskmap_file)
     model_name = model_basename[5:-7]
 
-    # Plot title
-    title = (
-        "{0} model, {1} period\n"
-        "Predicted vs. observed deforestation "
-        "in {2} ha grid cells."
-    )
-    title = title.format(model_name, period, csize_coarse_grid_ha)
-
-    # Points for identity line
-    p = [df[["ndefor_obs_ha", "ndefor_pred_ha"]].min(axis=None),
-         df[["ndefor_obs_ha", "ndefor_pred_ha"]].max(axis=None)]
-
-    # Plot predictions vs. observations
-    fig = plt.figure(figsize=figsize, dpi=dpi)
-    ax = plt.subplot(111)
-    ax.set_box_aspect(1)
-    plt.scatter(df["ndefor_obs_ha"], df["ndefor_pred_ha"],
-                color=None, marker="o", edgecolor="k")
-    plt.plot(p, p, "r--")
-    plt.title(title)
-    plt.xlabel("Observed deforestation (ha)")
-    plt.ylabel("Predicted deforestation (ha)")
-    # Text indices and ncell
-    t = ("MedAE = {0:.2f} ha\n"
-         "R2 = {1:.2f}\n"
-         "n = {2:d}")
-    t = t.format(MedAE, r_square, ncell)
-    x_text = 0
-    y_text = df[["ndefor_obs_ha", "ndefor_pred_ha"]].max(axis=None)
-    plt.text(x_text, y_text, t, ha="left", va="top")
-    fig.savefig(fig_file_pred)
-    plt.close(fig)
-
-    # Results
-    indices = {"RMSE": RMSE, "wRMSE": wRMSE, "MedAE": MedAE, "R2":
-               r_square, "ncell": ncell, "csize_coarse_grid":
-               csize_coarse_grid, "csize_coarse_grid_ha":
-               csize_coarse_grid_ha}
-    indices_df = pd.DataFrame([indices])
+    indices_list = []
+    for csize in csize_list:
+        factor = csize // csize_base
+        # Table of results
+        data = {"nfor_obs": coarsen_grid(nfor_obs, factor),
+                "ndefor_obs": coarsen_grid(ndefor_obs, factor),
+                "ndefor_pred_ha": coarsen_grid(ndefor_pred_ha, factor)}
+        df = pd.DataFrame({k: v.ravel() for (k, v) in data.items()})
+        df.insert(0, "cell", list(range(df.shape[0])))
+        df["nfor_obs"] = df["nfor_obs"].astype(np.int64)
+        df["ndefor_obs"] = df["ndefor_obs"].astype(np.int64)
+        df.insert(3, "nfor_obs_ha", 0.0)
+        df.insert(4, "ndefor_obs_ha", 0.0)
+        # Output files (one per grid size if several sizes)
+        if multiple:
+            tab_file = "{0}_{2}{1}".format(*os.path.splitext(tab_file_pred),
+                                           csize)
+            fig_file = "{0}_{2}{1}".format(*os.path.splitext(fig_file_pred),
+                                           csize)
+        else:
+            tab_file = tab_file_pred
+            fig_file = fig_file_pred
+        # Cell size in ha
+        csize_ha = round(csize * csize * pix_area / 10000, 2)
+        # Indices and plot
+        indices = pred_obs_indices(df, pix_area, period, model_name,
+                                   csize, csize_ha, tab_file, fig_file,
+                                   figsize, dpi)
+        indices_list.append(indices)
+
+    # Save indices (one row per grid size)
+    indices_df = pd.DataFrame(indices_list)
     indices_df.to_csv(indices_file_pred, sep=",", header=True,
                       index=False, index_label=False)
 
+    if multiple:
+        return indices_df
+    return indices_list[0]
+
+
 # End
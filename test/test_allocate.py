@@ -0,0 +1,95 @@
+"""Testing deforestation allocation to several projects."""
+
+import os
+
+import numpy as np
+import pandas as pd
+from osgeo import gdal, ogr, osr
+
+from forestatrisk.project.allocate_deforestation import (
+    allocate_deforestation, allocate_deforestation_batch)
+
+opj = os.path.join
+
+# Two overlapping projects (coordinates in pixels of 10 m)
+POLYGONS = [
+    "POLYGON ((52 52, 252 52, 252 202, 52 202, 52 52))",
+    "POLYGON ((153 103, 353 133, 303 353, 153 303, 153 103))",
+]
+
+
+def make_inputs(out_dir):
+    """Risk map, deforestation rates, and project borders."""
+    rng = np.random.default_rng(1234)
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(32738)
+    # Risk map with classes 1 to 5 and nodata
+    data = rng.integers(1, 6, size=(40, 40)).astype(np.uint16)
+    data[rng.random((40, 40)) < 0.2] = 0
+    riskmap_file = opj(out_dir, "riskmap.tif")
+    ds = gdal.GetDriverByName("GTiff").Create(
+        riskmap_file, 40, 40, 1, gdal.GDT_UInt16)
+    ds.SetGeoTransform((0, 10, 0, 400, 0, -10))
+    ds.SetProjection(srs.ExportToWkt())
+    band = ds.GetRasterBand(1)
+    band.SetNoDataValue(0)
+    band.WriteArray(data)
+    band = None
+    del ds
+    # Deforestation rates
+    rate_file = opj(out_dir, "defrate.csv")
+    pd.DataFrame({
+        "cat": [1, 2, 3, 4, 5],
+        "nfor": np.bincount(data.ravel(), minlength=6)[1:],
+        "rate_mod": [0.001, 0.005, 0.01, 0.02, 0.05],
+        "pixel_area": 0.01}).to_csv(rate_file, index=False)
+    # One file with all projects and one file per project
+    project_files = [opj(out_dir, f"project{i}.gpkg")
+                     for i in range(len(POLYGONS) + 1)]
+    for (i, project_file) in enumerate(project_files):
+        vect_ds = ogr.GetDriverByName("GPKG").CreateDataSource(project_file)
+        lay = vect_ds.CreateLayer("projects", srs, ogr.wkbPolygon)
+        polygons = POLYGONS if i == 0 else [POLYGONS[i - 1]]
+        for wkt in polygons:
+            feat = ogr.Feature(lay.GetLayerDefn())
+            feat.SetGeometry(ogr.CreateGeometryFromWkt(wkt))
+            lay.CreateFeature(feat)
+            feat = None
+        # Feature without geometry
+        if i == 0:
+            feat = ogr.Feature(lay.GetLayerDefn())
+            lay.CreateFeature(feat)
+            feat = None
+        lay = None
+        del vect_ds
+    return (riskmap_file, rate_file, project_files)
+
+
+def test_allocate_deforestation_batch(tmp_path):
+    """Test batch allocation against one allocation per project."""
+    out_dir = str(tmp_path)
+    riskmap_file, rate_file, project_files = make_inputs(out_dir)
+    res = allocate_deforestation_batch(
+        riskmap_file, rate_file, defor_juris_ha=10, years_forecast=10,
+        projects_file=project_files[0],
+        output_file=opj(out_dir, "defor_projects.csv"))
+    assert len(res) == len(POLYGONS) + 1
+    # No deforestation for the feature without geometry
+    assert res["annual deforestation (ha)"][len(POLYGONS)] == 0
+    assert res["entire deforestation (ha)"][len(POLYGONS)] == 0
+    # No raster of zones written to disk
+    assert not os.path.isfile(opj(out_dir, "projects_zones.tif"))
+    # Overlapping pixels are counted in each project
+    for i in range(len(POLYGONS)):
+        ofile = opj(out_dir, f"defor_project{i + 1}.csv")
+        allocate_deforestation(
+            riskmap_file, rate_file, defor_juris_ha=10, years_forecast=10,
+            project_borders=project_files[i + 1], output_file=ofile)
+        single = pd.read_csv(ofile)
+        assert (res["annual deforestation (ha)"][i]
+                == single["deforestation (ha)"][0])
+        assert (res["entire deforestation (ha)"][i]
+                == single["deforestation (ha)"][1])
+
+
+# End
@@ -0,0 +1,22 @@
+"""Testing exact AUC computation."""
+
+import numpy as np
+
+from forestatrisk import computeAUC
+from forestatrisk.validate.map_auc import auc_from_hist
+
+
+def test_auc():
+    """Test rank-based and histogram-based AUC against all pairs."""
+    rng = np.random.default_rng(1234)
+    pos = rng.integers(0, 50, size=300)
+    neg = rng.integers(0, 40, size=400)
+    diff = pos[:, None] - neg[None, :]
+    auc_pairs = np.mean((diff > 0) + 0.5 * (diff == 0))
+    assert np.isclose(computeAUC(pos, neg), auc_pairs)
+    pos_counts = np.bincount(pos, minlength=50)
+    neg_counts = np.bincount(neg, minlength=50)
+    assert np.isclose(auc_from_hist(pos_counts, neg_counts), auc_pairs)
+
+
+# End
@@ -0,0 +1,44 @@
+"""Testing the cache key of cellneigh_ctry."""
+
+import os
+
+from osgeo import ogr, osr
+
+from forestatrisk.model.cellneigh import vector_hash
+
+
+def write_shp(shp_file, epsg, wkt):
+    """Write a shapefile with one polygon."""
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(epsg)
+    driver = ogr.GetDriverByName("ESRI Shapefile")
+    if os.path.isfile(shp_file):
+        driver.DeleteDataSource(shp_file)
+    ds = driver.CreateDataSource(shp_file)
+    lay = ds.CreateLayer("borders", srs, ogr.wkbPolygon)
+    feat = ogr.Feature(lay.GetLayerDefn())
+    feat.SetGeometry(ogr.CreateGeometryFromWkt(wkt))
+    lay.CreateFeature(feat)
+    feat = None
+    lay = None
+    del ds
+
+
+def test_vector_hash(tmp_path):
+    """Test hash depends on geometries and projection (.prj)."""
+    shp_file = str(tmp_path / "borders.shp")
+    wkt = "POLYGON ((0 0, 10000 0, 10000 10000, 0 10000, 0 0))"
+    write_shp(shp_file, 32738, wkt)
+    h = vector_hash(shp_file)
+    assert vector_hash(shp_file) == h
+    # Other projection: only the .prj file changes
+    write_shp(shp_file, 32739, wkt)
+    assert vector_hash(shp_file) != h
+    # Other geometry
+    write_shp(shp_file, 32738, wkt.replace("10000 10000", "9000 10000"))
+    assert vector_hash(shp_file) != h
+    write_shp(shp_file, 32738, wkt)
+    assert vector_hash(shp_file) == h
+
+
+# End
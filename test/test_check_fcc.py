@@ -0,0 +1,105 @@
+"""Testing the check of forest cover change rasters."""
+
+import numpy as np
+import pytest
+from osgeo import gdal, osr
+
+from forestatrisk.data.check_fcc import (
+    block_values, stats_values, check_fcc)
+from forestatrisk.misc import BlockReader
+
+
+def make_fcc(fcc_file, data, nodata=None):
+    """Forest cover change raster with one band per date."""
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(32738)
+    nbands, nrow, ncol = data.shape
+    ds = gdal.GetDriverByName("GTiff").Create(
+        fcc_file, ncol, nrow, nbands, gdal.GDT_Byte)
+    ds.SetGeoTransform((0, 30, 0, 30 * nrow, 0, -30))
+    ds.SetProjection(srs.ExportToWkt())
+    for i in range(nbands):
+        band = ds.GetRasterBand(i + 1)
+        if nodata is not None:
+            band.SetNoDataValue(nodata)
+        band.WriteArray(data[i])
+    band = None
+    del ds
+
+
+def test_block_values():
+    """Test distinct values against numpy unique."""
+    rng = np.random.default_rng(1234)
+    for dtype in (np.uint8, np.int16, np.float32):
+        data = rng.integers(0, 5, size=(20, 30)).astype(dtype)
+        data[0, 0] = 255 if dtype == np.uint8 else -3
+        values = block_values(data)
+        assert np.array_equal(values, np.unique(data))
+        assert values.dtype.kind == ("i" if dtype == np.uint8
+                                     else np.dtype(dtype).kind)
+
+
+def test_stats_values(tmp_path):
+    """Test cached statistics are only used when exact."""
+    data = np.zeros((3, 20, 30), dtype=np.uint8)
+    data[:, :10] = 1
+    fcc_file = str(tmp_path / "fcc.tif")
+    make_fcc(fcc_file, data)
+    with gdal.Open(fcc_file, gdal.GA_Update) as ds:
+        band = ds.GetRasterBand(1)
+        # No statistics
+        assert stats_values(band) is None
+        # Approximate statistics
+        band.SetMetadataItem("STATISTICS_MINIMUM", "0")
+        band.SetMetadataItem("STATISTICS_MAXIMUM", "1")
+        band.SetMetadataItem("STATISTICS_APPROXIMATE", "YES")
+        assert stats_values(band) is None
+        # Exact statistics
+        band.SetMetadataItem("STATISTICS_APPROXIMATE", "NO")
+        assert stats_values(band) == (0.0, 1.0)
+        # Statistics without nodata pixels
+        band.SetNoDataValue(255)
+        assert stats_values(band) is None
+
+
+def test_check_fcc(tmp_path, monkeypatch):
+    """Test valid values, invalid values, and early exit."""
+    data = np.zeros((3, 200, 30), dtype=np.uint8)
+    data[:, 50:] = 1
+    fcc_file = str(tmp_path / "fcc.tif")
+    make_fcc(fcc_file, data)
+    check_fcc(fcc_file, "EPSG:32738", blk_rows=1, verbose=False)
+    with pytest.raises(ValueError):
+        check_fcc(fcc_file, "EPSG:4326", blk_rows=1, verbose=False)
+    # Invalid value in the third block of the second band
+    data[1, 2, 5] = 3
+    make_fcc(fcc_file, data)
+    nread = []
+    read = BlockReader.read
+
+    def count_read(self, *args):
+        nread.append(args)
+        return read(self, *args)
+
+    monkeypatch.setattr(BlockReader, "read", count_read)
+    for n_jobs in (1, 2):
+        nread.clear()
+        with pytest.raises(ValueError, match="Invalid values found: 3."):
+            check_fcc(fcc_file, "EPSG:32738", blk_rows=1,
+                      verbose=False, n_jobs=n_jobs)
+        # Only blocks up to the invalid block (plus blocks read ahead
+        # by the threads) are read
+        assert len(nread) <= 3 * (3 + 2 * n_jobs)
+    # Invalid values from exact cached statistics (no block is read)
+    with gdal.Open(fcc_file, gdal.GA_Update) as ds:
+        for i in range(3):
+            band = ds.GetRasterBand(i + 1)
+            band.SetMetadataItem("STATISTICS_MINIMUM", "0")
+            band.SetMetadataItem("STATISTICS_MAXIMUM", "3" if i else "1")
+    nread.clear()
+    with pytest.raises(ValueError, match="max=3"):
+        check_fcc(fcc_file, "EPSG:32738", blk_rows=1, verbose=False)
+    assert not nread
+
+
+# End
@@ -0,0 +1,84 @@
+"""Testing forest data processed as a cached task."""
+
+import os
+
+import numpy as np
+from osgeo import gdal, ogr, osr
+
+from forestatrisk.data.compute import compute_forest
+from forestatrisk.data.pipeline import run_tasks
+
+opj = os.path.join
+
+
+def write_tile(tile_file, data):
+    """Forest tile in lat/long with one band per date."""
+    nbands, nrow, ncol = data.shape
+    ds = gdal.GetDriverByName("GTiff").Create(
+        tile_file, ncol, nrow, nbands, gdal.GDT_Byte)
+    ds.SetGeoTransform((0, 0.0003, 0, 0.012, 0, -0.0003))
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+    ds.SetProjection(srs.ExportToWkt())
+    for i in range(nbands):
+        ds.GetRasterBand(i + 1).WriteArray(data[i])
+    del ds
+
+
+def write_aoi(aoi_file):
+    """Area of interest in the projection of the project."""
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(3857)
+    vect_ds = ogr.GetDriverByName("GPKG").CreateDataSource(aoi_file)
+    lay = vect_ds.CreateLayer("aoi", srs, ogr.wkbPolygon)
+    feat = ogr.Feature(lay.GetLayerDefn())
+    feat.SetGeometry(ogr.CreateGeometryFromWkt(
+        "POLYGON ((0 0, 900 0, 900 900, 0 900, 0 0))"))
+    lay.CreateFeature(feat)
+    feat = None
+    lay = None
+    del vect_ds
+
+
+def test_compute_forest_task(tmp_path):
+    """Test forest rasters are computed again when the tiles change."""
+    work_dir = str(tmp_path)
+    os.mkdir(opj(work_dir, "forest_tiles"))
+    tile_file = opj(work_dir, "forest_tiles", "forest_0.tif")
+    data = np.ones((3, 40, 40), dtype=np.uint8)
+    write_tile(tile_file, data)
+    write_aoi(opj(work_dir, "aoi_proj.gpkg"))
+    outputs = [opj(work_dir, f) for f in
+               ("forest_src.tif", "forest_t3.tif", "dist_edge_t3.tif")]
+    tasks = [{"name": "forest", "fun": compute_forest,
+              "kwargs": {"proj": "EPSG:3857", "extent": (0, 0, 900, 900),
+                         "work_dir": work_dir},
+              "inputs": [tile_file], "outputs": outputs}]
+    manifest = opj(work_dir, "manifest.json")
+    run_tasks(tasks, manifest=manifest)
+    with gdal.Open(outputs[1]) as ds:
+        assert np.all(ds.ReadAsArray() == 1)
+    # Up to date
+    mtime = os.stat(outputs[0]).st_mtime_ns
+    run_tasks(tasks, manifest=manifest)
+    assert os.stat(outputs[0]).st_mtime_ns == mtime
+    # Deforestation in the tile: forest_src.tif is computed again
+    # (and not taken from the previous run)
+    data[2, :, :20] = 0
+    write_tile(tile_file, data)
+    run_tasks(tasks, manifest=manifest)
+    assert os.stat(outputs[0]).st_mtime_ns != mtime
+    with gdal.Open(outputs[0]) as ds:
+        forest_src = ds.ReadAsArray()
+    with gdal.Open(outputs[1]) as ds:
+        forest_t3 = ds.ReadAsArray()
+    assert np.any(forest_src[2] == 0) and np.any(forest_src[2] == 1)
+    assert np.array_equal(forest_t3, forest_src[2])
+    # User's forest_src.tif without tiles
+    os.remove(tile_file)
+    compute_forest("EPSG:3857", (0, 0, 900, 900), work_dir=work_dir)
+    with gdal.Open(outputs[1]) as ds:
+        assert np.array_equal(ds.ReadAsArray(), forest_t3)
+
+
+# End
@@ -0,0 +1,82 @@
+"""Testing value range check in crosstab."""
+
+import numpy as np
+import pytest
+from osgeo import gdal
+
+from forestatrisk.validate import map_validation
+from forestatrisk.validate.crosstab import check_values, crosstab
+from forestatrisk.validate.diffproj import diffproj_lut
+
+
+def make_raster(raster_file, data, dtype):
+    """Raster with one band."""
+    nrow, ncol = data.shape
+    ds = gdal.GetDriverByName("GTiff").Create(
+        raster_file, ncol, nrow, 1, dtype)
+    ds.SetGeoTransform((0, 30, 0, 30 * nrow, 0, -30))
+    ds.GetRasterBand(1).WriteArray(data)
+    del ds
+
+
+def test_check_values():
+    """Test values >= nvalues are rejected instead of aliased."""
+    data = np.array([[0, 1], [254, 255]])
+    check_values(data, 256, "obs.tif")
+    with pytest.raises(ValueError):
+        check_values(data + 1, 256, "obs.tif")
+    with pytest.raises(ValueError):
+        check_values(data - 1, 256, "obs.tif")
+
+
+def test_map_validation_invalid(tmp_path):
+    """Test values out of range are ignored in map validation."""
+    rng = np.random.default_rng(1234)
+    obs = rng.integers(0, 2, size=(30, 40))
+    pred = rng.integers(0, 2, size=(30, 40))
+    # Nodata and values out of [0, 255]
+    obs[rng.random((30, 40)) < 0.1] = 255
+    obs[rng.random((30, 40)) < 0.1] = -1
+    pred[rng.random((30, 40)) < 0.1] = 300
+    obs_file = str(tmp_path / "obs.tif")
+    pred_file = str(tmp_path / "pred.tif")
+    make_raster(obs_file, obs, gdal.GDT_Int16)
+    make_raster(pred_file, pred, gdal.GDT_Int16)
+    with pytest.raises(ValueError):
+        crosstab(obs_file, pred_file, blk_rows=7, verbose=False)
+    mat = crosstab(obs_file, pred_file, mask_invalid=True, blk_rows=7,
+                   n_jobs=2, verbose=False)
+    valid = (obs >= 0) & (obs < 256) & (pred < 256)
+    expected = np.zeros((256, 256), dtype=np.int64)
+    np.add.at(expected, (pred[valid], obs[valid]), 1)
+    assert np.array_equal(mat, expected)
+    # Only pixels with values 0 or 1 in both rasters are used
+    res = map_validation(pred_file, obs_file, blk_rows=7)
+    valid = np.isin(obs, [0, 1]) & np.isin(pred, [0, 1])
+    n11 = np.sum(valid & (pred == 0) & (obs == 0))
+    n00 = np.sum(valid & (pred == 1) & (obs == 1))
+    assert res["OA"] == round((n11 + n00) / np.sum(valid), 2)
+
+
+def test_crosstab_statistics(tmp_path):
+    """Test statistics of output rasters from the cross-tabulation."""
+    rng = np.random.default_rng(1234)
+    obs = rng.choice([0, 1, 255], size=(30, 40), p=[0.3, 0.6, 0.1])
+    pred = rng.choice([0, 1, 255], size=(30, 40), p=[0.3, 0.6, 0.1])
+    obs_file = str(tmp_path / "obs.tif")
+    pred_file = str(tmp_path / "pred.tif")
+    make_raster(obs_file, obs, gdal.GDT_Byte)
+    make_raster(pred_file, pred, gdal.GDT_Byte)
+    diff_file = str(tmp_path / "diff.tif")
+    crosstab(obs_file, pred_file, diff_lut=diffproj_lut(),
+             output_files=diff_file, blk_rows=7, verbose=False)
+    with gdal.Open(diff_file) as ds:
+        band = ds.GetRasterBand(1)
+        diff = band.ReadAsArray()
+        stats = band.GetStatistics(False, False)
+    values = diff[diff != 255].astype(np.float64)
+    assert np.allclose(stats, (values.min(), values.max(), values.mean(),
+                               values.std()))
+
+
+# End
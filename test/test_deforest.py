@@ -0,0 +1,142 @@
+"""Testing threshold identification in deforest."""
+
+import numpy as np
+import pytest
+from osgeo import gdal
+
+from forestatrisk.project import deforest, deforest_timeseries
+from forestatrisk.project.deforest import (
+    find_threshold, pixel_hash, select_in_category, deforestation_error)
+
+
+def loop_threshold(counts, ndefor):
+    """Threshold identified with the previous loop on categories."""
+    nvalues = len(counts)
+    nfp = np.sum(counts)
+    if ndefor >= nfp:
+        return (1, nfp)
+    quant = ndefor / (nfp * 1.0)
+    cS = 0.0
+    cumSum = np.zeros(nvalues + 1, dtype=float)
+    index = None
+    for i in np.arange(nvalues - 1, -1, -1):
+        cS += counts[i] / (nfp * 1.0)
+        cumSum[i] = cS
+        if cS >= quant and index is None:
+            index = i
+    diff_inf = ndefor - cumSum[index + 1] * nfp
+    diff_sup = cumSum[index] * nfp - ndefor
+    if diff_sup >= diff_inf:
+        index = index + 1
+    return (index + 1, np.sum(counts[index:]))
+
+
+def test_find_threshold():
+    """Test vectorized threshold against loop."""
+    rng = np.random.default_rng(1234)
+    counts = rng.integers(0, 50, size=65535)
+    counts[rng.choice(65535, size=30000, replace=False)] = 0
+    nfp = counts.sum()
+    ndefor = np.array([1, 10, 1000, nfp // 3, nfp // 2, nfp - 1,
+                       nfp, nfp + 10])
+    threshold, ndp = find_threshold(counts, ndefor)
+    for (i, n) in enumerate(ndefor):
+        th_loop, ndp_loop = loop_threshold(counts, n)
+        assert threshold[i] == th_loop
+        assert ndp[i] == ndp_loop
+
+
+class ArrayBand:
+    """Minimal raster band reading blocks from a Numpy array."""
+
+    def __init__(self, data):
+        self.data = data
+        self.XSize = data.shape[1]
+
+    def ReadAsArray(self, x, y, nx, ny):
+        """Read a block of data."""
+        return self.data[y:y + ny, x:x + nx]
+
+
+def test_select_in_category():
+    """Test hash cutoff against a full sort of pixel hashes."""
+    rng = np.random.default_rng(1234)
+    data = rng.integers(1, 4, size=(50, 40))
+    band = ArrayBand(data)
+    # Blocks of 7 rows
+    y = np.arange(0, 50, 7)
+    ny = np.diff(np.append(y, 50))
+    blockinfo = (len(y), 1, len(y), np.array([0]), y, np.array([40]), ny)
+    k = 123
+    hcut, nties = select_in_category(band, 2, k, 1234, blockinfo)
+    r, c = np.nonzero(data == 2)
+    h = np.sort(pixel_hash(r, c, 40, 1234))[::-1]
+    assert hcut == h[k - 1]
+    assert np.sum(h > hcut) + nties == k
+
+
+def test_deforestation_error():
+    """Test error is zero when all the forest is deforested."""
+    nfp = 1000
+    ndefor = np.array([100, 1000, 2000])
+    ndp = np.array([101, 1000, 1000])
+    # One pixel is one hectare
+    hectares = ndefor.astype(float)
+    with pytest.warns(UserWarning):
+        error, error_perc = deforestation_error(ndp, ndefor, nfp,
+                                                hectares, 10000)
+    assert np.array_equal(error, [1, 0, 0])
+    assert np.array_equal(error_perc, [1.0, 0.0, 0.0])
+
+
+def test_deforest_timeseries(tmp_path):
+    """Test year of deforestation against one deforest() per year."""
+    rng = np.random.default_rng(1234)
+    prob = rng.integers(1, 65536, size=(40, 50)).astype(np.uint16)
+    prob[rng.random((40, 50)) < 0.2] = 0
+    prob_file = str(tmp_path / "prob.tif")
+    ds = gdal.GetDriverByName("GTiff").Create(
+        prob_file, 50, 40, 1, gdal.GDT_UInt16)
+    ds.SetGeoTransform((0, 30, 0, 1200, 0, -30))
+    band = ds.GetRasterBand(1)
+    band.SetNoDataValue(0)
+    band.WriteArray(prob)
+    band = None
+    del ds
+    hectares = [5, 10, 20]
+    # Years from 1 (Byte) and calendar years (UInt16)
+    for (hectares_by_year, dtype, forest_value) in (
+            (hectares, gdal.GDT_Byte, 255),
+            (dict(zip([2021, 2022, 2023], hectares)),
+             gdal.GDT_UInt16, 65535)):
+        year_file = str(tmp_path / "defor_year.tif")
+        stats = deforest_timeseries(prob_file, hectares_by_year,
+                                    output_file=year_file, blk_rows=7,
+                                    verbose=False)
+        with gdal.Open(year_file) as ds:
+            band = ds.GetRasterBand(1)
+            assert band.DataType == dtype
+            assert band.GetNoDataValue() == 0
+            year_data = band.ReadAsArray()
+            # Statistics from the histogram
+            vmin, vmax, mean, std = band.GetStatistics(False, False)
+        assert np.all((year_data == 0) == (prob == 0))
+        for (i, yr) in enumerate(stats["years"]):
+            fcc_file = str(tmp_path / f"fcc_{i}.tif")
+            res = deforest(prob_file, hectares[i], output_file=fcc_file,
+                           blk_rows=7)
+            assert stats["threshold"][i] == res["threshold"]
+            assert stats["ndp"][i] == res["ndp"]
+            with gdal.Open(fcc_file) as ds:
+                fcc = ds.ReadAsArray()
+            defor = (year_data != 0) & (year_data <= yr)
+            assert np.array_equal(defor, fcc == 0)
+        # Forest remaining at the end of the last year
+        assert np.array_equal(year_data == forest_value, fcc == 1)
+        values = year_data[year_data != 0].astype(np.float64)
+        assert np.allclose((vmin, vmax, mean, std),
+                           (values.min(), values.max(), values.mean(),
+                            values.std()))
+
+
+# End
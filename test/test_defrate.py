@@ -0,0 +1,69 @@
+"""Testing deforestation rates per category."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from forestatrisk.predict.defrate_per_cat import (
+    defrate_table, fcc_cat_counts, defrate_per_cat)
+
+
+def loop_defrate(blocks, period, time_interval, pixel_area):
+    """Table computed with the previous loop on blocks."""
+    cat = [c + 1 for c in range(65535)]
+    df = pd.DataFrame({"cat": cat, "nfor": 0, "ndefor": 0})
+    for (fcc_data, defor_cat_data) in blocks:
+        if period == "calibration":
+            data_for = defor_cat_data[fcc_data > 0]
+            data_defor = defor_cat_data[fcc_data == 1]
+        elif period == "validation":
+            data_for = defor_cat_data[fcc_data > 1]
+            data_defor = defor_cat_data[fcc_data == 2]
+        else:
+            data_for = defor_cat_data[fcc_data > 0]
+            data_defor = defor_cat_data[np.isin(fcc_data, [1, 2])]
+        cat_for = pd.Categorical(data_for.flatten(), categories=cat)
+        df["nfor"] += cat_for.value_counts().values
+        cat_defor = pd.Categorical(data_defor.flatten(), categories=cat)
+        df["ndefor"] += cat_defor.value_counts().values
+    df["rate_obs"] = 1 - (1 - df["ndefor"] / df["nfor"]) ** (1 / time_interval)
+    df["rate_mod"] = ((df["cat"] - 1) * 999999 / 65534 + 1) * 1e-6
+    sum_ndefor = df["ndefor"].sum()
+    sum_pi = (df["nfor"] * df["rate_mod"]).sum()
+    df["rate_abs"] = df["rate_mod"] * sum_ndefor / sum_pi
+    df["time_interval"] = time_interval
+    df["pixel_area"] = pixel_area
+    df["defor_dens"] = df["rate_abs"] * pixel_area / time_interval
+    return df
+
+
+def test_defrate_table():
+    """Test bincount counting against the loop on blocks."""
+    rng = np.random.default_rng(1234)
+    # fcc values 0 (nodata) to 3, categories 1 to 65535
+    blocks = [(rng.integers(0, 4, size=(10, 50)),
+               rng.integers(1, 65536, size=(10, 50)))
+              for _ in range(3)]
+    counts = sum(fcc_cat_counts(*blk) for blk in blocks)
+    counts = counts.reshape(4, 65536)[:, 1:]
+    nfor = {"calibration": counts[1] + counts[2] + counts[3],
+            "validation": counts[2] + counts[3],
+            "historical": counts[1] + counts[2] + counts[3]}
+    ndefor = {"calibration": counts[1],
+              "validation": counts[2],
+              "historical": counts[1] + counts[2]}
+    for p in ["calibration", "validation", "historical"]:
+        df = defrate_table(nfor[p], ndefor[p], 10, 0.09)
+        expected = loop_defrate(blocks, p, 10, 0.09)
+        pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+
+
+def test_defrate_per_cat_args():
+    """Test one output file for several periods is rejected."""
+    with pytest.raises(ValueError):
+        defrate_per_cat("fcc.tif", "riskmap.tif", 10,
+                        period=["calibration", "validation"],
+                        tab_file_defrate="defrate_per_cat.csv")
+
+
+# End
@@ -0,0 +1,73 @@
+"""Testing the tiled Euclidean distance transform."""
+
+import numpy as np
+from osgeo import gdal
+from scipy import ndimage
+
+from forestatrisk.data.compute.compute_distance import (
+    column_bounds, exchange_bounds, vertical_distance, envelope_distance,
+    compute_distance)
+
+
+def tiled_edt(target, tile_size, xres, yres):
+    """Distance transform with the two passes of edt_distance()."""
+    nrow, ncol = target.shape
+    g = np.zeros(target.shape)
+    for x in range(0, ncol, tile_size):
+        wins = [(x, y, min(tile_size, ncol - x), min(tile_size, nrow - y))
+                for y in range(0, nrow, tile_size)]
+        bounds = [column_bounds(target[y:y + ny, x:x + nx], y)
+                  for (x, y, nx, ny) in wins]
+        above, below = exchange_bounds(wins, bounds, nrow)
+        for (i, (x, y, nx, ny)) in enumerate(wins):
+            g[y:y + ny, x:x + nx] = vertical_distance(
+                target[y:y + ny, x:x + nx], y, above[i], below[i])
+    return np.sqrt(envelope_distance((g * yres) ** 2, xres))
+
+
+def test_tiled_edt():
+    """Test tiled transform against the exact transform of scipy."""
+    rng = np.random.default_rng(1234)
+    target = rng.random((70, 90)) < 0.002
+    # Tiles without target and targets far from some tiles
+    target[:, 40:] = False
+    target[5, 85] = True
+    dist = tiled_edt(target, 16, 30, 20)
+    expected = ndimage.distance_transform_edt(~target, sampling=(20, 30))
+    assert np.allclose(dist, expected)
+    # No target at all
+    dist = tiled_edt(np.zeros((20, 30), dtype=bool), 16, 30, 30)
+    assert np.all(np.isinf(dist))
+
+
+def test_compute_distance(tmp_path):
+    """Test edt and gdal engines give identical distances."""
+    rng = np.random.default_rng(1234)
+    data = np.ones((100, 120), dtype=np.uint8)
+    data[rng.random((100, 120)) < 0.003] = 0
+    # One tile of 32 x 32 pixels without target and nodata
+    data[32:64, 64:96] = 1
+    data[rng.random((100, 120)) < 0.05] = 255
+    input_file = str(tmp_path / "forest.tif")
+    ds = gdal.GetDriverByName("GTiff").Create(
+        input_file, 120, 100, 1, gdal.GDT_Byte)
+    ds.SetGeoTransform((0, 30, 0, 3000, 0, -30))
+    band = ds.GetRasterBand(1)
+    band.SetNoDataValue(255)
+    band.WriteArray(data)
+    band = None
+    del ds
+    dist = {}
+    for engine in ("gdal", "edt"):
+        dist_file = str(tmp_path / f"dist_{engine}.tif")
+        compute_distance(input_file, dist_file, values=0, nodata=0,
+                         input_nodata=True, verbose=False,
+                         engine=engine, tile_size=32)
+        with gdal.Open(dist_file) as ds:
+            dist[engine] = ds.ReadAsArray()
+            assert ds.GetRasterBand(1).GetNoDataValue() == 0
+    assert np.all(dist["edt"][data == 255] == 0)
+    assert np.array_equal(dist["edt"], dist["gdal"])
+
+
+# End
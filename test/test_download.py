@@ -0,0 +1,196 @@
+"""Testing file download with cache, resume, and checksum."""
+
+import os
+import hashlib
+import importlib
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+from forestatrisk.data.download.download_manager import (
+    cache_file, download_file, download_files)
+
+# Module (the package exports the function with the same name)
+wdpa_module = importlib.import_module(
+    "forestatrisk.data.download.download_wdpa")
+
+
+class RangeHandler(SimpleHTTPRequestHandler):
+    """Static file server with support for range requests."""
+
+    ranges = []
+
+    def send_head(self):
+        rng = self.headers.get("Range")
+        path = self.translate_path(self.path)
+        if rng is None or not os.path.isfile(path):
+            return super().send_head()
+        RangeHandler.ranges.append(rng)
+        start = int(rng.split("=")[1].rstrip("-"))
+        f = open(path, "rb")  # pylint: disable=consider-using-with
+        size = os.fstat(f.fileno()).st_size
+        if start >= size:
+            f.close()
+            self.send_error(416)
+            return None
+        f.seek(start)
+        self.send_response(206)
+        self.send_header("Content-Length", str(size - start))
+        self.send_header("Content-Range", f"bytes {start}-{size - 1}/{size}")
+        self.end_headers()
+        return f
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(name="server")
+def fixture_server(tmp_path):
+    """Local HTTP server with one file."""
+    root = tmp_path / "www"
+    root.mkdir()
+    data = os.urandom(100000)
+    (root / "file.bin").write_bytes(data)
+    httpd = ThreadingHTTPServer(
+        ("127.0.0.1", 0), partial(RangeHandler, directory=str(root)))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    RangeHandler.ranges = []
+    yield (f"http://127.0.0.1:{httpd.server_address[1]}", root, data)
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_cache(server, tmp_path):
+    """Test cached files are used without downloading them again."""
+    base, root, data = server
+    url = base + "/file.bin"
+    cache_dir = str(tmp_path / "cache")
+    sha256 = hashlib.sha256(data).hexdigest()
+    out1 = str(tmp_path / "out1.bin")
+    download_file(url, out1, sha256=sha256, cache_dir=cache_dir)
+    assert Path(out1).read_bytes() == data
+    assert os.path.isfile(cache_file(url, cache_dir) + ".sha256")
+    # Cache hit: the file is no longer on the server
+    os.remove(root / "file.bin")
+    out2 = str(tmp_path / "out2.bin")
+    download_file(url, out2, sha256=sha256, cache_dir=cache_dir)
+    assert Path(out2).read_bytes() == data
+    # Corrupted cached copy is downloaded again
+    (root / "file.bin").write_bytes(data)
+    Path(cache_file(url, cache_dir)).write_bytes(b"corrupted")
+    out3 = str(tmp_path / "out3.bin")
+    download_file(url, out3, cache_dir=cache_dir)
+    assert Path(out3).read_bytes() == data
+    # Concurrent downloads of the same file to the same cache
+    cache_dir = str(tmp_path / "cache2")
+    files = [(url, str(tmp_path / f"conc{i}.bin")) for i in range(8)]
+    download_files(files, n_jobs=8, cache_dir=cache_dir)
+    assert all(Path(f).read_bytes() == data for (_, f) in files)
+    assert not os.path.isfile(cache_file(url, cache_dir) + ".part")
+
+
+def test_resume(server, tmp_path):
+    """Test partial downloads are resumed with a range request."""
+    base, _, data = server
+    output_file = str(tmp_path / "out.bin")
+    Path(output_file + ".part").write_bytes(data[:30000])
+    download_file(base + "/file.bin", output_file)
+    assert Path(output_file).read_bytes() == data
+    assert not os.path.isfile(output_file + ".part")
+    assert RangeHandler.ranges == ["bytes=30000-"]
+    # Complete partial file (range not satisfiable)
+    output_file = str(tmp_path / "out2.bin")
+    Path(output_file + ".part").write_bytes(data)
+    download_file(base + "/file.bin", output_file)
+    assert Path(output_file).read_bytes() == data
+
+
+def test_checksum_mismatch(server, tmp_path):
+    """Test a wrong checksum raises an error and removes the file."""
+    base, _, _ = server
+    url = base + "/file.bin"
+    cache_dir = str(tmp_path / "cache")
+    output_file = str(tmp_path / "out.bin")
+    with pytest.raises(ValueError):
+        download_file(url, output_file, sha256="0" * 64,
+                      cache_dir=cache_dir)
+    assert not os.path.isfile(output_file)
+    assert not os.path.isfile(cache_file(url, cache_dir))
+
+
+def test_missing_files(server, tmp_path):
+    """Test missing files on the server, the mirror, or offline."""
+    base, root, data = server
+    mirror = tmp_path / "mirror"
+    (mirror / "127.0.0.1:1").mkdir(parents=True)
+    (mirror / "127.0.0.1:1" / "file.bin").write_bytes(data)
+    files = [
+        (base + "/missing.bin", str(tmp_path / "missing1.bin")),
+        ((root / "missing.bin").as_uri(), str(tmp_path / "missing2.bin")),
+        (base + "/file.bin", str(tmp_path / "out.bin"))]
+    missing = download_files(files, n_jobs=2, missing_ok=True)
+    assert missing == files[:2]
+    assert os.path.isfile(files[2][1])
+    with pytest.raises(FileNotFoundError):
+        download_files(files[:1])
+    # Mirror (same layout as the cache), server unreachable
+    url = "http://127.0.0.1:1/file.bin"
+    output_file = str(tmp_path / "mirror.bin")
+    download_file(url, output_file, mirror=mirror.as_uri())
+    assert Path(output_file).read_bytes() == data
+    # Not on the mirror and server unreachable
+    with pytest.raises(FileNotFoundError):
+        download_file("http://127.0.0.1:1/missing.bin",
+                      str(tmp_path / "missing3.bin"),
+                      mirror=mirror.as_uri(), timeout=5)
+
+
+def test_download_wdpa(tmp_path, monkeypatch):
+    """Test WDPA cache is only used when complete and valid."""
+    calls = []
+
+    def fake_get_wdpa(iso3):
+        """Write a shapefile in the working directory."""
+        calls.append(iso3)
+        for ext in (".shp", ".shx", ".dbf", ".prj", ".cpg"):
+            Path(f"pa_{iso3}{ext}").write_bytes(ext.encode() * 100)
+
+    monkeypatch.setattr(wdpa_module, "get_wdpa", fake_get_wdpa)
+    cache_dir = tmp_path / "cache"
+    cache_wdpa = cache_dir / "wdpa"
+
+    def download(name, **kwargs):
+        """Download in a new output directory."""
+        out_dir = tmp_path / name
+        wdpa_module.download_wdpa("MTQ", output_dir=str(out_dir), **kwargs)
+        return out_dir
+
+    out_dir = download("out1", cache_dir=str(cache_dir))
+    assert len(calls) == 1
+    assert (cache_wdpa / "pa_MTQ.dbf.sha256").is_file()
+    # Cache hit
+    out_dir = download("out2", cache_dir=str(cache_dir))
+    assert len(calls) == 1
+    assert (out_dir / "pa_MTQ.dbf").read_bytes() == b".dbf" * 100
+    assert not (out_dir / "pa_MTQ.dbf.sha256").exists()
+    # Partially copied file, or missing file in the cache
+    (cache_wdpa / "pa_MTQ.dbf").write_bytes(b".dbf")
+    download("out3", cache_dir=str(cache_dir))
+    assert len(calls) == 2
+    os.remove(cache_wdpa / "pa_MTQ.prj")
+    download("out4", cache_dir=str(cache_dir))
+    assert len(calls) == 3
+    # Mirror with the layout of the cache
+    out_dir = download("out5", mirror=cache_dir.as_uri())
+    assert len(calls) == 3
+    assert (out_dir / "pa_MTQ.cpg").read_bytes() == b".cpg" * 100
+    # Not on the mirror
+    download("out6", mirror=(tmp_path / "missing").as_uri())
+    assert len(calls) == 4
+
+
+# End
@@ -0,0 +1,114 @@
+"""Testing carbon emissions from deforestation."""
+
+import numpy as np
+from osgeo import gdal
+
+from forestatrisk.project import emissions, emissions_mc, emissions_zonal
+
+
+def make_raster(raster_file, data, dtype, nodata=None):
+    """Raster with one band on a grid of 30 m pixels."""
+    nrow, ncol = data.shape
+    ds = gdal.GetDriverByName("GTiff").Create(
+        raster_file, ncol, nrow, 1, dtype)
+    ds.SetGeoTransform((0, 30, 0, 30 * nrow, 0, -30))
+    band = ds.GetRasterBand(1)
+    if nodata is not None:
+        band.SetNoDataValue(nodata)
+    band.WriteArray(data)
+    band = None
+    del ds
+
+
+def test_emissions_zonal(tmp_path):
+    """Test sums by zone and year against a loop on pixels."""
+    rng = np.random.default_rng(1234)
+    shape = (23, 17)
+    # Years of deforestation (0: nodata, 255: forest remaining)
+    year = rng.integers(1, 6, size=shape)
+    year[rng.random(shape) < 0.1] = 0
+    year[rng.random(shape) < 0.1] = 255
+    # Stocks with negative values (set to zero)
+    stocks = rng.normal(100, 50, size=shape).astype(np.float32)
+    # Zones with values <= 0 and nodata (99)
+    zones = rng.integers(-1, 4, size=shape)
+    zones[rng.random(shape) < 0.1] = 99
+    files = {"year": str(tmp_path / "year.tif"),
+             "stocks": str(tmp_path / "stocks.tif"),
+             "zones": str(tmp_path / "zones.tif")}
+    make_raster(files["year"], year, gdal.GDT_Byte, 0)
+    make_raster(files["stocks"], stocks, gdal.GDT_Float32)
+    make_raster(files["zones"], zones, gdal.GDT_Int16, 99)
+    # Explicit loop on pixels
+    area = 30 * 30 / 10000
+    expected = {}
+    for (y, s, z) in zip(year.ravel(), stocks.ravel(), zones.ravel()):
+        if y in (0, 255) or z <= 0 or z == 99:
+            continue
+        key = (z, y)
+        expected[key] = expected.get(key, 0.0) + max(s, 0) * 0.47 * area
+    for n_jobs in (1, 3):
+        df = emissions_zonal(files["stocks"], files["year"],
+                             files["zones"], blk_rows=4, n_jobs=n_jobs,
+                             verbose=False)
+        assert list(df.index) == [1, 2, 3]
+        assert list(df.columns) == [1, 2, 3, 4, 5]
+        for z in df.index:
+            for y in df.columns:
+                assert np.isclose(df.loc[z, y], expected.get((z, y), 0.0))
+    # Without zones: all pixels in zone 0
+    df = emissions_zonal(files["stocks"], files["year"], blk_rows=4,
+                         n_jobs=2, verbose=False)
+    assert list(df.index) == [0]
+    w = (year != 0) & (year != 255)
+    for y in df.columns:
+        assert np.isclose(df.loc[0, y], np.sum(
+            np.maximum(stocks, 0)[w & (year == y)]) * 0.47 * area)
+
+
+def test_emissions_mc(tmp_path):
+    """Test uncertainty against a Monte Carlo simulation by pixel."""
+    rng = np.random.default_rng(1234)
+    shape = (10, 12)
+    forest = rng.integers(0, 2, size=shape)
+    stocks = rng.uniform(50, 150, size=shape).astype(np.float32)
+    stocks_sd = rng.uniform(5, 30, size=shape).astype(np.float32)
+    files = {"forest": str(tmp_path / "forest.tif"),
+             "stocks": str(tmp_path / "stocks.tif"),
+             "stocks_sd": str(tmp_path / "stocks_sd.tif")}
+    make_raster(files["forest"], forest, gdal.GDT_Byte)
+    make_raster(files["stocks"], stocks, gdal.GDT_Float32)
+    make_raster(files["stocks_sd"], stocks_sd, gdal.GDT_Float32)
+    nsim = 20000
+    res = emissions_mc(files["stocks"], files["forest"],
+                       input_stocks_sd=files["stocks_sd"],
+                       stocks_rel_sd=0.05, coefficient_sd=0.02,
+                       nsim=nsim, blk_rows=3, n_jobs=2, verbose=False)
+    # Point estimate
+    assert (int(np.rint(res["emissions"]))
+            == emissions(files["stocks"], files["forest"], blk_rows=3))
+    assert res["samples"].shape == (nsim,)
+    # Realizations drawn for each deforested pixel
+    w = forest == 0
+    mu = stocks[w].astype(np.float64)
+    sd = stocks_sd[w].astype(np.float64)
+    sim_rng = np.random.default_rng(5678)
+    pix = mu + sd * sim_rng.standard_normal((nsim, mu.size))
+    total = pix.sum(axis=1) * (1 + 0.05 * sim_rng.standard_normal(nsim))
+    coef = 0.47 + 0.02 * sim_rng.standard_normal(nsim)
+    brute = total * coef * 30 * 30 / 10000
+    brute_sd = np.std(brute, ddof=1)
+    assert np.isclose(res["mean"], np.mean(brute), atol=0.05 * brute_sd)
+    assert np.isclose(res["sd"], brute_sd, rtol=0.05)
+    assert np.isclose(res["ci_lower"], np.quantile(brute, 0.025),
+                      atol=0.1 * brute_sd)
+    assert np.isclose(res["ci_upper"], np.quantile(brute, 0.975),
+                      atol=0.1 * brute_sd)
+    # No uncertainty
+    res = emissions_mc(files["stocks"], files["forest"], nsim=10,
+                       verbose=False)
+    assert np.allclose(res["samples"], res["emissions"])
+    assert np.isclose(res["sd"], 0)
+
+
+# End
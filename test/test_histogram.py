@@ -0,0 +1,76 @@
+"""Testing histograms of probabilities."""
+
+import numpy as np
+
+from forestatrisk.misc import hist_block, zonal_hist_block
+from forestatrisk.misc.reclassify import lut_statistics
+
+
+class StatBand:
+    """Band recording statistics and histogram."""
+
+    def __init__(self):
+        self.stats = None
+        self.hist = None
+
+    def SetStatistics(self, vmin, vmax, mean, std):
+        """Record statistics."""
+        self.stats = (vmin, vmax, mean, std)
+
+    def SetDefaultHistogram(self, hmin, hmax, counts):
+        """Record histogram."""
+        self.hist = counts
+
+
+def test_zonal_hist_block():
+    """Test zonal counts against a loop on pixels."""
+    rng = np.random.default_rng(1234)
+    zone_counts = None
+    expected = {}
+    # Blocks with new zone identifiers (sparse and large), negative
+    # values, and nodata (255)
+    for ids in ([0, 1, 2], [2, 5, 50123], [3, 1, 70000]):
+        data = rng.integers(0, 65536, size=(20, 30))
+        zones = rng.choice(ids + [-1, 255], size=(20, 30))
+        zone_counts = zonal_hist_block(zone_counts, data, zones, 255)
+        for (z, v) in zip(zones.ravel(), data.ravel()):
+            if 0 <= z != 255:
+                expected.setdefault(z, np.zeros(65536, dtype=np.int64))
+                expected[z][v] += 1
+    zone_ids, counts = zone_counts
+    assert zone_ids.tolist() == [0, 1, 2, 3, 5, 50123, 70000]
+    assert counts.shape == (7, 65536)
+    for (i, z) in enumerate(zone_ids):
+        assert np.array_equal(counts[i], expected[z])
+    assert np.array_equal(hist_block(data), np.bincount(
+        data.ravel(), minlength=65536))
+
+
+def test_lut_statistics():
+    """Test statistics from categories against reclassified data."""
+    rng = np.random.default_rng(1234)
+    data = rng.integers(0, 10, size=(20, 30))
+    cat_counts = np.bincount(data.ravel(), minlength=10)
+    # Float output with nodata
+    lut = rng.random(10).astype(np.float32)
+    lut[3] = -9999.0
+    band = StatBand()
+    lut_statistics(band, lut, cat_counts, nodata=-9999.0)
+    out = np.take(lut, data)
+    out = out[out != -9999.0].astype(np.float64)
+    assert np.allclose(band.stats, (out.min(), out.max(),
+                                    out.mean(), out.std()))
+    # Integer output with 0 as nodata: histogram is saved
+    lut = rng.integers(0, 65536, size=10).astype(np.uint16)
+    lut[0] = 0
+    band = StatBand()
+    lut_statistics(band, lut, cat_counts, nodata=0)
+    out = np.take(lut, data)
+    assert np.array_equal(band.hist, np.bincount(
+        out.ravel(), minlength=65536)[1:])
+    out = out[out != 0].astype(np.float64)
+    assert np.allclose(band.stats, (out.min(), out.max(),
+                                    out.mean(), out.std()))
+
+
+# End
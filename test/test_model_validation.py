@@ -0,0 +1,52 @@
+"""Testing model cross-validation."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from forestatrisk.validate.model_validation import (
+    cv_design_matrices, cross_validation)
+
+
+def make_data(nobs=400, ncell=20):
+    """Dataset with one covariate and spatial cells."""
+    rng = np.random.default_rng(1234)
+    x = rng.normal(100, 10, size=nobs)
+    p = 1 / (1 + np.exp(-(x - 100) / 5))
+    return pd.DataFrame({
+        "fcc23": (rng.random(nobs) > p).astype(int),
+        "altitude": x,
+        "cell": rng.integers(0, ncell, size=nobs)})
+
+
+def test_cv_design_matrices():
+    """Test test data is scaled with the training data statistics."""
+    data = make_data()
+    data_train, data_test = data.iloc[:300], data.iloc[300:]
+    formula = "I(1 - fcc23) ~ scale(altitude) + cell"
+    d_train, d_test, X_train, Y_train, X_test = cv_design_matrices(
+        formula, data_train, data_test)
+    assert d_train.shape[0] == 300 and d_test.shape[0] == 100
+    assert np.array_equal(Y_train, 1 - d_train["fcc23"])
+    # Mean and sd of the training data
+    mean = d_train["altitude"].mean()
+    sd = d_train["altitude"].std(ddof=0)
+    assert np.allclose(X_train[:, 1], (d_train["altitude"] - mean) / sd)
+    assert np.allclose(X_test[:, 1], (d_test["altitude"] - mean) / sd)
+
+
+def test_cross_validation_block():
+    """Test block folds without training data are rejected."""
+    data = make_data(ncell=1)
+    with pytest.raises(ValueError):
+        cross_validation(data, "I(1 - fcc23) ~ altitude + cell",
+                         mod_type="glm", ratio=30, nrep=2,
+                         fold="block")
+    data = make_data()
+    cv_df = cross_validation(data, "I(1 - fcc23) ~ scale(altitude) + cell",
+                             mod_type="glm", ratio=30, nrep=2,
+                             fold="block")
+    assert list(cv_df.columns) == ["index", "rep1", "rep2", "mean"]
+
+
+# End
@@ -0,0 +1,87 @@
+"""Testing data processing tasks run as a dependency graph."""
+
+import os
+
+import pytest
+
+from forestatrisk.data.pipeline import task_graph, run_tasks
+
+
+def concat(inputs, output, text):
+    """Concatenate input files and a text in an output file."""
+    content = ""
+    for ifile in inputs:
+        with open(ifile, encoding="utf-8") as f:
+            content += f.read()
+    with open(output, "w", encoding="utf-8") as f:
+        f.write(content + text)
+    return text
+
+
+def make_tasks(d):
+    """Tasks a -> b -> d and a -> c -> d (listed in reverse order)."""
+    src = os.path.join(d, "src.txt")
+    a, b, c, e = (os.path.join(d, f"{n}.txt") for n in "abce")
+
+    def task(name, inputs, output):
+        return {"name": name, "fun": concat,
+                "kwargs": {"inputs": inputs, "output": output,
+                           "text": name},
+                "inputs": inputs, "outputs": [output]}
+
+    return [task("d", [b, c], e), task("c", [a], c), task("b", [a], b),
+            task("a", [src], a)]
+
+
+def test_task_graph(tmp_path):
+    """Test dependencies, ordering, and cycle detection."""
+    d = str(tmp_path)
+    tasks = make_tasks(d)
+    assert task_graph(tasks) == {"a": set(), "b": {"a"}, "c": {"a"},
+                                 "d": {"b", "c"}}
+    with open(os.path.join(d, "src.txt"), "w", encoding="utf-8") as f:
+        f.write("src")
+    results = run_tasks(tasks)
+    # Tasks are run after the tasks they depend on
+    with open(os.path.join(d, "e.txt"), encoding="utf-8") as f:
+        assert f.read() == "srcabsrcacd"
+    assert results == {"a": "a", "b": "b", "c": "c", "d": "d"}
+    # Circular dependencies
+    tasks[3]["inputs"] = [os.path.join(d, "e.txt")]
+    with pytest.raises(ValueError):
+        run_tasks(tasks)
+
+
+def test_run_tasks_manifest(tmp_path):
+    """Test unchanged tasks are skipped and changed tasks are rerun."""
+    d = str(tmp_path)
+    tasks = make_tasks(d)
+    src = os.path.join(d, "src.txt")
+    manifest = os.path.join(d, "manifest.json")
+    with open(src, "w", encoding="utf-8") as f:
+        f.write("src")
+    results = run_tasks(tasks, manifest=manifest)
+    assert all(r is not None for r in results.values())
+    # Nothing has changed: all tasks are skipped
+    results = run_tasks(tasks, manifest=manifest)
+    assert all(r is None for r in results.values())
+    # Modified output: only the task producing it is rerun
+    with open(os.path.join(d, "b.txt"), "w", encoding="utf-8") as f:
+        f.write("modified")
+    results = run_tasks(tasks, manifest=manifest)
+    assert results == {"a": None, "b": "b", "c": None, "d": None}
+    # Modified source file: all tasks are rerun
+    with open(src, "w", encoding="utf-8") as f:
+        f.write("new source")
+    results = run_tasks(tasks, manifest=manifest)
+    assert results == {"a": "a", "b": "b", "c": "c", "d": "d"}
+    with open(os.path.join(d, "e.txt"), encoding="utf-8") as f:
+        assert f.read() == "new sourceabnew sourceacd"
+    # Modified parameter: task and tasks depending on its output
+    # (if the output changes) are rerun
+    tasks[1]["kwargs"]["text"] = "C"
+    results = run_tasks(tasks, manifest=manifest)
+    assert results == {"a": None, "b": None, "c": "C", "d": "d"}
+
+
+# End
@@ -0,0 +1,40 @@
+"""Testing predictors used in predict_raster."""
+
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+
+from forestatrisk.predict.predictor import (
+    get_model_type, predict_glm, predict_rf, get_predictor)
+
+
+def toy_data():
+    """Toy data set with two classes."""
+    rng = np.random.default_rng(1234)
+    X = rng.normal(size=(500, 3))
+    y = (X[:, 0] + 0.5 * X[:, 1] + rng.normal(size=500) > 0).astype(int)
+    return (X, y)
+
+
+def test_predict_glm():
+    """Test closed-form predictions against predict_proba."""
+    X, y = toy_data()
+    model = LogisticRegression().fit(X, y)
+    assert get_model_type(model) == "glm"
+    assert np.allclose(predict_glm(model, X), model.predict_proba(X)[:, 1])
+
+
+def test_predict_rf():
+    """Test chunked tree predictions against predict_proba."""
+    X, y = toy_data()
+    model = RandomForestClassifier(n_estimators=7, max_depth=4,
+                                   random_state=1234).fit(X, y)
+    assert get_model_type(model) == "rf"
+    pred = predict_rf(model, X, n_jobs=3, chunk_size=77)
+    assert np.allclose(pred, model.predict_proba(X)[:, 1])
+    assert get_model_type(object()) == "other"
+    pred = get_predictor(model, chunk_size=100)(X)
+    assert np.allclose(pred, model.predict_proba(X)[:, 1])
+
+
+# End
@@ -0,0 +1,55 @@
+"""Testing raster reclassification with a lookup table."""
+
+import numpy as np
+from osgeo import gdal
+
+from forestatrisk.misc import reclassify
+
+
+def test_reclassify(tmp_path):
+    """Test output raster and statistics against np.take."""
+    rng = np.random.default_rng(1234)
+    data = rng.integers(0, 20, size=(45, 37)).astype(np.uint16)
+    input_file = str(tmp_path / "cat.tif")
+    ds = gdal.GetDriverByName("GTiff").Create(
+        input_file, 37, 45, 1, gdal.GDT_UInt16)
+    ds.SetGeoTransform((0, 30, 0, 1350, 0, -30))
+    ds.GetRasterBand(1).WriteArray(data)
+    del ds
+    # Float32 output with nodata for categories 0 and 5
+    lut = rng.random(20) * 100
+    lut[[0, 5]] = -9999
+    expected = np.take(lut.astype(np.float32), data)
+    out = {}
+    for n_jobs in (1, 3):
+        output_file = str(tmp_path / f"reclass_{n_jobs}.tif")
+        reclassify(input_file, lut, output_file=output_file,
+                   dtype=gdal.GDT_Float32, nodata=-9999, blk_rows=4,
+                   n_jobs=n_jobs, verbose=False)
+        with gdal.Open(output_file) as ds:
+            band = ds.GetRasterBand(1)
+            assert band.DataType == gdal.GDT_Float32
+            assert band.GetNoDataValue() == -9999
+            out[n_jobs] = band.ReadAsArray()
+            stats = band.GetStatistics(False, False)
+        assert np.array_equal(out[n_jobs], expected)
+        values = expected[expected != -9999].astype(np.float64)
+        assert np.allclose(stats, (values.min(), values.max(),
+                                   values.mean(), values.std()))
+    # Identical blocks in parallel threads
+    assert np.array_equal(out[1], out[3])
+    # Integer output with 0 as nodata (histogram saved)
+    lut = np.arange(20) * 100
+    output_file = str(tmp_path / "reclass_int.tif")
+    reclassify(input_file, lut, output_file=output_file,
+               dtype=gdal.GDT_UInt16, nodata=0, blk_rows=4, n_jobs=2,
+               verbose=False)
+    with gdal.Open(output_file) as ds:
+        band = ds.GetRasterBand(1)
+        assert np.array_equal(band.ReadAsArray(), data * 100)
+        hist = band.GetDefaultHistogram(force=False)
+    counts = np.bincount((data * 100).ravel(), minlength=65536)
+    assert list(hist[3]) == counts[1:].tolist()
+
+
+# End
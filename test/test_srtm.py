@@ -0,0 +1,44 @@
+"""Testing slope computation with Horn's method."""
+
+import numpy as np
+
+from forestatrisk.data.compute.compute_srtm import horn_slope
+
+
+def loop_slope(z, xres, yres, nodata):
+    """Slope computed pixel by pixel as gdaldem (with edges)."""
+    nrow, ncol = z.shape
+    slope = np.zeros((nrow - 2, ncol - 2))
+    for r in range(1, nrow - 1):
+        for c in range(1, ncol - 1):
+            w = z[r - 1:r + 2, c - 1:c + 2].astype(float)
+            w[w == nodata] = z[r, c]
+            dzdx = ((w[0, 2] + 2 * w[1, 2] + w[2, 2])
+                    - (w[0, 0] + 2 * w[1, 0] + w[2, 0])) / (8 * xres)
+            dzdy = ((w[2, 0] + 2 * w[2, 1] + w[2, 2])
+                    - (w[0, 0] + 2 * w[0, 1] + w[0, 2])) / (8 * yres)
+            slope[r - 1, c - 1] = np.degrees(
+                np.arctan(np.sqrt(dzdx ** 2 + dzdy ** 2)))
+    return slope
+
+
+def test_horn_slope():
+    """Test vectorized slope against the loop and a plane."""
+    rng = np.random.default_rng(1234)
+    z = rng.integers(0, 500, size=(30, 40)).astype(np.int16)
+    z[rng.random(z.shape) < 0.05] = -32768
+    slope, valid = horn_slope(z, 90, 90)
+    assert np.allclose(slope, loop_slope(z, 90, 90, -32768))
+    assert np.array_equal(valid, z[1:-1, 1:-1] != -32768)
+    # Strips with a one-pixel halo give the same slope
+    strips = [horn_slope(z[y - 1:y + 11], 90, 90)[0]
+              for y in range(1, 28, 10)]
+    assert np.allclose(np.vstack(strips), slope)
+    # Plane with a slope of 45 degrees along x
+    x = np.arange(20) * 30.0
+    z = np.tile(x, (10, 1))
+    slope, _ = horn_slope(z, 30, 30)
+    assert np.allclose(slope, 45)
+
+
+# End
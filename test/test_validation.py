@@ -0,0 +1,93 @@
+"""Testing aggregation by squares in validation_udef_arp."""
+
+import matplotlib
+import numpy as np
+import pandas as pd
+
+from forestatrisk.validate.validation_udef_arp import (
+    square_sum, coarsen_grid, pred_obs_indices)
+
+matplotlib.use("Agg")
+
+
+def loop_squares(data, csize):
+    """Sums computed with the previous loop on squares."""
+    nrow, ncol = data.shape
+    nsquare_x = int(np.ceil(ncol / csize))
+    nsquare_y = int(np.ceil(nrow / csize))
+    res = np.zeros((nsquare_y, nsquare_x))
+    for s in range(nsquare_x * nsquare_y):
+        px = s % nsquare_x
+        py = s // nsquare_x
+        res[py, px] = np.sum(data[py * csize:(py + 1) * csize,
+                                  px * csize:(px + 1) * csize])
+    return res
+
+
+def strip_squares(data, csize):
+    """Sums computed by full-width strips with square_sum()."""
+    nsquare_x = int(np.ceil(data.shape[1] / csize))
+    return np.array([square_sum(data[y:y + csize], csize, nsquare_x)
+                     for y in range(0, data.shape[0], csize)])
+
+
+def test_square_sum():
+    """Test strips and coarse grids against the loop on squares."""
+    rng = np.random.default_rng(1234)
+    # Incomplete squares on the right and bottom edges
+    fcc_data = rng.integers(0, 4, size=(53, 71))
+    cat_data = rng.integers(0, 10, size=(53, 71))
+    # Predicted deforestation from categories (nan for category 5)
+    cat = np.arange(1, 10)
+    defor_dens = rng.random(9)
+    defor_dens[4] = np.nan
+    lut = np.zeros(65536)
+    lut[cat] = np.nan_to_num(defor_dens)
+    for csize in (10, 20, 30):
+        for data in (fcc_data > 0, fcc_data == 1):
+            assert np.array_equal(strip_squares(data, csize),
+                                  loop_squares(data, csize))
+        assert np.allclose(strip_squares(np.take(lut, cat_data), csize),
+                           loop_squares(np.take(lut, cat_data), csize))
+    # Predicted deforestation with the previous categorical counts
+    block = cat_data[:10, :10]
+    counts = pd.Categorical(block[block > 0], categories=cat)
+    expected = np.nansum(counts.value_counts().values * defor_dens)
+    assert np.isclose(strip_squares(np.take(lut, cat_data), 10)[0, 0],
+                      expected)
+    # Coarse grids from the base grid
+    base = strip_squares(fcc_data > 0, 10)
+    for factor in (2, 3):
+        assert np.array_equal(coarsen_grid(base, factor),
+                              loop_squares(fcc_data > 0, 10 * factor))
+
+
+def test_pred_obs_indices(tmp_path):
+    """Test indices against direct computation."""
+    rng = np.random.default_rng(1234)
+    n = 50
+    df = pd.DataFrame({
+        "cell": range(n),
+        "nfor_obs": rng.integers(0, 100, size=n),
+        "ndefor_obs": rng.integers(0, 10, size=n),
+        "nfor_obs_ha": 0.0,
+        "ndefor_obs_ha": 0.0,
+        "ndefor_pred_ha": rng.random(n)})
+    indices = pred_obs_indices(
+        df, 900, "calibration", "glm", 10, 9.0,
+        str(tmp_path / "pred_obs.csv"), str(tmp_path / "pred_obs.png"),
+        (6.4, 6.4), 100)
+    df = df[df["nfor_obs"] > 0]
+    obs = df["ndefor_obs"] * 900 / 10000
+    nfor = df["nfor_obs"] * 900 / 10000
+    err = df["ndefor_pred_ha"] - obs
+    assert indices["ncell"] == df.shape[0]
+    assert indices["RMSE"] == round(np.sqrt(np.mean(err ** 2)), 2)
+    assert indices["wRMSE"] == round(
+        np.sqrt(np.sum(err ** 2 * nfor / nfor.sum())), 2)
+    assert indices["MedAE"] == round(np.median(np.abs(err)), 2)
+    assert indices["R2"] == round(
+        np.corrcoef(df["ndefor_pred_ha"], obs)[0, 1] ** 2, 2)
+
+
+# End